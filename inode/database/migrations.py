@@ -0,0 +1,123 @@
+import hashlib
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+from database.mongodb import (
+    submittedTransactions,
+    errorTransactions,
+    catchTransactions,
+    tempWithdrawals,
+)
+from reward_logic.fixed_point import UNITS_PER_COIN
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Transaction records used to be one document per wallet with every transaction
+# $push-ed into its "transactions" array, and are now one document per
+# transaction. Entries recorded without a time get LEGACY_TIMESTAMP so they
+# sort after every dated transaction.
+LEGACY_TIMESTAMP = datetime(1970, 1, 1)
+MIGRATION_BATCH = 1000
+
+
+def legacy_object_id(legacy_id, index, timestamp):
+    # The same array entry always gets the same _id, so a migration interrupted
+    # between copying a wallet and deleting its array replaces the copies when
+    # it runs again instead of duplicating them.
+    seconds = int((timestamp - LEGACY_TIMESTAMP).total_seconds())
+    digest = hashlib.sha1(f"{legacy_id}:{index}".encode()).digest()
+    return ObjectId(seconds.to_bytes(4, "big") + digest[:8])
+
+
+def unwind_transactions(collection):
+    migrated = 0
+    for legacy in collection.find({"transactions": {"$exists": True}}):
+        operations = []
+        for index, entry in enumerate(legacy["transactions"]):
+            document = dict(entry) if isinstance(entry, dict) else {"hash": entry}
+            if not isinstance(document.get("timestamp"), datetime):
+                document["timestamp"] = LEGACY_TIMESTAMP
+            document["wallet_address"] = legacy.get("wallet_address")
+            document["_id"] = legacy_object_id(
+                legacy["_id"], index, document["timestamp"]
+            )
+            operations.append(
+                ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+            )
+            if len(operations) == MIGRATION_BATCH:
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        collection.delete_one({"_id": legacy["_id"]})
+        migrated += len(legacy["transactions"])
+    return migrated
+
+
+def migrate_transaction_history():
+    try:
+        migrated = sum(
+            unwind_transactions(collection)
+            for collection in (
+                submittedTransactions,
+                errorTransactions,
+                catchTransactions,
+            )
+        )
+        return True, migrated
+    except PyMongoError as e:
+        logging.error(f"An error occurred in migrate_transaction_history: {e}")
+        return False, 0
+
+
+def float_to_units(collection, field, units_field):
+    # One pipeline update per collection: the float goes through decimal so
+    # 0.1 becomes 10000000 units, and the old field is removed in the same
+    # write. Documents that already have units_field are skipped, so it can
+    # run again safely.
+    result = collection.update_many(
+        {field: {"$exists": True}, units_field: {"$exists": False}},
+        [
+            {
+                "$set": {
+                    units_field: {
+                        "$toLong": {
+                            "$round": [
+                                {
+                                    "$multiply": [
+                                        {"$toDecimal": f"${field}"},
+                                        UNITS_PER_COIN,
+                                    ]
+                                },
+                                0,
+                            ]
+                        }
+                    }
+                }
+            },
+            {"$unset": field},
+        ],
+    )
+    return result.modified_count
+
+
+def migrate_float_amounts():
+    # Balances and queued payouts stored as float coins move to int64 base
+    # units.
+    try:
+        migrated = float_to_units(tempWithdrawals, "new_balance", "amount_units")
+        return True, migrated
+    except PyMongoError as e:
+        logging.error(f"An error occurred in migrate_float_amounts: {e}")
+        return False, 0
+
+
+if __name__ == "__main__":
+    print(migrate_transaction_history())
+    print(migrate_float_amounts())
@@ -45,3 +45,12 @@ catchTransactions = db.catchTransactions
 validatorsList = db.validatorsList
 poolList = db.poolList
 minerPool = db.minerPool
+
+
+try:
+    submittedTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    errorTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    catchTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    print("Transaction history indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating transaction history indexes: {e}")
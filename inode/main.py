@@ -11,12 +11,17 @@ import json
 from api.fastapi import app
 from api.api_client import test_api_connection
 from database.mongodb import test_db_connection
+from database.migrations import (
+    migrate_transaction_history,
+    migrate_float_amounts,
+)
 from utils.layout import base
 from protocol.protocol import iNode_protocol
 from transaction.batch import process_all_transactions
 from reward_logic.process_blocks import process_block_rewards
 from reward_logic.find_validators import update_validators_list, update_validator_info
 from reward_logic.reward import decay_pool_score, decay_validator_score
+from database.archive import archive_collections
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
@@ -58,6 +63,17 @@ def update_validators_periodically():
         print(f"Error in update_validators_periodically: {e}")
 
 
+def archive_periodically():
+    try:
+        while True:
+            success, archived = archive_collections()
+            if success and any(archived.values()):
+                logging.info(f"Archived {sum(archived.values())} documents: {archived}")
+            time.sleep(base["ARCHIVE"]["INTERVAL"])
+    except Exception as e:
+        print(f"Error in archive_periodically: {e}")
+
+
 def decay_scores_periodically():
     try:
         while True:
@@ -77,6 +93,8 @@ def decay_val_scores_periodically():
 
 
 async def main():
+    migrate_transaction_history()
+    migrate_float_amounts()
     start_server = websockets.serve(
         iNode_protocol,
         base["INODE_MAIN_SOCKET"]["IP"],
@@ -90,11 +108,13 @@ async def main():
     )
     scores_thread = threading.Thread(target=decay_scores_periodically, daemon=True)
     val_score_thread = threading.Thread(target=decay_scores_periodically, daemon=True)
+    archive_thread = threading.Thread(target=archive_periodically, daemon=True)
     fastapi_thread.start()
     fetch_val_thread.start()
     balance_thread.start()
     scores_thread.start()
     val_score_thread.start()
+    archive_thread.start()
 
     periodic_task = asyncio.create_task(periodic_process_transactions())
 
@@ -1,6 +1,6 @@
 from decimal import Decimal
 from reward_logic.reward_log import store_in_db
-from reward_logic.percentage import round_up_decimal_new
+from reward_logic.fixed_point import apportion, from_units
 from database.mongodb import validatorsList, minerPool
 from transaction.payment import add_transaction_to_batch
 from utils.layout import base
@@ -23,7 +23,7 @@ def convert_decimal_to_float(data):
 
 
 def pool_emission(amount, block_range, batch_size=1000):
-    amount = Decimal(amount)
+    # amount is in base units.
     pool_updates = {}
 
     try:
@@ -33,7 +33,7 @@ def pool_emission(amount, block_range, batch_size=1000):
 
         # Calculate total score
         for pool_data in cursor:
-            score = Decimal(pool_data.get("score", 0))
+            score = Decimal(str(pool_data.get("score", 0)))
             filtered_pools.append(pool_data)
             total_score += score
 
@@ -45,32 +45,31 @@ def pool_emission(amount, block_range, batch_size=1000):
             logging.info("Total score is zero; no balances updated.")
             return False, "Total score is zero; no balances updated."
 
+        # Split in base units by largest remainder, so the shares add up to the
+        # amount exactly
+        shares = apportion(
+            amount, [pool_data.get("score", 0) for pool_data in filtered_pools]
+        )
+
         # Process pools in batches
         for i in range(0, len(filtered_pools), batch_size):
-            batch = filtered_pools[i : i + batch_size]
-            for all_pool_data in batch:
-                score = Decimal(all_pool_data.get("score", 0))
-                miner_share = (score / total_score) * amount
-                miner_share = round_up_decimal_new(miner_share)
-
+            batch = zip(filtered_pools[i : i + batch_size], shares[i : i + batch_size])
+            for all_pool_data, miner_share in batch:
                 pool_updates[all_pool_data["pool_address"]] = {
-                    "score": float(score),
-                    "amount": float(miner_share),
+                    "score": float(all_pool_data.get("score", 0)),
+                    "amount": float(from_units(miner_share)),
                 }
 
                 try:
                     add_transaction_to_batch(
                         all_pool_data["pool_address"],
-                        float(miner_share),
+                        miner_share,
                         "pool_reward",
                     )
                 except Exception as e:
                     logging.error(f"Error processing pool reward distribution: {e}")
                     return False, f"Error processing pool reward distribution: {e}"
 
-        # Convert all Decimal values to float before storing
-        pool_updates = convert_decimal_to_float(pool_updates)
-
         # Store updates in the DB (external function)
         store_in_db(block_range, pool_updates)
 
@@ -83,7 +82,7 @@ def pool_emission(amount, block_range, batch_size=1000):
 
 
 def validator_emission(amount, batch_size=1000):
-    amount = Decimal(amount)
+    # amount is in base units.
     try:
         cursor = validatorsList.find({"score": 1})
         filtered_validators = []
@@ -96,20 +95,25 @@ def validator_emission(amount, batch_size=1000):
             logging.info("No validators found with a score of 1.")
             return False, "No validators found with a score of 1."
 
+        # Split by percentage in base units. The part of the 100% that no
+        # validator holds is apportioned too and left undistributed.
+        percentages = [
+            Decimal(str(validator_data.get("percentage", 0)))
+            for validator_data in filtered_validators
+        ]
+        unallocated = max(Decimal(0), Decimal(100) - sum(percentages))
+        shares = apportion(amount, percentages + [unallocated])[:-1]
+
         # Process validators in batches
         for i in range(0, len(filtered_validators), batch_size):
-            batch = filtered_validators[i : i + batch_size]
-            for validator_data in batch:
-                percentage = Decimal(validator_data.get("percentage", 0))
-                validator_share = (
-                    percentage / 100
-                ) * amount  # Calculate share by percentage
-                validator_share = round_up_decimal_new(validator_share)
-
+            batch = zip(
+                filtered_validators[i : i + batch_size], shares[i : i + batch_size]
+            )
+            for validator_data, validator_share in batch:
                 try:
                     add_transaction_to_batch(
                         validator_data["wallet_address"],
-                        float(validator_share),
+                        validator_share,
                         "validator_reward",
                     )
                 except Exception as e:
@@ -130,19 +134,14 @@ def validator_emission(amount, batch_size=1000):
 
 
 def iNode_emission(amount):
+    # amount is in base units.
     try:
-        amount = Decimal(amount)
-        iNode_share = round_up_decimal_new(amount)
-        try:
-            add_transaction_to_batch(
-                base["INODE_WALLETS"]["REWARD_ADDRESS"],
-                float(iNode_share),
-                "iNode_reward",
-            )
-            return True, f"iNode reward has been  processed successfully."
-        except Exception as e:
-            logging.error(f"Error processing iNode reward distribution: {e}")
-            return False, f"Error processing iNode reward distribution: {e}"
+        add_transaction_to_batch(
+            base["INODE_WALLETS"]["REWARD_ADDRESS"],
+            amount,
+            "iNode_reward",
+        )
+        return True, f"iNode reward has been  processed successfully."
     except Exception as e:
-        logging.error(f"iNode_emission: An unexpected error occurred: {e}")
-        return False, f"An unexpected error occurred: {e}"
+        logging.error(f"Error processing iNode reward distribution: {e}")
+        return False, f"Error processing iNode reward distribution: {e}"
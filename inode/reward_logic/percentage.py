@@ -1,5 +1,6 @@
 from decimal import Decimal
 from utils.layout import base
+from reward_logic.fixed_point import apportion
 import logging
 
 # Configure logging
@@ -40,8 +41,8 @@ def percentage_match():
         return False
 
 
-def calculate_percentages(total_amount):
-    total_amount = Decimal(total_amount)
+def calculate_percentages(total_units):
+    # Splits a reward in base units; the parts always add up to the total.
 
     fee_key = base["AWARD_SYSTEM"]["FEE"]
     reward_key1 = base["AWARD_SYSTEM"]["POOLS_REWARD"]
@@ -56,13 +57,9 @@ def calculate_percentages(total_amount):
     if total_percentage != Decimal("100"):
         return False
 
-    fee_percentage /= Decimal("100")
-    reward_percentage1 /= Decimal("100")
-    reward_percentage2 /= Decimal("100")
-
-    percentages = {"18%": 0, "41%_1": 0, "41%_2": 0}
-    percentages["18%"] = round_up_decimal_new(total_amount * fee_percentage)
-    percentages["41%_1"] = round_up_decimal_new(total_amount * reward_percentage1)
-    percentages["41%_2"] = round_up_decimal_new(total_amount * reward_percentage2)
+    fee_units, pool_units, validator_units = apportion(
+        total_units, [fee_percentage, reward_percentage1, reward_percentage2]
+    )
+    percentages = {"18%": fee_units, "41%_1": pool_units, "41%_2": validator_units}
 
     return percentages
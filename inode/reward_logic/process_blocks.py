@@ -1,9 +1,11 @@
 from database.mongodb import blockTransactions
+from database.archive import archived_values
 from utils.layout import base
 from pymongo.errors import PyMongoError
 from protocol.set_block import get_last_block_height, set_last_block_height
 from api.api_client import fetch_block
 from reward_logic.percentage import calculate_percentages, percentage_match
+from reward_logic.fixed_point import to_units, format_units
 from reward_logic.emission import pool_emission, validator_emission, iNode_emission
 
 import logging
@@ -14,8 +16,14 @@ logging.basicConfig(
 )
 
 
-def record_block_transactions(hash_value):
+def record_block_transactions(hash_value, archived=False):
+    # archived tells whether the hash was recorded before the archive horizon,
+    # when it is no longer in MongoDB; callers look a block's hashes up at once.
     try:
+        if archived:
+            logging.info(f"Transaction with hash: {hash_value} already exists.")
+            return False
+
         result = blockTransactions.update_one(
             {"hash": hash_value},
             {"$setOnInsert": {"hash": hash_value}},
@@ -91,6 +99,7 @@ def analyze_block_rewards():
             block_id = block["block"]["id"]
             last_block_id = block_id
 
+            relevant = []
             for transaction in block["transactions"]:
                 hash_value = transaction["hash"]
                 transaction_amount = 0  # Initialize transaction amount
@@ -111,17 +120,24 @@ def analyze_block_rewards():
                         and output["type"] == "REGULAR"
                         and output["address"] not in input_addresses
                     ):
-                        transaction_amount += output["amount"]
+                        transaction_amount += to_units(output["amount"])
 
-                # Only proceed if the transaction is relevant and not already recorded
                 if transaction_amount > 0:
-                    if record_block_transactions(hash_value):
-                        # Add the transaction amount only if it's a new transaction
-                        total_amount += transaction_amount
-                    else:
-                        logging.info(
-                            f"Skipping already processed transaction: {hash_value}"
-                        )
+                    relevant.append((hash_value, transaction_amount))
+
+            # Only proceed if the transaction is not already recorded. The
+            # block's hashes are checked against the archive in one lookup.
+            archived = archived_values(
+                "blockTransactions", "hash", [hash_value for hash_value, _ in relevant]
+            )
+            for hash_value, transaction_amount in relevant:
+                if record_block_transactions(hash_value, hash_value in archived):
+                    # Add the transaction amount only if it's a new transaction
+                    total_amount += transaction_amount
+                else:
+                    logging.info(
+                        f"Skipping already processed transaction: {hash_value}"
+                    )
 
         if last_block_id is not None:
             set_last_block_height(last_block_id)
@@ -154,9 +170,9 @@ def process_block_rewards():
             pool_emission(percentages["41%_1"], block_range_str)
             validator_emission(percentages["41%_2"])
             iNode_emission(percentages["18%"])
-            logging.info(f'All pool Reward: {percentages["41%_1"]} ')
-            logging.info(f'All validator Reward: {percentages["41%_2"]} ')
-            logging.info(f'iNode Fees: {percentages["18%"]} ')
+            logging.info(f'All pool Reward: {format_units(percentages["41%_1"])} ')
+            logging.info(f'All validator Reward: {format_units(percentages["41%_2"])} ')
+            logging.info(f'iNode Fees: {format_units(percentages["18%"])} ')
         else:
             logging.info("Skipping rewards for everyone")
     except ValueError as e:
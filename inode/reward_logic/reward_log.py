@@ -6,6 +6,7 @@ import logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
+from database.archive import find_archived
 from database.mongodb import rewardLog
 
 
@@ -23,7 +24,9 @@ def store_in_db(block_height, updates):
         return
 
     try:
-        existing_document = rewardLog.find_one({"block_height": block_height})
+        existing_document = rewardLog.find_one(
+            {"block_height": block_height}
+        ) or find_archived("rewardLog", "block_height", block_height)
         if existing_document:
             logging.info(
                 f"Block height {block_height} already exists. Consider updating it instead of inserting a new one."
@@ -44,7 +47,10 @@ def retrieve_from_db(block_height):
         logging.info("Database collection not initialized.")
         return None
     try:
-        document = rewardLog.find_one({"block_height": block_height})
+        # Block ranges past the archive horizon are read from their segment.
+        document = rewardLog.find_one({"block_height": block_height}) or find_archived(
+            "rewardLog", "block_height", block_height
+        )
 
         if document:
             json_str = json.dumps(document, default=json_util.default, indent=4)
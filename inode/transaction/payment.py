@@ -1,11 +1,12 @@
 import upowpy as upow
 import upowpy.utils as upow_utils
 import logging
-from decimal import Decimal
 from datetime import datetime
 import utils.config as config
 import uuid_utils as uuid
 from utils.layout import base
+from reward_logic.fixed_point import to_units, format_units, apportion
+from bson.int64 import Int64
 
 from database.mongodb import (
     tempWithdrawals,
@@ -25,12 +26,6 @@ utils_instance = upow_utils.Utils()
 utils_instance.set_node_url(base["URLS"]["NODE_URL"])
 
 
-def round_up_decimal_new(decimal: Decimal, round_up_length: str = "0.00000001"):
-    round_up_length = Decimal(round_up_length)
-    decimal = decimal.quantize(round_up_length)
-    return decimal
-
-
 async def sign_and_push_transactions(transactions):
     try:
         for transaction in transactions:
@@ -38,8 +33,11 @@ async def sign_and_push_transactions(transactions):
             wallet_address = transaction.get("wallet_address")
             transaction_type = transaction.get("type")
             id = transaction.get("id")
-            new_balance = transaction.get("new_balance")
-            amounts = "{:.8f}".format(float(new_balance))
+            amount_units = transaction.get("amount_units")
+            if amount_units is None:
+                # Queued before amounts were kept in base units.
+                amount_units = to_units(transaction.get("new_balance"))
+            amounts = format_units(amount_units)
 
             message = ""
             try:
@@ -50,39 +48,29 @@ async def sign_and_push_transactions(transactions):
                     logging.info(
                         f"PUSHED: transaction_hash: {transaction_hash} | type: {transaction_type} | to  {wallet_address} | amount:  {amounts}"
                     )
-                    submittedTransactions.update_one(
-                        {"wallet_address": wallet_address},
+                    submittedTransactions.insert_one(
                         {
-                            "$push": {
-                                "transactions": {
-                                    "id": id,
-                                    "hash": transaction_hash,
-                                    "amount": amounts,
-                                    "timestamp": datetime.utcnow(),
-                                    "transaction_type": transaction_type,
-                                }
-                            }
-                        },
-                        upsert=True,
+                            "wallet_address": wallet_address,
+                            "id": id,
+                            "hash": transaction_hash,
+                            "amount": amounts,
+                            "timestamp": datetime.utcnow(),
+                            "transaction_type": transaction_type,
+                        }
                     )
                     tempWithdrawals.delete_one({"id": id})
                 else:
                     logging.error(
                         f"Transaction failed for wallet address {wallet_address}. No hash was returned."
                     )
-                    errorTransactions.update_one(
-                        {"wallet_address": wallet_address},
+                    errorTransactions.insert_one(
                         {
-                            "$push": {
-                                "transactions": {
-                                    "id": id,
-                                    "error": transaction_hash,
-                                    "amount": amounts,
-                                    "timestamp": datetime.utcnow(),
-                                }
-                            }
-                        },
-                        upsert=True,
+                            "wallet_address": wallet_address,
+                            "id": id,
+                            "error": transaction_hash,
+                            "amount": amounts,
+                            "timestamp": datetime.utcnow(),
+                        }
                     )
             except Exception as e:
                 error_message = str(e)
@@ -90,42 +78,36 @@ async def sign_and_push_transactions(transactions):
                     num_inputs = int(error_message.split("not ")[-1])
                     max_inputs = 255
                     num_splits = -(-num_inputs // max_inputs)  # Ceiling division
-                    amount = Decimal(amounts)
-                    split_amount = round_up_decimal_new(amount / num_splits)
                     logging.info(
                         f"Splitting transaction for {wallet_address} into {num_splits} parts due to UTXO limit."
                     )
-                    for _ in range(num_splits):
+                    for split_units in apportion(amount_units, [1] * num_splits):
                         add_transaction_to_batch(
                             wallet_address,
-                            split_amount,
+                            split_units,
                             f"utxos_split_{transaction_type}",
                         )
                     tempWithdrawals.delete_one({"id": id})
                 elif "URI Too Long for url:" in error_message:
-                    amount = Decimal(amounts)
-                    split_amount = round_up_decimal_new(amount / 2)
                     logging.info(
                         f"Splitting transaction for {wallet_address} into 2 parts due to URI length limit."
                     )
-                    for _ in range(2):
+                    for split_units in apportion(amount_units, [1] * 2):
                         add_transaction_to_batch(
                             wallet_address,
-                            split_amount,
+                            split_units,
                             f"url_split_{transaction_type}",
                         )
 
                     tempWithdrawals.delete_one({"id": id})
                 elif "Request-URI Too Large for url:" in error_message:
-                    amount = Decimal(amounts)
-                    split_amount = round_up_decimal_new(amount / 2)
                     logging.info(
                         f"Splitting transaction for {wallet_address} into 2 parts due to Request-URI Too Large for url."
                     )
-                    for _ in range(2):
+                    for split_units in apportion(amount_units, [1] * 2):
                         add_transaction_to_batch(
                             wallet_address,
-                            split_amount,
+                            split_units,
                             f"Request-URI_{transaction_type}",
                         )
 
@@ -134,22 +116,17 @@ async def sign_and_push_transactions(transactions):
                     logging.error(
                         f"Error during transaction processing for {wallet_address}: {error_message}"
                     )
-                    catchTransactions.update_one(
-                        {"wallet_address": wallet_address},
+                    catchTransactions.insert_one(
                         {
-                            "$push": {
-                                "transactions": {
-                                    "id": id,
-                                    "error": error_message,
-                                    "amount": amounts,
-                                    "timestamp": datetime.utcnow(),
-                                }
-                            }
-                        },
-                        upsert=True,
+                            "wallet_address": wallet_address,
+                            "id": id,
+                            "error": error_message,
+                            "amount": amounts,
+                            "timestamp": datetime.utcnow(),
+                        }
                     )
                     add_transaction_to_batch(
-                        wallet_address, amounts, f"CatchError_{id}"
+                        wallet_address, amount_units, f"CatchError_{id}"
                     )
                     tempWithdrawals.delete_one({"id": id})
 
@@ -161,12 +138,12 @@ async def sign_and_push_transactions(transactions):
         logging.error(f"Error during signing and pushing transactions: {e}")
 
 
-def add_transaction_to_batch(wallet_address, tokens_to_distribute, rewardType):
+def add_transaction_to_batch(wallet_address, amount_units, rewardType):
     try:
         transaction_document = {
             "id": str(uuid.uuid4()),
             "wallet_address": str(wallet_address),
-            "new_balance": float(tokens_to_distribute),
+            "amount_units": Int64(amount_units),
             "timestamp": datetime.utcnow(),
             "type": rewardType,
         }
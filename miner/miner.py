@@ -76,6 +76,56 @@ def is_valid_address(address: str) -> bool:
         return False
 
 
+def handle_task(pipe, device_name, request_response):
+    try:
+        response_data = json.loads(request_response)
+
+        # Handle double encoded JSON if necessary
+        if isinstance(response_data, str):
+            response_data = json.loads(response_data)
+
+        if (
+            isinstance(response_data, dict)
+            and response_data.get("message_type") == "requestedTask"
+        ):
+            task_id = response_data.get("id")
+            prompt = response_data.get("task")
+            negative_prompt = response_data.get("negative_prompt")
+            seed = response_data.get("seed")
+            width = response_data.get("width")
+            height = response_data.get("height")
+
+            image = generate_image(
+                pipe, prompt, negative_prompt, seed, width, height, device_name
+            )
+            if image:
+                path, name = save_image(image, config.DEVICE)
+                metadata = {
+                    "task_id": task_id,
+                    "wallet_address": config.WALLET_ADDRESS,
+                }
+
+                logging.info("Sending completed task to pool")
+                result = upload_task(path, f"{config.ENDPOINT}/task_upload", metadata)
+                logging.info(f"Pool response: {result}")
+                if result:
+                    clear_directory(path)
+                    logging.info("Cleaning uploaded task")
+                else:
+                    logging.error("Error: Failed to upload task")
+            else:
+                logging.error("Error: Failed to generate image")
+
+        else:
+            logging.error("Error: Response data is not a valid JSON object.")
+    except json.JSONDecodeError:
+        logging.error("Error: Could not decode JSON response.")
+    except TypeError:
+        logging.error("TypeError: The response is not in the expected format.")
+    except AttributeError:
+        logging.error("AttributeError: Unexpected data type.")
+
+
 async def start_miner(pipe, device_name):
     uri = f"ws://{config.MINER_POOL_IP}:{config.MINER_POOL_PORT}"
     logging.info(f"Connecting to miner pool at {uri}")
@@ -99,55 +149,7 @@ async def start_miner(pipe, device_name):
             ):
                 logging.info("Pool response for Task: %s", request_response)
 
-            try:
-                response_data = json.loads(request_response)
-
-                # Handle double encoded JSON if necessary
-                if isinstance(response_data, str):
-                    response_data = json.loads(response_data)
-
-                if (
-                    isinstance(response_data, dict)
-                    and response_data.get("message_type") == "requestedTask"
-                ):
-                    task_id = response_data.get("id")
-                    prompt = response_data.get("task")
-                    negative_prompt = response_data.get("negative_prompt")
-                    seed = response_data.get("seed")
-                    width = response_data.get("width")
-                    height = response_data.get("height")
-
-                    image = generate_image(
-                        pipe, prompt, negative_prompt, seed, width, height, device_name
-                    )
-                    if image:
-                        path, name = save_image(image, config.DEVICE)
-                        metadata = {
-                            "task_id": task_id,
-                            "wallet_address": config.WALLET_ADDRESS,
-                        }
-
-                        logging.info("Sending completed task to pool")
-                        result = upload_task(
-                            path, f"{config.ENDPOINT}/task_upload", metadata
-                        )
-                        logging.info(f"Pool response: {result}")
-                        if result:
-                            clear_directory(path)
-                            logging.info("Cleaning uploaded task")
-                        else:
-                            logging.error("Error: Failed to upload task")
-                    else:
-                        logging.error("Error: Failed to generate image")
-
-                else:
-                    logging.error("Error: Response data is not a valid JSON object.")
-            except json.JSONDecodeError:
-                logging.error("Error: Could not decode JSON response.")
-            except TypeError:
-                logging.error("TypeError: The response is not in the expected format.")
-            except AttributeError:
-                logging.error("AttributeError: Unexpected data type.")
+            handle_task(pipe, device_name, request_response)
     except websockets.ConnectionClosedError:
         logging.error(
             "ConnectionClosedError: The websocket connection is closed unexpectedly."
@@ -161,6 +163,28 @@ async def start_miner(pipe, device_name):
         logging.error("An unexpected error occurred: %s", e)
 
 
+async def start_session(pipe, device_name):
+    # Keep one connection open, start a session once and ask for the next task
+    # with "idle" after every upload. Returns False if the pool does not
+    # support sessions, so the caller can fall back to start_miner.
+    uri = f"ws://{config.MINER_POOL_IP}:{config.MINER_POOL_PORT}"
+    logging.info(f"Starting session with miner pool at {uri}")
+    async with websockets.connect(uri) as websocket:
+        response = await request_task(websocket, "session")
+        logging.info("Pool response: %s", response)
+        if response is None or not response.startswith("SUCCESS"):
+            return False
+
+        while True:
+            await websocket.send(json.dumps({"type": "idle"}))
+            request_response = await websocket.recv()
+            if request_response.startswith("ERROR"):
+                logging.info("Pool response for Task: %s", request_response)
+                return True
+            # Generate off the event loop so the connection keeps answering pings
+            await asyncio.to_thread(handle_task, pipe, device_name, request_response)
+
+
 async def start_server():
     logging.info("Starting Miner...")
     try:
@@ -170,9 +194,15 @@ async def start_server():
         model_path = "amajicmixRealistic_v7"
         pipe = load_model_and_pipeline(model_path, torch.float16, device_name)
         if pipe is not None:
+            use_session = True
             while True:
                 try:
-                    await start_miner(pipe, device_name)
+                    if use_session:
+                        use_session = await start_session(pipe, device_name)
+                    else:
+                        await start_miner(pipe, device_name)
+                except (websockets.WebSocketException, OSError) as e:
+                    logging.error("Pool connection lost: %s", e)
                 except Exception as e:
                     logging.error("Miner closed due to an error: %s", e, exc_info=True)
                     break
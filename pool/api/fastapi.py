@@ -1,35 +1,42 @@
 from fastapi import FastAPI, HTTPException, Query, Request, Depends
 from fastapi import File, Form, UploadFile
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+import csv
+import io
+import json
 import hashlib
 from pydantic import BaseModel
-from typing import Optional
-import asyncio
-import base64
-import io
+from typing import List, Optional
 
 from database.mongodb import (
     miners,
     challenges,
 )
 from database.db_requests import (
-    check_active_users,
     get_balance_from_wallet,
     get_balance_poolowner,
     deduct_balance_from_wallet,
     deduct_balance_from_poolowner,
     retrieve_image,
     get_latest_transactions,
+    get_balance_history,
+    get_reward_history,
+    iter_reward_history,
 )
 
+from database.blob_store import open_blob, stream_blob
 from utils.layout import base
+from utils.cache import cache_stats, whitelist_cache
 
-from task.task import handle_miner_response, generate_task
+from task.task import generate_task, generate_tasks
+from task.active_miners import active_miner_count
+from task.notify import completion_waiter, wait_for_event
+from task.uploads import MAX_UPLOAD_SIZE, hash_upload, stage_upload, upload_receipt
 
 app = FastAPI()
 limiter = Limiter(key_func=get_remote_address)
@@ -45,6 +52,69 @@ app.add_middleware(
 )
 
 
+# Room for the multipart boundaries and form fields around the image itself.
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+# Most prompts accepted by one /generate-tasks request, and the room one item
+# may take in its body, which caps the body before it is read and parsed.
+MAX_BULK_TASKS = 1000
+MAX_BULK_ITEM_SIZE = 2 * 1024
+
+
+class BodySizeLimit:
+    # Caps the request body of POSTs to the paths in limits, given as
+    # {path: (max_bytes, detail)}. A Content-Length over the cap is answered
+    # with a 413 before any of the body is read. A body sent without one, e.g.
+    # chunked, is counted as it is received and cut off with a 413 as soon as
+    # it passes the cap, before the form parser spools the rest of it.
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limit = self.limits.get(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        max_bytes, detail = limit
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(
+    BodySizeLimit,
+    limits={
+        "/task_upload": (
+            MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD,
+            "File size exceeds 3 MB",
+        ),
+        "/generate-tasks": (
+            MAX_BULK_TASKS * MAX_BULK_ITEM_SIZE,
+            f"Request body exceeds {MAX_BULK_TASKS * MAX_BULK_ITEM_SIZE} bytes",
+        ),
+    },
+)
+
+
 class ResultSubmission(BaseModel):
     nonce: int
     challenge_id: str
@@ -85,10 +155,103 @@ class TaskResponse(BaseModel):
     error: Optional[str] = None
 
 
+class BulkTaskResponse(BaseModel):
+    success: bool
+    retrieve_ids: List[Optional[str]] = []
+    error: Optional[str] = None
+
+
+# Priorities API clients may ask for, "high" is reserved for validation rounds.
+BULK_TASK_PRIORITIES = ("medium", "low")
+
+
+def parse_task_requests(body, content_type):
+    # Accepts a JSON array, or NDJSON with one item per line. Each item is a
+    # prompt string or {"prompt": ..., "priority": "medium" | "low"}.
+    if content_type.startswith("application/x-ndjson"):
+        items = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        items = json.loads(body)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of prompts.")
+
+    requests, errors = [], []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict):
+            errors.append(f"{index}: expected a prompt or an object")
+            continue
+        prompt = item.get("prompt")
+        priority = item.get("priority", "medium")
+        if not isinstance(prompt, str) or not prompt.strip():
+            errors.append(f"{index}: no prompt provided")
+        elif priority not in BULK_TASK_PRIORITIES:
+            errors.append(f"{index}: priority must be one of {BULK_TASK_PRIORITIES}")
+        else:
+            requests.append((prompt, priority))
+    return requests, errors
+
+
 def generate_target(difficulty):
     return "0" * difficulty + "f" * (64 - difficulty)
 
 
+def etag_matches(if_none_match, etag):
+    if if_none_match is None:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+IMAGE_PENDING = "Your image is being generated, please wait."
+# Longest a /retrieve_image long-poll may hold the request open.
+MAX_RETRIEVE_WAIT = 60
+# Interval between SSE keep-alives, each of which also re-checks the result.
+EVENT_KEEPALIVE = 15
+
+
+def image_pending(result):
+    return isinstance(result, dict) and result.get("error") == IMAGE_PENDING
+
+
+async def wait_for_image(retrieve_id, timeout):
+    # Register before looking up so a completion between the lookup and the
+    # wait is not missed.
+    with completion_waiter(retrieve_id) as completed:
+        success, result = await retrieve_image(retrieve_id)
+        if success or not image_pending(result):
+            return success, result
+        await wait_for_event(completed, timeout)
+    return await retrieve_image(retrieve_id)
+
+
+def parse_byte_range(range_header, length):
+    # Returns (start, end) inclusive, None to serve the whole body, or False
+    # when the range cannot be satisfied. Only single ranges are honored.
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    ranges = range_header[len("bytes=") :].split(",")
+    if len(ranges) != 1:
+        return None
+    first, _, last = ranges[0].strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(0, length - suffix), length - 1
+        start = int(first)
+        end = int(last) if last else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return False
+    return start, min(end, length - 1)
+
+
 async def register_miner(wallet_address, difficulty, hash, index):
     try:
         # Check if the miner is already registered
@@ -121,6 +284,7 @@ async def register_miner(wallet_address, difficulty, hash, index):
                 old_wallet_address = oldest_miner[0]["wallet_address"]
                 print(f"{old_wallet_address} replaced by new {wallet_address}")
                 miners.delete_one({"_id": oldest_miner[0]["_id"]})
+                whitelist_cache.invalidate(old_wallet_address)
             else:
                 print("No miner spot available due to immunity period.")
                 return False, "No miner spot available due to immunity period."
@@ -139,6 +303,7 @@ async def register_miner(wallet_address, difficulty, hash, index):
             "index": index,
         }
         miners.insert_one(miner_data)
+        whitelist_cache.invalidate(wallet_address)
         print("Miner registered successfully")
         return True, None
     except Exception as e:
@@ -285,13 +450,19 @@ async def submit_result(
 
 @app.get("/active-miners")
 @limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
-def get_active_users(request: Request):
+async def get_active_users(request: Request):
     try:
-        return {"active_miners": check_active_users()}
+        return {"active_miners": await active_miner_count()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache-stats")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+async def get_cache_stats(request: Request):
+    return cache_stats()
+
+
 @app.get("/get_balance/")
 @limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
 async def get_balance(request: Request, wallet_address: str):
@@ -358,9 +529,15 @@ async def poolowner_deduct_balance(
 
 @app.get("/latestwithdraws/")
 @limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
-async def latest_withdraws(
-    request: Request, wallet_address: str, page: str, page_size: str
+def latest_withdraws(
+    request: Request,
+    wallet_address: str,
+    page: str = "1",
+    page_size: str = "10",
+    cursor: str = None,
 ):
+    # A plain def runs in FastAPI's threadpool, so the blocking reads stay off
+    # the event loop.
     if not wallet_address:
         raise HTTPException(status_code=400, detail="Wallet address must be provided")
 
@@ -372,16 +549,142 @@ async def latest_withdraws(
             status_code=400, detail="Page and page size must be integers"
         )
 
-    result = get_latest_transactions(wallet_address, page, page_size)
+    result = get_latest_transactions(wallet_address, page, page_size, cursor)
+
+    if "error" in result:
+        message = result["error"]
+        if message.startswith("Invalid"):
+            raise HTTPException(status_code=400, detail=message)
+        status_code = 404 if "not found" in message.lower() else 500
+        raise HTTPException(status_code=status_code, detail=message)
+
+    return result
+
+
+@app.get("/balance_history/")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+def balance_history(
+    request: Request,
+    wallet_address: str,
+    page_size: str = "10",
+    cursor: str = None,
+):
+    # A plain def runs in FastAPI's threadpool, so the blocking ledger reads
+    # stay off the event loop.
+    if not wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address must be provided")
+
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Page size must be an integer")
+
+    result = get_balance_history(wallet_address, page_size, cursor)
+
+    if "error" in result:
+        message = result["error"]
+        if message.startswith("Invalid"):
+            raise HTTPException(status_code=400, detail=message)
+        status_code = 404 if "not found" in message.lower() else 500
+        raise HTTPException(status_code=status_code, detail=message)
+
+    return result
+
+
+def parse_since(since):
+    if since is None:
+        return None
+    try:
+        return datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="since must be an ISO 8601 date or datetime"
+        )
+
+
+@app.get("/reward_history/")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+def reward_history(
+    request: Request,
+    wallet_address: str,
+    page_size: str = "10",
+    cursor: str = None,
+    since: str = None,
+):
+    # A plain def runs in FastAPI's threadpool, so the blocking reads stay off
+    # the event loop.
+    if not wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address must be provided")
+
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Page size must be an integer")
+
+    result = get_reward_history(wallet_address, page_size, cursor, parse_since(since))
 
     if "error" in result:
         message = result["error"]
+        if message.startswith("Invalid"):
+            raise HTTPException(status_code=400, detail=message)
         status_code = 404 if "not found" in message.lower() else 500
         raise HTTPException(status_code=status_code, detail=message)
 
     return result
 
 
+def reward_history_ndjson(rows):
+    for row in rows:
+        row["timestamp"] = row["timestamp"].isoformat()
+        yield json.dumps(row) + "\n"
+
+
+def reward_history_csv(rows):
+    # Columns are taken from the first row; every row of a service has the
+    # same fields.
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        row["timestamp"] = row["timestamp"].isoformat()
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+@app.get("/reward_history/export")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+def export_reward_history(
+    request: Request,
+    wallet_address: str,
+    format: str = "ndjson",
+    since: str = None,
+):
+    # Streams every row instead of building the export in memory. The rows
+    # are plain generators over a blocking cursor, which StreamingResponse
+    # iterates in the threadpool, so the cursor never runs on the event loop.
+    if not wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address must be provided")
+
+    rows = iter_reward_history(wallet_address, parse_since(since))
+    if format == "ndjson":
+        return StreamingResponse(
+            reward_history_ndjson(rows), media_type="application/x-ndjson"
+        )
+    if format == "csv":
+        return StreamingResponse(
+            reward_history_csv(rows),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="rewards-{wallet_address}.csv"'
+            },
+        )
+    raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+
 @app.post("/task_upload")
 async def upload_image(
     task_id: str = Form(...),
@@ -389,40 +692,131 @@ async def upload_image(
     file: UploadFile = File(...),
 ):
     try:
-        image_bytes = await file.read()
-        # Check if the file size exceeds 3 MB (3 * 1024 * 1024 bytes)
-        if len(image_bytes) > 3 * 1024 * 1024:
+        # Hash the upload in chunks, aborting once it crosses 3 MB
+        output_hash, length = await hash_upload(file)
+        if output_hash is None:
             raise HTTPException(
-                status_code=400,
+                status_code=413,
                 detail="File size exceeds 3 MB",
             )
-        await asyncio.sleep(20)
 
-        response = await handle_miner_response(task_id, wallet_address, image_bytes)
-        return JSONResponse(content={"status": "success", "data": response})
+        # Stage the upload and answer at once, it is accepted in the background
+        # once the minimum acceptance delay has passed.
+        success, result = await stage_upload(
+            task_id, wallet_address, file.file, output_hash, length
+        )
+        if not success:
+            return JSONResponse(content={"status": "error", "data": [False, result]})
+        return JSONResponse(
+            content={
+                "status": "success",
+                "data": [True, f"Upload received, receipt {result}"],
+                "receipt_id": result,
+            }
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/task_upload/{receipt_id}")
+async def get_upload_receipt(receipt_id: str):
+    success, result = await upload_receipt(receipt_id)
+    if not success:
+        raise HTTPException(status_code=404, detail=result)
+    return JSONResponse(content=result)
+
+
 @app.get("/retrieve_image/{retrieve_id}")
-async def get_image(retrieve_id: str):
-    success, result = retrieve_image(retrieve_id)
+async def get_image(
+    retrieve_id: str,
+    request: Request,
+    wait: int = Query(0, ge=0, le=MAX_RETRIEVE_WAIT),
+):
+    if wait:
+        success, result = await wait_for_image(retrieve_id, wait)
+    else:
+        success, result = await retrieve_image(retrieve_id)
 
     if not success:
-        if result.get("error") == "Your image is being generated, please wait.":
+        if image_pending(result):
             raise HTTPException(status_code=202, detail=result)
         else:
             raise HTTPException(status_code=404, detail=result)
 
-    try:
+    # The output hash is the content, so it makes a strong validator, and the
+    # response can be cached until the ResponseTask document expires.
+    etag = f'"{result["output_hash"]}"'
+    max_age = 0
+    if result["expireAt"] is not None:
+        max_age = max(0, int((result["expireAt"] - datetime.utcnow()).total_seconds()))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, immutable",
+        "Accept-Ranges": "bytes",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    grid_out = await open_blob(result["output_hash"])
+    if grid_out is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"success": False, "error": "Image not found or deleted."},
+        )
+
+    length = grid_out.length
+    byte_range = None
+    if request.headers.get("if-range", etag) == etag:
+        byte_range = parse_byte_range(request.headers.get("range"), length)
+
+    if byte_range is False:
+        headers["Content-Range"] = f"bytes */{length}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(
+            stream_blob(grid_out), media_type="image/png", headers=headers
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        stream_blob(grid_out, start, end - start + 1),
+        status_code=206,
+        media_type="image/png",
+        headers=headers,
+    )
 
-        if isinstance(result, str):
-            image_data = base64.b64decode(result)
-        else:
-            image_data = result
-        return StreamingResponse(io.BytesIO(image_data), media_type="image/png")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error decoding image: {str(e)}")
+
+@app.get("/retrieve_image/{retrieve_id}/events")
+async def image_events(retrieve_id: str):
+    async def events():
+        while True:
+            with completion_waiter(retrieve_id) as completed:
+                success, result = await retrieve_image(retrieve_id)
+                if success:
+                    data = {
+                        "retrieve_id": retrieve_id,
+                        "url": f"/retrieve_image/{retrieve_id}",
+                    }
+                    yield f"event: completed\ndata: {json.dumps(data)}\n\n"
+                    return
+                if not image_pending(result):
+                    yield f"event: error\ndata: {json.dumps(result)}\n\n"
+                    return
+                yield ": pending\n\n"
+                await wait_for_event(completed, EVENT_KEEPALIVE)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
 
 
 @app.get("/generate-task", response_model=TaskResponse)
@@ -440,3 +834,37 @@ async def generate_task_endpoint(prompt: Optional[str] = Query(None)):
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/generate-tasks", response_model=BulkTaskResponse)
+async def generate_tasks_endpoint(request: Request):
+    try:
+        body = await request.body()
+        try:
+            task_requests, errors = parse_task_requests(
+                body, request.headers.get("content-type", "")
+            )
+        except ValueError as e:
+            return BulkTaskResponse(success=False, error=f"Invalid body: {e}")
+
+        if errors:
+            return BulkTaskResponse(success=False, error="; ".join(errors))
+        if not task_requests:
+            return BulkTaskResponse(success=False, error="No prompt provided.")
+        if len(task_requests) > MAX_BULK_TASKS:
+            return BulkTaskResponse(
+                success=False,
+                error=f"At most {MAX_BULK_TASKS} prompts per request.",
+            )
+
+        result = await generate_tasks(task_requests)
+        return BulkTaskResponse(
+            success=result["success"],
+            retrieve_ids=result["retrieve_ids"],
+            error=result.get("error"),
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
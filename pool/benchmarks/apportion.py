@@ -0,0 +1,58 @@
+"""Reward split arithmetic: the per-miner Decimal loop against apportion.
+
+Needs no database. Run from the pool directory:
+
+    python -m benchmarks.apportion --miners 10000 100000 1000000
+"""
+
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from reward_logic.fixed_point import apportion, from_units, to_units
+from reward_logic.percentage import round_up_decimal_new
+
+
+def decimal_loop(amount, scores):
+    # The split as update_miner_balances computed it before base units.
+    total_score = sum(Decimal(score) for score in scores)
+    return [
+        round_up_decimal_new((Decimal(score) / total_score) * amount)
+        for score in scores
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reward split benchmark")
+    parser.add_argument(
+        "--miners", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--amount", default="1234.56789012")
+    args = parser.parse_args()
+
+    amount = Decimal(args.amount)
+    print(
+        f"{'miners':>8} {'decimal s':>10} {'apportion s':>12} {'decimal error':>14} {'apportion error':>16}"
+    )
+    for count in args.miners:
+        scores = [random.randint(1, 500) for _ in range(count)]
+
+        started = time.perf_counter()
+        decimal_shares = decimal_loop(amount, scores)
+        decimal_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        unit_shares = apportion(to_units(amount), scores)
+        apportion_seconds = time.perf_counter() - started
+
+        # How far the shares add up from the amount being distributed.
+        decimal_error = sum(decimal_shares) - amount
+        apportion_error = from_units(sum(unit_shares)) - amount
+        print(
+            f"{count:>8} {decimal_seconds:>10.2f} {apportion_seconds:>12.2f} {decimal_error:>14} {apportion_error:>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Task submission throughput, one insert per prompt against generate_tasks.
+
+Run from the pool directory against a local mongod:
+
+    python -m benchmarks.bulk_submit --prompts 10000 --batch-sizes 100 1000
+"""
+
+import argparse
+import asyncio
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import task.task as task_module
+from task.task import generate_task, generate_tasks
+from utils.layout import base
+
+
+async def single(prompts):
+    for prompt in prompts:
+        await generate_task(prompt)
+
+
+async def bulk(prompts, batch_size):
+    for offset in range(0, len(prompts), batch_size):
+        batch = prompts[offset : offset + batch_size]
+        await generate_tasks([(prompt, "medium") for prompt in batch])
+
+
+async def run(count, batch_sizes):
+    client = AsyncIOMotorClient(base["MONGOD_DB"]["MONGO_URL"])
+    scratch = client.pool_benchmark
+    # Point task creation at the scratch database instead of pooldb.
+    task_module.get_async_db = lambda: scratch
+
+    prompts = [f"benchmark prompt {i}" for i in range(count)]
+    runs = [("single", lambda: single(prompts))] + [
+        (f"bulk x{size}", lambda size=size: bulk(prompts, size)) for size in batch_sizes
+    ]
+
+    print(f"{'mode':>12} {'prompts':>8} {'seconds':>8} {'tasks/s':>10}")
+    for name, submit in runs:
+        await scratch.AiTask.drop()
+        started = time.perf_counter()
+        await submit()
+        elapsed = time.perf_counter() - started
+        print(f"{name:>12} {count:>8} {elapsed:>8.2f} {count / elapsed:>10.0f}")
+
+    await client.drop_database("pool_benchmark")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk task submission benchmark")
+    parser.add_argument("--prompts", type=int, default=10000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+    asyncio.run(run(args.prompts, args.batch_sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Per-claim latency of task.task.claim_task as the queue grows.
+
+Run from the pool directory against a local mongod:
+
+    python -m benchmarks.claim_latency --depths 1000 10000 100000 1000000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+import task.task as task_module
+from task.task import TASK_PRIORITY, claim_task
+from utils.layout import base
+
+
+def fill_queue(collection, depth, batch_size=10000):
+    collection.drop()
+    collection.create_index([("status", 1), ("sched_tag", 1)])
+    collection.create_index([("wallet", 1), ("status", 1)])
+
+    start = datetime.utcnow() - timedelta(days=1)
+    types = list(TASK_PRIORITY)
+    for offset in range(0, depth, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, depth)):
+            task_type = random.choice(types)
+            batch.append(
+                {
+                    "id": f"bench-{i}",
+                    "task": "benchmark prompt",
+                    "negative_prompt": "",
+                    "width": 512,
+                    "height": 768,
+                    "seed": "1",
+                    "time": (start + timedelta(microseconds=i)).isoformat(),
+                    "sched_tag": random.uniform(0, depth),
+                    "retrieve_id": f"bench-r-{i}",
+                    "wallet": "",
+                    "status": "pending",
+                    "type": task_type,
+                    "priority": TASK_PRIORITY[task_type],
+                    "message_type": "requestedTask",
+                }
+            )
+        collection.insert_many(batch, ordered=False)
+
+
+async def measure(claims):
+    # Point the claim engine at the scratch database instead of pooldb.
+    scratch = AsyncIOMotorClient(base["MONGOD_DB"]["MONGO_URL"]).pool_benchmark
+    task_module.get_async_db = lambda: scratch
+
+    samples = []
+    for i in range(claims):
+        started = time.perf_counter()
+        task = await claim_task(f"bench-wallet-{i}")
+        samples.append((time.perf_counter() - started) * 1000)
+        if task is None:
+            break
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="claim_task latency benchmark")
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[1000, 10000, 100000, 1000000]
+    )
+    parser.add_argument("--claims", type=int, default=500)
+    args = parser.parse_args()
+
+    client = MongoClient(base["MONGOD_DB"]["MONGO_URL"])
+    collection = client.pool_benchmark.AiTask
+
+    print(f"{'depth':>10} {'claims':>7} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for depth in args.depths:
+        fill_queue(collection, depth)
+        samples = asyncio.run(measure(min(args.claims, depth)))
+        samples.sort()
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print(
+            f"{depth:>10} {len(samples):>7} {statistics.mean(samples):>9.3f} "
+            f"{statistics.median(samples):>8.3f} {p99:>8.3f}"
+        )
+
+    client.drop_database("pool_benchmark")
+
+
+if __name__ == "__main__":
+    main()
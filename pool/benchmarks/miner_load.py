@@ -0,0 +1,109 @@
+"""Task request throughput of a running pool under concurrent miners.
+
+Each simulated miner repeatedly opens a websocket to the pool main socket,
+sends a PING and a task request, and waits for the task, like start_miner in
+miner/miner.py. With --session each miner instead keeps one connection open,
+starts a session once and sends "idle" for every task, like start_session.
+Run it against a pool started with pool.py:
+
+    python -m benchmarks.miner_load --miners 1500 --duration 60
+    python -m benchmarks.miner_load --miners 1500 --duration 60 --session
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+from utils.layout import base
+
+
+def wallet_for(index):
+    # is_valid_address accepts 128 hex characters.
+    return f"{index:0128x}"
+
+
+async def run_miner(uri, wallet_address, deadline, samples, errors):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            async with websockets.connect(uri) as websocket:
+                await websocket.send(json.dumps({"type": "PING"}))
+                await websocket.recv()
+                await websocket.send(
+                    json.dumps({"type": "request", "wallet_address": wallet_address})
+                )
+                response = await websocket.recv()
+            if response.startswith("ERROR"):
+                errors.append(response)
+            else:
+                samples.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def run_session_miner(uri, wallet_address, deadline, samples, errors):
+    while time.monotonic() < deadline:
+        try:
+            async with websockets.connect(uri) as websocket:
+                await websocket.send(
+                    json.dumps({"type": "session", "wallet_address": wallet_address})
+                )
+                response = await websocket.recv()
+                if response.startswith("ERROR"):
+                    errors.append(response)
+                    return
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    await websocket.send(json.dumps({"type": "idle"}))
+                    response = await websocket.recv()
+                    if response.startswith("ERROR"):
+                        errors.append(response)
+                        break
+                    samples.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            errors.append(str(e))
+
+
+async def run(uri, miners, duration, session):
+    deadline = time.monotonic() + duration
+    samples, errors = [], []
+    miner = run_session_miner if session else run_miner
+    await asyncio.gather(
+        *(
+            miner(uri, wallet_for(index), deadline, samples, errors)
+            for index in range(miners)
+        )
+    )
+    return samples, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pool task request load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=base["POOL_MAIN_SOCKET"]["PORT"])
+    parser.add_argument("--miners", type=int, default=1500)
+    parser.add_argument("--duration", type=int, default=60)
+    parser.add_argument(
+        "--session", action="store_true", help="keep one session per miner"
+    )
+    args = parser.parse_args()
+
+    uri = f"ws://{args.host}:{args.port}"
+    samples, errors = asyncio.run(run(uri, args.miners, args.duration, args.session))
+
+    print(f"mode:          {'session' if args.session else 'per-task'}")
+    print(f"miners:        {args.miners}")
+    print(f"tasks/second:  {len(samples) / args.duration:.1f}")
+    print(f"errors:        {len(errors)}")
+    if samples:
+        samples.sort()
+        print(f"p50 ms:        {statistics.median(samples):.1f}")
+        print(f"p99 ms:        {samples[int(len(samples) * 0.99)]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Time of one reward distribution by update_miner_balances as miners grow.
+
+Run from the pool directory against a local mongod:
+
+    python -m benchmarks.reward_distribution --miners 10000 100000 1000000
+"""
+
+import argparse
+import random
+import time
+
+from pymongo import MongoClient
+
+import reward_logic.ledger as ledger_module
+import reward_logic.miner_reward as reward_module
+import reward_logic.score_epochs as epochs_module
+from reward_logic.miner_reward import update_miner_balances
+from reward_logic.score_epochs import last_closed_epoch
+from reward_logic.fixed_point import to_units
+from utils.layout import base
+
+
+def seed_miners(db, count, batch_size=10000):
+    # Every miner scored in the newest closed epoch, none paid yet.
+    for name in ("userStats", "scoreEpochs", "epochTotals", "rewardState", "ledger"):
+        db[name].drop()
+    db.userStats.create_index([("wallet_address", 1)])
+    db.ledger.create_index([("account", 1), ("ref", 1)], unique=True)
+    db.scoreEpochs.create_index([("epoch", 1), ("wallet_address", 1)], unique=True)
+
+    epoch = last_closed_epoch()
+    total = 0
+    for offset in range(0, count, batch_size):
+        wallets = [
+            f"benchmark-wallet-{i}"
+            for i in range(offset, min(offset + batch_size, count))
+        ]
+        scores = [random.randint(1, 500) for _ in wallets]
+        total += sum(scores)
+        db.userStats.insert_many(
+            [
+                {"wallet_address": wallet, "balance_units": 0, "tp": 50, "np": 0}
+                for wallet in wallets
+            ],
+            ordered=False,
+        )
+        db.scoreEpochs.insert_many(
+            [
+                {"epoch": epoch, "wallet_address": wallet, "score": score}
+                for wallet, score in zip(wallets, scores)
+            ],
+            ordered=False,
+        )
+    db.epochTotals.insert_one({"_id": epoch, "total": total})
+    db.rewardState.insert_one({"_id": "miners", "last_paid_epoch": epoch - 1})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reward distribution benchmark")
+    parser.add_argument(
+        "--miners", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--amount", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    client = MongoClient(base["MONGOD_DB"]["MONGO_URL"])
+    scratch = client.pool_benchmark
+    # Distribute over the scratch database instead of pooldb, and skip the
+    # rewardLog entry, which cannot hold a million miners in one document.
+    ledger_module.userStats = scratch.userStats
+    ledger_module.ledger = scratch.ledger
+    reward_module.store_in_db = lambda block_range, updates: None
+    epochs_module.scoreEpochs = scratch.scoreEpochs
+    epochs_module.epochTotals = scratch.epochTotals
+    epochs_module.rewardState = scratch.rewardState
+
+    print(f"{'miners':>8} {'seed s':>8} {'distribute s':>13} {'miners/s':>10}")
+    for count in args.miners:
+        started = time.perf_counter()
+        seed_miners(scratch, count)
+        seeded = time.perf_counter() - started
+
+        started = time.perf_counter()
+        update_miner_balances(to_units(args.amount), "benchmark", args.batch_size)
+        elapsed = time.perf_counter() - started
+
+        paid = scratch.userStats.count_documents({"balance_units": {"$gt": 0}})
+        if paid != count:
+            print(f"warning: {paid} of {count} miners were credited")
+        print(f"{count:>8} {seeded:>8.2f} {elapsed:>13.2f} {count / elapsed:>10.0f}")
+
+    client.drop_database("pool_benchmark")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Queue wait per task type under strict priority and under the WFQ scheduler.
+
+An in-memory discrete event simulation: tasks of each type arrive as Poisson
+processes, a fixed number of miners serve them one at a time, and the queue is
+ordered either by (priority, time) like the old claim query or by the
+sched_tag of task/scheduler.py. Run from the pool directory:
+
+    python -m benchmarks.scheduler_sim --miners 200 --service 20 --rates 1 6 6
+"""
+
+import argparse
+import heapq
+import random
+import statistics
+
+from task.scheduler import next_tags
+from task.task import TASK_PRIORITY
+
+TYPES = ("high", "medium", "low")
+
+
+def strict_policy():
+    def key(task_type, now):
+        return (TASK_PRIORITY[task_type], now)
+
+    return key
+
+
+def wfq_policy():
+    last_finish = {task_type: 0.0 for task_type in TYPES}
+
+    def key(task_type, now):
+        last_finish[task_type], tags = next_tags(
+            last_finish[task_type], now, task_type, 1
+        )
+        return (tags[0],)
+
+    return key
+
+
+def simulate(policy, miners, service, rates, duration, seed):
+    rng = random.Random(seed)
+    key = policy()
+    events = []
+    for task_type, rate in zip(TYPES, rates):
+        if rate > 0:
+            heapq.heappush(events, (rng.expovariate(rate), 0, "arrive", task_type))
+
+    queue, waits = [], {task_type: [] for task_type in TYPES}
+    idle, sequence = miners, 1
+    while events:
+        now, _, kind, task_type = heapq.heappop(events)
+        if now > duration:
+            break
+        if kind == "arrive":
+            heapq.heappush(queue, (*key(task_type, now), sequence, task_type, now))
+            rate = rates[TYPES.index(task_type)]
+            heapq.heappush(
+                events, (now + rng.expovariate(rate), sequence, "arrive", task_type)
+            )
+        else:
+            idle += 1
+        sequence += 1
+
+        while idle and queue:
+            *_, queued_type, queued_at = heapq.heappop(queue)
+            waits[queued_type].append(now - queued_at)
+            idle -= 1
+            heapq.heappush(
+                events,
+                (now + rng.expovariate(1 / service), sequence, "done", queued_type),
+            )
+            sequence += 1
+
+    unserved = {task_type: 0 for task_type in TYPES}
+    for *_, task_type, _ in queue:
+        unserved[task_type] += 1
+    return waits, unserved
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Task scheduler simulation")
+    parser.add_argument("--miners", type=int, default=200)
+    parser.add_argument(
+        "--service", type=float, default=20, help="mean seconds per task"
+    )
+    parser.add_argument(
+        "--rates",
+        type=float,
+        nargs=3,
+        default=[1, 6, 6],
+        help="arrivals per second of high, medium and low tasks",
+    )
+    parser.add_argument("--duration", type=float, default=3600)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"capacity: {args.miners / args.service:.1f} tasks/s")
+    print(
+        f"{'policy':>8} {'type':>7} {'served':>8} {'unserved':>9} "
+        f"{'p50 s':>8} {'p99 s':>8}"
+    )
+    for name, policy in (("strict", strict_policy), ("wfq", wfq_policy)):
+        waits, unserved = simulate(
+            policy, args.miners, args.service, args.rates, args.duration, args.seed
+        )
+        for task_type in TYPES:
+            samples = waits[task_type]
+            p50 = statistics.median(samples) if samples else float("nan")
+            p99 = percentile(samples, 0.99) if samples else float("nan")
+            print(
+                f"{name:>8} {task_type:>7} {len(samples):>8} "
+                f"{unserved[task_type]:>9} {p50:>8.1f} {p99:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
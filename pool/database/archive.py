@@ -0,0 +1,200 @@
+import gzip
+import logging
+import os
+import sqlite3
+import zlib
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+from pymongo.errors import PyMongoError
+
+from database.mongodb import db
+from utils.layout import base
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Documents older than ARCHIVE.HORIZON_DAYS, by the time in their ObjectId,
+# move out of MongoDB into append-only NDJSON segments under ARCHIVE.DIR, one
+# file per collection and day. Each pass appends one gzip member per day it
+# touched, and a SQLite index maps every archived _id and lookup key to the
+# segment and byte offset of its member, so a point lookup decompresses one
+# member instead of the whole segment.
+ARCHIVE_DIR = base["ARCHIVE"]["DIR"]
+ARCHIVE_HORIZON = timedelta(days=base["ARCHIVE"]["HORIZON_DAYS"])
+ARCHIVE_BATCH = base["ARCHIVE"]["BATCH"]
+INDEX_PATH = os.path.join(ARCHIVE_DIR, "index.sqlite3")
+
+# collection -> fields point lookups use besides _id
+ARCHIVED_COLLECTIONS = {
+    "rewardLog": ["block_height"],
+    "submittedTransactions": ["hash", "id"],
+    "blockTransactions": ["hash"],
+    "errorTransactions": ["id"],
+    "catchTransactions": ["id"],
+    "ValidationTaskHistory": ["val_id"],
+}
+
+
+def open_index():
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    index = sqlite3.connect(INDEX_PATH, timeout=30)
+    # WAL lets lookups read while a pass is writing.
+    index.execute("PRAGMA journal_mode=WAL")
+    index.execute(
+        "CREATE TABLE IF NOT EXISTS records ("
+        "collection TEXT, key TEXT, value TEXT, doc_id TEXT, "
+        "segment TEXT, offset INTEGER, "
+        "PRIMARY KEY (collection, key, value, doc_id))"
+    )
+    return index
+
+
+def append_segment(name, day, documents):
+    # Returns the segment, relative to ARCHIVE_DIR, and the offset of the
+    # member written.
+    os.makedirs(os.path.join(ARCHIVE_DIR, name), exist_ok=True)
+    segment = os.path.join(name, f"{day:%Y-%m-%d}.ndjson.gz")
+    lines = "".join(json_util.dumps(document) + "\n" for document in documents)
+    with open(os.path.join(ARCHIVE_DIR, segment), "ab") as file:
+        offset = file.tell()
+        file.write(gzip.compress(lines.encode()))
+        file.flush()
+        os.fsync(file.fileno())
+    return segment, offset
+
+
+def archive_collection(name, keys, cutoff):
+    # Documents are removed from MongoDB only once their segment and index
+    # rows are written. A pass interrupted in between archives them again
+    # next time; the index then points at the newer copy.
+    collection = db[name]
+    archived = 0
+    index = open_index()
+    try:
+        while True:
+            documents = list(
+                collection.find({"_id": {"$lt": cutoff}})
+                .sort("_id", 1)
+                .limit(ARCHIVE_BATCH)
+            )
+            if not documents:
+                return archived
+
+            by_day = {}
+            for document in documents:
+                day = document["_id"].generation_time.date()
+                by_day.setdefault(day, []).append(document)
+
+            rows = []
+            for day, day_documents in by_day.items():
+                segment, offset = append_segment(name, day, day_documents)
+                for document in day_documents:
+                    doc_id = str(document["_id"])
+                    rows.append((name, "_id", doc_id, doc_id, segment, offset))
+                    for key in keys:
+                        if document.get(key) is not None:
+                            rows.append(
+                                (name, key, str(document[key]), doc_id, segment, offset)
+                            )
+            with index:
+                index.executemany(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+
+            collection.delete_many(
+                {"_id": {"$in": [document["_id"] for document in documents]}}
+            )
+            archived += len(documents)
+    finally:
+        index.close()
+
+
+def archive_collections():
+    # Returns (success, {collection: documents archived}).
+    cutoff = ObjectId.from_datetime(datetime.utcnow() - ARCHIVE_HORIZON)
+    archived = {}
+    try:
+        for name, keys in ARCHIVED_COLLECTIONS.items():
+            archived[name] = archive_collection(name, keys, cutoff)
+        return True, archived
+    except (PyMongoError, OSError, sqlite3.Error) as e:
+        logging.error(f"An error occurred in archive_collections: {e}")
+        return False, archived
+
+
+def read_member(segment, offset):
+    # The documents of the gzip member at offset. A gzip decompressor stops at
+    # the end of its member, so the rest of the segment is not read.
+    decompressor = zlib.decompressobj(wbits=31)
+    chunks = []
+    with open(os.path.join(ARCHIVE_DIR, segment), "rb") as file:
+        file.seek(offset)
+        while not decompressor.eof:
+            data = file.read(64 * 1024)
+            if not data:
+                break
+            chunks.append(decompressor.decompress(data))
+    for line in b"".join(chunks).decode().splitlines():
+        yield json_util.loads(line)
+
+
+def find_archived(name, key, value):
+    # The archived document of collection name whose key equals value, or
+    # None.
+    if not os.path.exists(INDEX_PATH):
+        return None
+    try:
+        index = sqlite3.connect(INDEX_PATH, timeout=30)
+        try:
+            row = index.execute(
+                "SELECT doc_id, segment, offset FROM records "
+                "WHERE collection = ? AND key = ? AND value = ? LIMIT 1",
+                (name, key, str(value)),
+            ).fetchone()
+        finally:
+            index.close()
+        if row is None:
+            return None
+        doc_id, segment, offset = row
+        for document in read_member(segment, offset):
+            if str(document["_id"]) == doc_id:
+                return document
+        return None
+    except (OSError, sqlite3.Error, zlib.error) as e:
+        logging.error(f"An error occurred in find_archived: {e}")
+        return None
+
+
+def archived_values(name, key, values):
+    # The subset of values that some archived document of collection name has
+    # under key, from one connection and one query per chunk, for callers that
+    # check many values at once and only need to know whether they exist.
+    values = [str(value) for value in values]
+    if not values or not os.path.exists(INDEX_PATH):
+        return set()
+    found = set()
+    try:
+        index = sqlite3.connect(INDEX_PATH, timeout=30)
+        try:
+            # Stay under SQLite's limit on bound parameters.
+            for start in range(0, len(values), 500):
+                chunk = values[start : start + 500]
+                rows = index.execute(
+                    "SELECT DISTINCT value FROM records "
+                    "WHERE collection = ? AND key = ? AND value IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    (name, key, *chunk),
+                )
+                found.update(value for (value,) in rows)
+        finally:
+            index.close()
+        return found
+    except sqlite3.Error as e:
+        logging.error(f"An error occurred in archived_values: {e}")
+        return found
+
+
+if __name__ == "__main__":
+    print(archive_collections())
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+
+from gridfs.errors import FileExists, NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database.mongodb import fs, get_async_db
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Miner outputs are stored once in GridFS under their SHA-256 hex digest and
+# documents only keep that hash. blobRefs holds one document per blob with the
+# number of live holders and the latest expiry any holder asked for; a blob is
+# collected once it has no holders left or every holder has expired.
+#
+# A ref is only created once its content is in GridFS, and collection first
+# marks the ref as "collecting" so no holder can take it while the file is
+# being deleted; the ref itself goes last.
+COLLECT_WAIT = 0.1
+COLLECT_RETRIES = 50
+
+
+def blob_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_async_fs():
+    return AsyncIOMotorGridFSBucket(get_async_db())
+
+
+async def acquire_blob(output_hash, expire_at):
+    return await get_async_db().blobRefs.find_one_and_update(
+        {"_id": output_hash, "collecting": {"$ne": True}},
+        {"$inc": {"refs": 1}, "$max": {"expireAt": expire_at}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def put_blob(data, expire_at):
+    return await put_blob_stream(data, blob_hash(data), len(data), expire_at)
+
+
+async def put_blob_stream(source, output_hash, length, expire_at):
+    # source is bytes or a file object positioned at the start of the content,
+    # hashed by the caller so large uploads never have to be held in memory.
+    # Later holders of a live blob are deduplicated onto it.
+    if await acquire_blob(output_hash, expire_at):
+        return output_hash
+
+    # Upload before taking the ref, so a failed upload leaves no ref behind.
+    await upload_blob(source, output_hash)
+    await create_blob_ref(output_hash, length, expire_at)
+
+    # A collection that finished between the upload and the ref may have
+    # deleted a copy the upload found in place; the ref now protects the blob,
+    # so write it again.
+    if not await get_async_db().fs.files.find_one({"_id": output_hash}, {"_id": 1}):
+        try:
+            await upload_blob(source, output_hash)
+        except Exception:
+            await release_blob(output_hash)
+            raise
+
+    return output_hash
+
+
+async def upload_blob(source, output_hash):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    try:
+        await get_async_fs().upload_from_stream_with_id(
+            output_hash, output_hash, source
+        )
+    except FileExists:
+        pass
+
+
+async def create_blob_ref(output_hash, length, expire_at):
+    # A ref being collected cannot be taken over; the upsert then collides
+    # with it, so wait for the collection to finish and create a new one.
+    for _ in range(COLLECT_RETRIES):
+        try:
+            await get_async_db().blobRefs.update_one(
+                {"_id": output_hash, "collecting": {"$ne": True}},
+                {
+                    "$inc": {"refs": 1},
+                    "$max": {"expireAt": expire_at},
+                    "$setOnInsert": {"length": length, "createdAt": datetime.utcnow()},
+                },
+                upsert=True,
+            )
+            return
+        except DuplicateKeyError:
+            await asyncio.sleep(COLLECT_WAIT)
+    raise RuntimeError(f"Blob {output_hash} is still being collected")
+
+
+async def release_blob(output_hash):
+    await get_async_db().blobRefs.update_one(
+        {"_id": output_hash}, {"$inc": {"refs": -1}}
+    )
+
+
+async def open_blob(output_hash):
+    try:
+        grid_out = await get_async_fs().open_download_stream(output_hash)
+    except NoFile:
+        return None
+    return grid_out
+
+
+async def stream_blob(grid_out, start=0, length=None):
+    # Yield the blob one GridFS chunk at a time instead of reading it whole,
+    # optionally limited to the byte range [start, start + length).
+    if start:
+        grid_out.seek(start)
+    remaining = grid_out.length - start if length is None else length
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
+def read_blob(output_hash):
+    try:
+        return fs.get(output_hash).read()
+    except NoFile:
+        return None
+
+
+async def collect_blob_garbage(batch_size=1000):
+    async_db = get_async_db()
+    async_fs = get_async_fs()
+    current_time = datetime.utcnow()
+    # Refs left collecting by an interrupted pass are finished as well.
+    collectable = {
+        "$or": [
+            {"refs": {"$lte": 0}},
+            {"expireAt": {"$lt": current_time}},
+            {"collecting": True},
+        ]
+    }
+
+    collected = 0
+    cursor = async_db.blobRefs.find(collectable, {"_id": 1}).limit(batch_size)
+    async for ref in cursor:
+        # Re-check while marking so a blob acquired meanwhile is kept. Once
+        # marked, neither acquire_blob nor put_blob_stream can take the ref,
+        # so the file is deleted before the ref goes.
+        marked = await async_db.blobRefs.find_one_and_update(
+            {"_id": ref["_id"], **collectable}, {"$set": {"collecting": True}}
+        )
+        if marked is None:
+            continue
+        try:
+            await async_fs.delete(ref["_id"])
+        except NoFile:
+            pass
+        await async_db.blobRefs.delete_one({"_id": ref["_id"], "collecting": True})
+        collected += 1
+
+    return collected
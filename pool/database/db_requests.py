@@ -1,52 +1,38 @@
 from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+import uuid_utils as uuid
+
 from database.mongodb import (
     userStats,
     entityOwners,
-    miners,
-    AiTask,
-    ResponseTask,
     userTxReference,
+    rewardHistory,
+    get_async_db,
 )
-from reward_logic.percentage import round_up_decimal_new
+from database.migrations import LEGACY_TIMESTAMP
+from reward_logic.fixed_point import to_units, from_units, format_units
+from reward_logic.ledger import OWNER_ACCOUNT, debit_account, account_history
 from transaction.payment import add_transaction_to_batch
-import base64
-from bson.binary import Binary
+from utils.cache import MISSING, whitelist_cache
 
 from decimal import Decimal, InvalidOperation
 
 
-def check_active_users(batch_size=1000):
-    current_time = datetime.utcnow()
-    active_user_count = 0
-
-    try:
-
-        cursor = userStats.find({}, {"last_active_time": 1}).batch_size(batch_size)
-
-        for user in cursor:
-            last_active_time = user["last_active_time"]
-            if (current_time - last_active_time) < timedelta(minutes=15):
-                active_user_count += 1
-
-        return active_user_count
-    except Exception as e:
-        raise e
-    finally:
-
-        cursor.close()
-
-
 def get_balance_from_wallet(wallet_address):
     try:
         print("wallet_address", wallet_address)
-        user = userStats.find_one({"wallet_address": wallet_address}, {"balance": 1})
+        user = userStats.find_one(
+            {"wallet_address": wallet_address}, {"balance_units": 1}
+        )
         print("user", user)
         if user is None:
             return "Error: Wallet address not found."
 
-        balance = user.get("balance")
+        balance = user.get("balance_units")
         if balance is not None:
-            return balance
+            return from_units(balance)
         else:
             return "Error: Balance not found for the given wallet address."
     except Exception as e:
@@ -56,12 +42,14 @@ def get_balance_from_wallet(wallet_address):
 def get_balance_poolowner():
     try:
         # Find the document with the _id "entityOwners"
-        pool_owner_data = entityOwners.find_one({"_id": "entityOwners"}, {"amount": 1})
+        pool_owner_data = entityOwners.find_one(
+            {"_id": "entityOwners"}, {"amount_units": 1}
+        )
 
         if pool_owner_data:
-            balance = pool_owner_data.get("amount")
+            balance = pool_owner_data.get("amount_units")
             if balance is not None:
-                return balance
+                return from_units(balance)
             else:
                 return "Error: Balance not found for the pool owner."
         else:
@@ -86,42 +74,32 @@ def deduct_balance_from_wallet(wallet_address, amount_to_deduct):
         except InvalidOperation:
             return None, "Error: Invalid deduction amount format."
 
-        # Find the document with the given wallet address
-        user = userStats.find_one({"wallet_address": wallet_address}, {"balance": 1})
-
-        if user is None:
-            return None, "Error: Wallet address not found."
-
-        balance = Decimal(user.get("balance", 0))
-        balance = round_up_decimal_new(balance)
-        if balance is None or balance < Decimal("0.001"):
-            return None, "Error: Insufficient balance for deduction."
+        amount_to_deduct = to_units(amount_to_deduct)
 
-        # Calculate the new balance
-        new_balance = balance - amount_to_deduct
+        # Book the debit and take it off the balance only if it covers it, so
+        # concurrent requests cannot overdraw the wallet. The ledger entry and
+        # the queued withdrawal share the same id.
+        withdrawal_id = str(uuid.uuid4())
+        user = debit_account(
+            wallet_address, amount_to_deduct, withdrawal_id, "deduct_user_balance"
+        )
 
-        if new_balance < Decimal("0"):
+        if user is None:
+            user = userStats.find_one(
+                {"wallet_address": wallet_address}, {"balance_units": 1}
+            )
+            if user is None:
+                return None, "Error: Wallet address not found."
+            if user.get("balance_units", 0) < to_units("0.001"):
+                return None, "Error: Insufficient balance for deduction."
             return None, "Error: Deduction amount exceeds current balance."
 
-        new_balance = round_up_decimal_new(new_balance)
-
-        # Update the balance in the database
-        result = userStats.update_one(
-            {"wallet_address": wallet_address},
-            {"$set": {"balance": float(new_balance)}},
+        add_transaction_to_batch(
+            wallet_address, amount_to_deduct, "deduct_user_balance", withdrawal_id
         )
-
-        amount_to_deduct = round_up_decimal_new(amount_to_deduct)
-
-        if result.modified_count == 1:
-            add_transaction_to_batch(
-                wallet_address, float(amount_to_deduct), "deduct_user_balance"
-            )
-            return True, {
-                "message": f"Amount deducted successfully: {amount_to_deduct}"
-            }
-        else:
-            return None, "Error: Failed to update the balance."
+        return True, {
+            "message": f"Amount deducted successfully: {format_units(amount_to_deduct)}"
+        }
 
     except Exception as e:
         return (
@@ -146,50 +124,35 @@ def deduct_balance_from_poolowner(amount_to_deduct):
         except InvalidOperation:
             return None, "Error: Invalid deduction amount format."
 
-        # Find the pool document
-        pool = entityOwners.find_one(
-            {"_id": "entityOwners"}, {"amount": 1, "wallet_address": 1}
+        amount_to_deduct = to_units(amount_to_deduct)
+
+        # Conditional debit of the pool owner's balance, as for wallets.
+        withdrawal_id = str(uuid.uuid4())
+        pool = debit_account(
+            OWNER_ACCOUNT,
+            amount_to_deduct,
+            withdrawal_id,
+            "deduct_pool_balance",
+            {"$set": {"last_processed": datetime.utcnow()}},
         )
 
         if pool is None:
-            return None, "Error: Pool reward not found."
-
-        balance = Decimal(pool.get("amount", 0))
-        balance = round_up_decimal_new(balance)
-        if balance is None or balance < Decimal("0.001"):
-            return None, "Error: Insufficient balance for deduction."
-
-        # Calculate the new balance
-        new_balance = balance - amount_to_deduct
-        if new_balance < 0:
+            pool = entityOwners.find_one({"_id": OWNER_ACCOUNT}, {"amount_units": 1})
+            if pool is None:
+                return None, "Error: Pool reward not found."
+            if pool.get("amount_units", 0) < to_units("0.001"):
+                return None, "Error: Insufficient balance for deduction."
             return None, "Error: Deduction amount exceeds current balance."
 
-        new_balance = round_up_decimal_new(new_balance)
-
-        # Update the balance in the database
-        result = entityOwners.update_one(
-            {"_id": "entityOwners"},
-            {
-                "$set": {
-                    "amount": float(new_balance),
-                    "last_processed": datetime.utcnow(),
-                }
-            },
+        add_transaction_to_batch(
+            pool.get("wallet_address"),
+            amount_to_deduct,
+            "deduct_pool_balance",
+            withdrawal_id,
         )
-
-        amount_to_deduct = round_up_decimal_new(amount_to_deduct)
-
-        if result.modified_count == 1:
-            add_transaction_to_batch(
-                pool.get("wallet_address"),
-                float(amount_to_deduct),
-                "deduct_pool_balance",
-            )
-            return True, {
-                "message": f"Amount deducted successfully: {amount_to_deduct}"
-            }
-        else:
-            return None, "Error: Failed to update the pool balance."
+        return True, {
+            "message": f"Amount deducted successfully: {format_units(amount_to_deduct)}"
+        }
 
     except Exception as e:
         return (
@@ -198,13 +161,17 @@ def deduct_balance_from_poolowner(amount_to_deduct):
         )
 
 
-def white_list(wallet_address):
+async def white_list(wallet_address):
+    registered = whitelist_cache.get(wallet_address)
+    if registered is not MISSING:
+        return registered
     try:
-        registered_miner = miners.find_one({"wallet_address": wallet_address})
-        if registered_miner:
-            return True
-        else:
-            return False
+        registered_miner = await get_async_db().miners.find_one(
+            {"wallet_address": wallet_address}
+        )
+        registered = registered_miner is not None
+        whitelist_cache.set(wallet_address, registered)
+        return registered
     except Exception as e:
         return False, f"Error: {str(e)}"
 
@@ -232,26 +199,29 @@ def white_list(wallet_address):
 #         return False, str(e)
 
 
-def retrieve_image(retrieve_id=None):
+async def retrieve_image(retrieve_id=None):
     if not retrieve_id:
         return False, "retrieve_id parameter is missing."
     try:
-        response_task_doc = ResponseTask.find_one({"retrieve_id": retrieve_id})
+        async_db = get_async_db()
+        response_task_doc = await async_db.ResponseTask.find_one(
+            {"retrieve_id": retrieve_id}
+        )
 
         if response_task_doc:
-            output = response_task_doc.get("output", None)
-            if output is None:
+            output_hash = response_task_doc.get("output_hash", None)
+            if output_hash is None:
                 return False, {
                     "success": False,
                     "error": "Output not found in the document.",
                 }
 
-            if isinstance(output, Binary):
-                output = base64.b64encode(output).decode("utf-8")
-
-            return True, output
+            return True, {
+                "output_hash": output_hash,
+                "expireAt": response_task_doc.get("expireAt"),
+            }
         else:
-            ai_task_doc = AiTask.find_one({"retrieve_id": retrieve_id})
+            ai_task_doc = await async_db.AiTask.find_one({"retrieve_id": retrieve_id})
             if not ai_task_doc:
                 return False, {"success": False, "error": "Image not found or deleted."}
 
@@ -263,44 +233,197 @@ def retrieve_image(retrieve_id=None):
         return False, str(e)
 
 
-def get_latest_transactions(wallet_address, page=1, page_size=10):
+# Largest page the history endpoints serve.
+MAX_PAGE_SIZE = 100
+
+
+def page_size_error(page_size):
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        return f"Invalid page size, must be between 1 and {MAX_PAGE_SIZE}"
+    return None
+
+
+def encode_tx_cursor(transaction):
+    # The position after a transaction in (timestamp, _id) descending order.
+    milliseconds = (transaction["timestamp"] - LEGACY_TIMESTAMP) // timedelta(
+        milliseconds=1
+    )
+    return f"{milliseconds}_{transaction['_id']}"
+
+
+def decode_tx_cursor(cursor):
     try:
-        # Find the document with the given wallet address
-        user_doc = userTxReference.find_one({"wallet_address": wallet_address})
+        milliseconds, last_id = cursor.split("_", 1)
+        return LEGACY_TIMESTAMP + timedelta(milliseconds=int(milliseconds)), ObjectId(
+            last_id
+        )
+    except (ValueError, InvalidId):
+        return None
+
 
-        if not user_doc:
+def get_latest_transactions(wallet_address, page=1, page_size=10, cursor=None):
+    # One document per transaction, read newest first from the
+    # (wallet_address, timestamp, _id) index. With a cursor the page starts
+    # right after the previous one whatever the wallet's history size; page
+    # numbers still work for older clients but skip over the earlier pages.
+    try:
+        error = page_size_error(page_size)
+        if error:
+            return {"error": error}
+        if page < 1:
+            return {"error": "Invalid page, must be at least 1"}
+
+        query = {"wallet_address": wallet_address}
+        if cursor:
+            position = decode_tx_cursor(cursor)
+            if position is None:
+                return {"error": "Invalid cursor"}
+            timestamp, last_id = position
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": last_id}},
+            ]
+
+        results = userTxReference.find(query, {"hash": 1, "timestamp": 1}).sort(
+            [("timestamp", -1), ("_id", -1)]
+        )
+        if not cursor:
+            results = results.skip((page - 1) * page_size)
+        transactions = list(results.limit(page_size + 1))
+
+        if not transactions and not cursor and page == 1:
             return {"error": "Wallet address not found"}
 
-        transactions = user_doc.get("transactions", [])
+        next_cursor = None
+        if len(transactions) > page_size:
+            transactions = transactions[:page_size]
+            next_cursor = encode_tx_cursor(transactions[-1])
 
-        # Separate transactions with and without timestamps
-        transactions_with_time = []
-        transactions_without_time = []
+        result = {
+            "page_size": page_size,
+            "transactions": [
+                {
+                    "hash": transaction["hash"],
+                    "timestamp": (
+                        None
+                        if transaction["timestamp"] == LEGACY_TIMESTAMP
+                        else transaction["timestamp"]
+                    ),
+                }
+                for transaction in transactions
+            ],
+            "next_cursor": next_cursor,
+        }
+        if not cursor:
+            result["page"] = page
+            result["total_transactions"] = userTxReference.count_documents(
+                {"wallet_address": wallet_address}
+            )
+        return result
 
-        for tx in transactions:
-            if isinstance(tx, dict) and "timestamp" in tx:
-                transactions_with_time.append(tx)
-            else:
-                transactions_without_time.append({"hash": tx, "timestamp": None})
+    except Exception as e:
+        return {"error": str(e)}
 
-        # Sort transactions with time by timestamp in descending order
-        transactions_with_time.sort(key=lambda x: x["timestamp"], reverse=True)
 
-        # Combine both lists (transactions without time come last)
-        sorted_transactions = transactions_with_time + transactions_without_time
+def get_balance_history(wallet_address, page_size=10, cursor=None):
+    # Ledger entries of the wallet, newest first, each with the balance after
+    # it. The cursor is the _id of the last entry of the previous page.
+    try:
+        error = page_size_error(page_size)
+        if error:
+            return {"error": error}
+
+        before = None
+        if cursor:
+            try:
+                before = ObjectId(cursor)
+            except InvalidId:
+                return {"error": "Invalid cursor"}
+
+        entries = account_history(wallet_address, page_size + 1, before)
+        if not entries and not cursor:
+            return {"error": "Wallet address not found"}
+
+        next_cursor = None
+        if len(entries) > page_size:
+            entries = entries[:page_size]
+            next_cursor = str(entries[-1]["_id"])
+
+        return {
+            "page_size": page_size,
+            "entries": [
+                {
+                    "type": entry["type"],
+                    "ref": entry["ref"],
+                    "amount": from_units(entry["amount_units"]),
+                    "balance": from_units(entry["balance_units"]),
+                    "timestamp": entry["timestamp"],
+                }
+                for entry in entries
+            ],
+            "next_cursor": next_cursor,
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def reward_history_row(row):
+    # The row as returned by the API, without its internal fields.
+    return {
+        key: value for key, value in row.items() if key not in ("_id", "wallet_address")
+    }
+
+
+def get_reward_history(wallet_address, page_size=10, cursor=None, since=None):
+    # One row per block range the wallet was rewarded in, newest first, read
+    # from the (wallet_address, timestamp, _id) index and paged with the same
+    # cursors as get_latest_transactions.
+    try:
+        error = page_size_error(page_size)
+        if error:
+            return {"error": error}
+
+        query = {"wallet_address": wallet_address}
+        if since is not None:
+            query["timestamp"] = {"$gte": since}
+        if cursor:
+            position = decode_tx_cursor(cursor)
+            if position is None:
+                return {"error": "Invalid cursor"}
+            timestamp, last_id = position
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": last_id}},
+            ]
+
+        rows = list(
+            rewardHistory.find(query)
+            .sort([("timestamp", -1), ("_id", -1)])
+            .limit(page_size + 1)
+        )
+        if not rows and not cursor and since is None:
+            return {"error": "Wallet address not found"}
 
-        # Paginate the results
-        total_transactions = len(sorted_transactions)
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_transactions = sorted_transactions[start_index:end_index]
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_tx_cursor(rows[-1])
 
         return {
-            "page": page,
             "page_size": page_size,
-            "total_transactions": total_transactions,
-            "transactions": paginated_transactions,
+            "rewards": [reward_history_row(row) for row in rows],
+            "next_cursor": next_cursor,
         }
 
     except Exception as e:
         return {"error": str(e)}
+
+
+def iter_reward_history(wallet_address, since=None):
+    # Every row of the wallet, newest first, streamed from the cursor.
+    query = {"wallet_address": wallet_address}
+    if since is not None:
+        query["timestamp"] = {"$gte": since}
+    for row in rewardHistory.find(query).sort([("timestamp", -1), ("_id", -1)]):
+        yield reward_history_row(row)
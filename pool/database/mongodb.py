@@ -1,7 +1,10 @@
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, OperationFailure
+from motor.motor_asyncio import AsyncIOMotorClient
 from utils.layout import base
+import asyncio
 import logging
+import weakref
 import gridfs
 
 logger = logging.getLogger("pymongo")
@@ -27,6 +30,21 @@ def get_db_connection():
     return client.pooldb
 
 
+# Motor clients are bound to the event loop they were created on, and the pool
+# runs the websocket servers and FastAPI on separate loops, so one client is
+# kept per running loop.
+async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_db():
+    loop = asyncio.get_running_loop()
+    client = async_clients.get(loop)
+    if client is None:
+        client = AsyncIOMotorClient(base["MONGOD_DB"]["MONGO_URL"], io_loop=loop)
+        async_clients[loop] = client
+    return client.pooldb
+
+
 # Initialize the connection
 db = get_db_connection()
 fs = gridfs.GridFS(db)
@@ -42,6 +60,7 @@ submittedTransactions = db.submittedTransactions
 userTxReference = db.userTxReference
 verifiedTransactions = db.verifiedTransactions
 rewardLog = db.rewardLog
+rewardHistory = db.rewardHistory
 entityOwners = db.entityOwners
 blockHeight = db.blockHeight
 blockTransactions = db.blockTransactions
@@ -55,9 +74,129 @@ ResponseTask = db.ResponseTask
 ValidationTask = db.ValidationTask
 ValidationTaskHistory = db.ValidationTaskHistory
 
+# rewards
+scoreEpochs = db.scoreEpochs
+epochTotals = db.epochTotals
+rewardState = db.rewardState
+ledger = db.ledger
+
+# blobs
+blobRefs = db.blobRefs
+pendingUploads = db.pendingUploads
+
 
 try:
     ResponseTask.create_index([("expireAt", 1)], expireAfterSeconds=0)
     print("TTL index created successfully on ResponseTask collection.")
 except Exception as e:
     print(f"An error occurred while creating TTL index: {e}")
+
+# How long a completed AiTask is kept, enforced by the TTL index on completedAt.
+COMPLETED_TASK_TTL = int(base["TIME"]["COMPLETED_TASK_TTL"])
+
+try:
+    try:
+        AiTask.create_index([("completedAt", 1)], expireAfterSeconds=COMPLETED_TASK_TTL)
+    except OperationFailure as e:
+        # IndexOptionsConflict: the index exists with an older TTL.
+        if e.code != 85:
+            raise
+        db.command(
+            "collMod",
+            AiTask.name,
+            index={
+                "keyPattern": {"completedAt": 1},
+                "expireAfterSeconds": COMPLETED_TASK_TTL,
+            },
+        )
+    print("TTL index created successfully on AiTask collection.")
+except Exception as e:
+    print(f"An error occurred while creating TTL index: {e}")
+
+try:
+    # Superseded by the sched_tag claim index and the (status, priority) count index.
+    if "status_1_priority_1_time_1" in AiTask.index_information():
+        AiTask.drop_index("status_1_priority_1_time_1")
+        print("Dropped unused status_1_priority_1_time_1 index on AiTask collection.")
+except Exception as e:
+    print(f"An error occurred while dropping the old task claim index: {e}")
+
+try:
+    AiTask.create_index([("status", 1), ("sched_tag", 1), ("time", 1), ("_id", 1)])
+    AiTask.create_index([("status", 1), ("lease_expires_at", 1)])
+    # Claims sort on sched_tag; priority is only counted by the reservoir.
+    AiTask.create_index([("status", 1), ("priority", 1)])
+    AiTask.create_index([("wallet", 1), ("status", 1)])
+    AiTask.create_index([("id", 1)])
+    AiTask.create_index([("retrieve_id", 1)])
+    ResponseTask.create_index([("retrieve_id", 1)])
+    print("Task claim indexes created successfully on AiTask collection.")
+except Exception as e:
+    print(f"An error occurred while creating task claim indexes: {e}")
+
+try:
+    ValidationTask.create_index([("task1.val_id", 1)], unique=True)
+    ValidationTask.create_index([("task1.condition", 1), ("task1.createdAt", 1)])
+    ValidationTask.create_index([("task1.array.id", 1)])
+    ValidationTaskHistory.create_index([("val_id", 1)])
+    print("Validation round indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating validation round indexes: {e}")
+
+try:
+    userStats.create_index([("wallet_address", 1)])
+    userStats.create_index([("last_active_time", 1)])
+    print("Index created successfully on userStats collection.")
+except Exception as e:
+    print(f"An error occurred while creating userStats index: {e}")
+
+try:
+    scoreEpochs.create_index([("epoch", 1), ("wallet_address", 1)], unique=True)
+    scoreEpochs.create_index([("expireAt", 1)], expireAfterSeconds=0)
+    epochTotals.create_index([("expireAt", 1)], expireAfterSeconds=0)
+    print("Score epoch indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating score epoch indexes: {e}")
+
+try:
+    ledger.create_index([("account", 1), ("ref", 1)], unique=True)
+    ledger.create_index([("account", 1), ("_id", -1)])
+    ledger.create_index([("applied", 1)], partialFilterExpression={"applied": False})
+    print("Ledger indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating ledger indexes: {e}")
+
+try:
+    blobRefs.create_index([("expireAt", 1)])
+    blobRefs.create_index([("refs", 1)])
+    blobRefs.create_index([("collecting", 1)], sparse=True)
+    print("Blob reference indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating blob reference indexes: {e}")
+
+try:
+    pendingUploads.create_index([("status", 1), ("not_before", 1)])
+    pendingUploads.create_index([("status", 1), ("claimed_at", 1)])
+    pendingUploads.create_index([("receipt_id", 1)], unique=True)
+    pendingUploads.create_index([("expireAt", 1)], expireAfterSeconds=0)
+    print("Upload queue indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating upload queue indexes: {e}")
+
+
+try:
+    userTxReference.create_index(
+        [("wallet_address", 1), ("timestamp", -1), ("_id", -1)]
+    )
+    errorTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    catchTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    print("Transaction history indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating transaction history indexes: {e}")
+
+try:
+    rewardHistory.create_index([("wallet_address", 1), ("block_range", 1)], unique=True)
+    rewardHistory.create_index([("wallet_address", 1), ("timestamp", -1), ("_id", -1)])
+    print("Reward history indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating reward history indexes: {e}")
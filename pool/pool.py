@@ -13,7 +13,26 @@ from utils.layout import base
 from reward_logic.process_blocks import process_block_rewards
 from protocol.protocol import miner_protocol
 from transaction.batch import process_all_transactions
-from task.task import generate_validation_task, delete_old_completed_tasks
+from task.task import (
+    generate_validation_task,
+    delete_old_completed_tasks,
+    backfill_task_priority,
+    backfill_completed_at,
+)
+from task.reservoir import replenish_reservoir
+from task.scheduler import backfill_sched_tags
+from task.leases import backfill_leases, reap_expired_leases
+from database.migrations import (
+    migrate_transaction_history,
+    migrate_float_amounts,
+    migrate_reward_history,
+)
+from reward_logic.score_epochs import migrate_legacy_scores
+from reward_logic.ledger import open_ledger, audit_ledger
+from database.blob_store import collect_blob_garbage
+from database.archive import archive_collections
+from task.uploads import accept_due_uploads
+from task.score_buffer import flush_scores
 
 
 logging.basicConfig(
@@ -60,6 +79,61 @@ async def periodic_delete_completed_task():
         print(f"Error in periodic_delete_completed_task: {e}")
 
 
+async def periodic_replenish_reservoir():
+    try:
+        while True:
+            success, inserted = await replenish_reservoir()
+            if success and inserted:
+                logging.info(f"Added {inserted} tasks to the reservoir.")
+            await asyncio.sleep(base["TIME"]["RESERVOIR_REFILL"])
+    except Exception as e:
+        print(f"Error in periodic_replenish_reservoir: {e}")
+
+
+async def periodic_collect_blob_garbage():
+    try:
+        while True:
+            collected = await collect_blob_garbage()
+            if collected:
+                logging.info(f"Collected {collected} unreferenced blobs.")
+            await asyncio.sleep(base["TIME"]["BLOB_GC"])
+    except Exception as e:
+        print(f"Error in periodic_collect_blob_garbage: {e}")
+
+
+async def periodic_accept_uploads():
+    try:
+        while True:
+            success, processed = await accept_due_uploads()
+            if success and processed:
+                logging.info(f"Processed {processed} queued uploads.")
+            await asyncio.sleep(base["TIME"]["UPLOAD_POLL"])
+    except Exception as e:
+        print(f"Error in periodic_accept_uploads: {e}")
+
+
+async def periodic_reap_leases():
+    try:
+        while True:
+            success, reaped = await reap_expired_leases()
+            if success and reaped:
+                logging.info(
+                    f"Returned {reaped} tasks with expired leases to the queue."
+                )
+            await asyncio.sleep(base["TIME"]["LEASE_REAP"])
+    except Exception as e:
+        print(f"Error in periodic_reap_leases: {e}")
+
+
+async def periodic_flush_scores():
+    try:
+        while True:
+            await flush_scores()
+            await asyncio.sleep(base["TIME"]["SCORE_FLUSH"])
+    except Exception as e:
+        print(f"Error in periodic_flush_scores: {e}")
+
+
 def update_balance_periodically():
     try:
         while True:
@@ -69,7 +143,28 @@ def update_balance_periodically():
         print(f"Error in update_balance_periodically: {e}")
 
 
+def archive_periodically():
+    try:
+        while True:
+            success, archived = archive_collections()
+            if success and any(archived.values()):
+                logging.info(f"Archived {sum(archived.values())} documents: {archived}")
+            time.sleep(base["ARCHIVE"]["INTERVAL"])
+    except Exception as e:
+        print(f"Error in archive_periodically: {e}")
+
+
 async def main():
+    backfill_task_priority()
+    backfill_sched_tags()
+    backfill_leases()
+    backfill_completed_at()
+    migrate_transaction_history()
+    migrate_float_amounts()
+    open_ledger()
+    audit_ledger()
+    migrate_reward_history()
+    migrate_legacy_scores()
     start_server = websockets.serve(
         miner_protocol,
         base["POOL_MAIN_SOCKET"]["IP"],
@@ -81,14 +176,28 @@ async def main():
     await asyncio.sleep(1)
     balance_thread = threading.Thread(target=update_balance_periodically, daemon=True)
     balance_thread.start()
+    archive_thread = threading.Thread(target=archive_periodically, daemon=True)
+    archive_thread.start()
 
     periodic_task = asyncio.create_task(periodic_process_transactions())
     periodic_validation_task = asyncio.create_task(periodic_gen_validation_task())
     periodic_delete_task = asyncio.create_task(periodic_delete_completed_task())
+    periodic_reservoir_task = asyncio.create_task(periodic_replenish_reservoir())
+    periodic_blob_task = asyncio.create_task(periodic_collect_blob_garbage())
+    periodic_upload_task = asyncio.create_task(periodic_accept_uploads())
+    periodic_lease_task = asyncio.create_task(periodic_reap_leases())
+    periodic_score_task = asyncio.create_task(periodic_flush_scores())
 
     try:
         await asyncio.gather(
-            periodic_task, periodic_validation_task, periodic_delete_task
+            periodic_task,
+            periodic_validation_task,
+            periodic_delete_task,
+            periodic_reservoir_task,
+            periodic_blob_task,
+            periodic_upload_task,
+            periodic_lease_task,
+            periodic_score_task,
         )
     except KeyboardInterrupt:
         logging.info("Shutting down Pool due to KeyboardInterrupt.")
@@ -97,12 +206,24 @@ async def main():
         periodic_task.cancel()
         periodic_validation_task.cancel()
         periodic_delete_task.cancel()
+        periodic_reservoir_task.cancel()
+        periodic_blob_task.cancel()
+        periodic_upload_task.cancel()
+        periodic_lease_task.cancel()
+        periodic_score_task.cancel()
         await asyncio.gather(
             periodic_task,
             periodic_validation_task,
             periodic_delete_task,
+            periodic_reservoir_task,
+            periodic_blob_task,
+            periodic_upload_task,
+            periodic_lease_task,
+            periodic_score_task,
             return_exceptions=True,
         )
+        # Write out score increments gathered since the last flush
+        await flush_scores()
         logging.info("Pool shutdown process complete.")
 
 
@@ -14,9 +14,12 @@ from task.task import (
     miner_eligibility,
     task_validation_output,
     find_task,
+    find_tasks,
+    task_fields,
 )
 from database.db_requests import white_list
 from utils.layout import base
+from utils.cache import MISSING, address_cache
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
@@ -27,8 +30,25 @@ validator_connections = set()
 MAX_CONCURRENT_MINERS = base["MAX_CONCURRENT"]["MINERS"]
 MAX_CONCURRENT_VALIDATORS = base["MAX_CONCURRENT"]["VALIDATORS"]
 
+# Miners in session mode authenticate once and are pushed a task each time
+# they send "idle". Eligibility is checked again every SESSION_RECHECK seconds
+# so a ban still ends a long session, and when no task is available the pool
+# retries every SESSION_RETRY seconds, up to SESSION_MAX_RETRIES times, instead
+# of answering with an error straight away.
+SESSION_RECHECK = base["SESSION"]["RECHECK"]
+SESSION_RETRY = base["SESSION"]["RETRY"]
+SESSION_MAX_RETRIES = base["SESSION"]["MAX_RETRIES"]
+
 
 def is_valid_address(address: str) -> bool:
+    valid = address_cache.get(address)
+    if valid is MISSING:
+        valid = check_address(address)
+        address_cache.set(address, valid)
+    return valid
+
+
+def check_address(address: str) -> bool:
     try:
         _ = bytes.fromhex(address)
         return len(address) == 128
@@ -49,6 +69,32 @@ def is_valid_address(address: str) -> bool:
         return False
 
 
+async def next_session_task(websocket, wallet_address, count=None):
+    # None once the miner has disconnected or no task came up in time.
+    for _ in range(SESSION_MAX_RETRIES):
+        if websocket.closed:
+            return None
+        if count is not None:
+            tasks = await find_tasks(wallet_address, count)
+            if tasks:
+                return [task_fields(task) for task in tasks]
+        else:
+            task_id, task_details = await find_task(wallet_address)
+            if task_id and task_details:
+                return task_details
+        await asyncio.sleep(SESSION_RETRY)
+    return None
+
+
+def requested_count(parsed_message):
+    # Miners with several GPUs send "count" to receive a list of tasks instead
+    # of a single one.
+    count = parsed_message.get("count")
+    if isinstance(count, int) and not isinstance(count, bool) and count > 0:
+        return count
+    return None
+
+
 async def miner_protocol(websocket):
     global active_connections
     num_active_connections = len(active_connections)
@@ -57,6 +103,8 @@ async def miner_protocol(websocket):
         await websocket.close(reason="ERROR: Max connection limit reached")
         return
     active_connections.add(websocket)
+    session_wallet = None
+    session_checked_at = 0
     try:
         async for message in websocket:
             try:
@@ -74,13 +122,17 @@ async def miner_protocol(websocket):
                     continue
 
                 if base["WHITE_LIST"]["ACTIVE"] == "True":
-                    if wallet_address is not None and not white_list(wallet_address):
+                    if wallet_address is not None and not await white_list(
+                        wallet_address
+                    ):
                         await websocket.send("ERROR: You are not a registered miner")
                         await websocket.close()
                         active_connections.discard(websocket)
                         continue
 
-                if wallet_address is not None and not miner_eligibility(wallet_address):
+                if wallet_address is not None and not await miner_eligibility(
+                    wallet_address
+                ):
                     await websocket.send(
                         "ERROR: You are banned from mining, too high negative score"
                     )
@@ -88,7 +140,20 @@ async def miner_protocol(websocket):
                     active_connections.discard(websocket)
                     continue
 
-                if message_type == "request":
+                if message_type == "request" and requested_count(parsed_message):
+                    tasks = await find_tasks(
+                        wallet_address, requested_count(parsed_message)
+                    )
+                    if tasks:
+                        await websocket.send(
+                            json.dumps([task_fields(task) for task in tasks])
+                        )
+                    else:
+                        await websocket.send("ERROR: No task found!")
+                    await websocket.close()
+                    active_connections.discard(websocket)
+
+                elif message_type == "request":
                     task_id, task_details = await find_task(wallet_address)
                     if task_id and task_details:
                         # print(f"Found task: {task_id} - {task_details}")
@@ -101,6 +166,45 @@ async def miner_protocol(websocket):
                         await websocket.close()
                         active_connections.discard(websocket)
 
+                elif message_type == "session":
+                    # The checks above ran for this wallet, later "idle"
+                    # messages are served without repeating them
+                    if wallet_address is None:
+                        await websocket.send("ERROR: Invalid wallet address")
+                        await websocket.close()
+                        active_connections.discard(websocket)
+                        continue
+                    session_wallet = wallet_address
+                    session_checked_at = time.monotonic()
+                    await websocket.send("SUCCESS: session started")
+
+                elif message_type == "idle":
+                    if session_wallet is None:
+                        await websocket.send("ERROR: No session started")
+                        await websocket.close()
+                        active_connections.discard(websocket)
+                        continue
+
+                    if time.monotonic() - session_checked_at > SESSION_RECHECK:
+                        if not await miner_eligibility(session_wallet):
+                            await websocket.send(
+                                "ERROR: You are banned from mining, too high negative score"
+                            )
+                            await websocket.close()
+                            active_connections.discard(websocket)
+                            continue
+                        session_checked_at = time.monotonic()
+
+                    task_details = await next_session_task(
+                        websocket, session_wallet, requested_count(parsed_message)
+                    )
+                    if task_details is None:
+                        if websocket.closed:
+                            break
+                        await websocket.send("ERROR: No task found!")
+                    else:
+                        await websocket.send(json.dumps(task_details))
+
                 elif message_type == "PING":
                     await websocket.send("SUCCESS: pong")
                 else:
@@ -148,7 +252,7 @@ async def validation_protocol(websocket):
                     validator_connections.discard(websocket)
                     continue
 
-                if val_id is not None and not is_task_valid(val_id):
+                if val_id is not None and not await is_task_valid(val_id):
                     await websocket.send("ERROR: task is invalid or expired")
                     await websocket.close()
                     validator_connections.discard(websocket)
@@ -162,11 +266,11 @@ async def validation_protocol(websocket):
                         np = entry.get("np")
 
                         if tp is not None:
-                            success, message = task_validation_output(
+                            success, message = await task_validation_output(
                                 wallet_address, tp=tp
                             )
                         elif np is not None:
-                            success, message = task_validation_output(
+                            success, message = await task_validation_output(
                                 wallet_address, np=np
                             )
                         else:
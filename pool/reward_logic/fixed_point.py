@@ -0,0 +1,59 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from bson.int64 import Int64
+
+# Amounts are whole numbers of base units, 1e-8 of a coin, stored as int64.
+# They are converted once on the way in (block outputs, API requests, legacy
+# float fields) and once on the way out (transaction amounts, API responses),
+# and all reward and payout arithmetic in between is exact integer math.
+UNITS_PER_COIN = 10**8
+
+
+def to_units(amount):
+    # Floats go through str so 0.1 becomes 10000000 units rather than the
+    # nearest value of its binary expansion.
+    return Int64(
+        (Decimal(str(amount)) * UNITS_PER_COIN).quantize(
+            Decimal(1), rounding=ROUND_HALF_EVEN
+        )
+    )
+
+
+def from_units(units):
+    return Decimal(int(units)).scaleb(-8)
+
+
+def format_units(units):
+    return f"{from_units(units):.8f}"
+
+
+def apportion(total_units, weights):
+    # Largest-remainder split of total_units in proportion to weights: every
+    # share is rounded down, then the units left over go one each to the
+    # largest remainders, earlier weights first on ties. The shares always add
+    # up to total_units exactly.
+    # Integer weights are used as they are, others are scaled to base units
+    # first so the arithmetic stays exact.
+    weights = list(weights)
+    if not all(type(weight) is int for weight in weights):
+        weights = [int(to_units(weight)) for weight in weights]
+    total_weight = sum(weights)
+    if total_weight <= 0:
+        return [Int64(0)] * len(weights)
+
+    shares = []
+    remainders = []
+    for weight in weights:
+        share, remainder = divmod(int(total_units) * weight, total_weight)
+        shares.append(share)
+        remainders.append(remainder)
+
+    # sorted is stable, so equal remainders keep their order.
+    leftover = int(total_units) - sum(shares)
+    if leftover:
+        by_remainder = sorted(
+            range(len(weights)), key=remainders.__getitem__, reverse=True
+        )
+        for index in by_remainder[:leftover]:
+            shares[index] += 1
+    return [Int64(share) for share in shares]
@@ -2,8 +2,18 @@ import logging
 import json
 from datetime import datetime
 from reward_logic.reward_log import store_in_db, retrieve_from_db
-from reward_logic.percentage import round_up_decimal_new
-from database.mongodb import userStats
+from reward_logic.fixed_point import apportion, from_units
+from reward_logic.ledger import ledger_entry, credit_accounts
+from reward_logic.score_epochs import (
+    claim_epochs,
+    pending_claim,
+    finish_claim,
+    exclude_from_claim,
+    carry_amount,
+    epoch_total,
+    epoch_scores,
+)
+from task.score_buffer import record_activity
 from decimal import Decimal
 
 logging.basicConfig(
@@ -23,54 +33,103 @@ def convert_decimal_to_float(data):
 
 
 def update_miner_balances(amount, block_range, batch_size=1000):
-    amount = Decimal(amount)
-    miner_updates = {}
-
+    # amount is in base units.
+    claimed = False
     try:
-        total_score = Decimal(0)
-        cursor = userStats.find({"score": {"$gt": 0}})
-        filtered_miners = []
-
-        # Calculate total score
-        for miner_data in cursor:
-            score = Decimal(miner_data.get("score", 0))
-            filtered_miners.append(miner_data)
-            total_score += score
-
-        if total_score == 0:
-            logging.info("No miners have a positive score; no balances updated.")
-            return
+        # A payout interrupted before it finished is completed first. Its
+        # credits are booked under the same ledger refs, so the ones already
+        # written are skipped.
+        claim = pending_claim()
+        if claim is not None:
+            logging.info(
+                f"Resuming the payout of epochs {claim['first']}-{claim['last']}."
+            )
+            pay_claim(claim, batch_size)
 
-        # Process miners in batches
-        for i in range(0, len(filtered_miners), batch_size):
-            batch = filtered_miners[i : i + batch_size]
-            for miner_data in batch:
-                previous_balance = Decimal(miner_data.get("balance", 0))
-                score = Decimal(miner_data.get("score", 0))
-                miner_share = (score / total_score) * amount
-                miner_share = round_up_decimal_new(miner_share)
-                current_balance = round_up_decimal_new(previous_balance + miner_share)
-
-                # Update the miner's document in MongoDB (convert Decimal to float)
-                result = userStats.update_one(
-                    {"wallet_address": miner_data["wallet_address"]},
-                    {"$set": {"balance": float(current_balance), "score": 0}},
-                )
-
-                miner_updates[miner_data["wallet_address"]] = {
-                    "previous_balance": float(previous_balance),
-                    "score": float(score),
-                    "added_amount": float(miner_share),
-                    "current_balance": float(current_balance),
-                }
-
-        # Convert all Decimal values to float before storing
-        miner_updates = convert_decimal_to_float(miner_updates)
-
-        # Store updates in the DB (external function)
-        store_in_db(block_range, miner_updates)
-
-        logging.info("Balances updated and scores are reset.")
+        claim = claim_epochs(amount, block_range)
+        claimed = True
+        if claim is None:
+            carry_amount(amount)
+            logging.info(
+                "No reward epoch closed since the last payout; reward carried over."
+            )
+            return
+        pay_claim(claim, batch_size)
 
     except Exception as e:
         logging.error(f"update_miner_balances An unexpected error occurred: {e}")
+        if not claimed:
+            carry_amount(amount)
+
+
+def pay_claim(claim, batch_size=1000):
+    miner_updates = {}
+    first_epoch, last_epoch = claim["first"], claim["last"]
+    amount = claim["amount_units"]
+
+    total_score = epoch_total(first_epoch, last_epoch)
+    if total_score == 0:
+        finish_claim(claim, amount)
+        logging.info("No miners have a positive score; reward carried over.")
+        return
+
+    # Sum each miner's score over the claimed epochs on the server, split
+    # the reward in base units by largest remainder so the shares add up
+    # to it exactly, and book them as ledger credits in bulk. Closed
+    # epochs are never written again, so there is nothing to reset, and a
+    # resumed claim computes the same shares under the same ref.
+    ref = f"miner_epochs_{first_epoch}_{last_epoch}"
+    wallets = []
+    scores = []
+    for miner_data in epoch_scores(first_epoch, last_epoch):
+        wallets.append(miner_data["_id"])
+        scores.append(miner_data["score"])
+    shares = apportion(amount, scores)
+
+    # Wallets an interrupted run could not credit were paid through the open
+    # epoch instead; they still take part in apportion so the other shares
+    # come out the same.
+    excluded = set(claim.get("excluded", []))
+    entries = []
+    failed = []
+    for wallet_address, score, miner_share in zip(wallets, scores, shares):
+        if miner_share == 0 or wallet_address in excluded:
+            continue
+        entries.append(ledger_entry(wallet_address, miner_share, ref, "miner_reward"))
+        miner_updates[wallet_address] = {
+            "score": float(score),
+            "added_amount": float(from_units(miner_share)),
+        }
+
+        if len(entries) == batch_size:
+            failed += write_balances(entries, miner_updates, claim)
+            entries = []
+    if entries:
+        failed += write_balances(entries, miner_updates, claim)
+
+    if failed:
+        logging.error(
+            f"{len(failed)} balance updates failed, their scores carry over to the next epoch."
+        )
+
+    # Store updates in the DB (external function)
+    store_in_db(claim["block_range"], miner_updates)
+    finish_claim(claim)
+
+    logging.info(f"Balances updated for epochs {first_epoch}-{last_epoch}.")
+
+
+def write_balances(entries, miner_updates, claim):
+    # Returns the wallets whose credit could not be booked. They are excluded
+    # from the claim before their scores go back into the open epoch, so a
+    # resumed payout cannot pay them twice, and they are dropped from the log.
+    # Credits booked but not yet applied are finished by the ledger.
+    failed = [
+        entry["account"]
+        for entry in credit_accounts(entries, {"$setOnInsert": {"tp": 50, "np": 0}})
+    ]
+    if failed:
+        exclude_from_claim(claim, failed)
+    for wallet_address in failed:
+        record_activity(wallet_address, miner_updates.pop(wallet_address)["score"])
+    return failed
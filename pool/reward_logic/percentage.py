@@ -1,5 +1,6 @@
 from decimal import Decimal
 from utils.layout import base
+from reward_logic.fixed_point import apportion
 import logging
 
 # Configure logging
@@ -37,8 +38,8 @@ def percentage_match():
         return False
 
 
-def calculate_percentages(total_amount):
-    total_amount = Decimal(total_amount)
+def calculate_percentages(total_units):
+    # Splits a reward in base units; the parts always add up to the total.
 
     fee_key = base["AWARD_SYSTEM"]["FEE"]
     reward_key = base["AWARD_SYSTEM"]["MINER_REWARD"]
@@ -51,11 +52,9 @@ def calculate_percentages(total_amount):
     if total_percentage != Decimal("100"):
         return False
 
-    fee_percentage /= Decimal("100")
-    reward_percentage /= Decimal("100")
-
-    percentages = {"18%": 0, "82%": 0}
-    percentages["18%"] = round_up_decimal_new(total_amount * fee_percentage)
-    percentages["82%"] = round_up_decimal_new(total_amount * reward_percentage)
+    fee_units, reward_units = apportion(
+        total_units, [fee_percentage, reward_percentage]
+    )
+    percentages = {"18%": fee_units, "82%": reward_units}
 
     return percentages
@@ -2,8 +2,7 @@ import logging
 import json
 from datetime import datetime
 from reward_logic.reward_log import store_in_db, retrieve_from_db
-from reward_logic.percentage import round_up_decimal_new
-from database.mongodb import entityOwners
+from reward_logic.ledger import OWNER_ACCOUNT, ledger_entry, credit_accounts
 from decimal import Decimal
 from utils.layout import base
 
@@ -23,34 +22,20 @@ def convert_decimal_to_float(data):
         return data
 
 
-def update_pool_reward(amount):
-    amount = Decimal(amount)
+def update_pool_reward(amount, block_range):
+    # amount is in base units, booked as a ledger credit to the pool owner.
     try:
-        pool_owner_data = entityOwners.find_one({"_id": "entityOwners"})
-
-        if pool_owner_data:
-            current_amount = Decimal(str(pool_owner_data.get("amount", "0.0")))
-            wallet_address = pool_owner_data.get(
-                "wallet_address", base["POOL_WALLETS"]["POOL_REWARD_ADDRESS"]
-            )
-        else:
-            current_amount = Decimal("0.0")
-            wallet_address = base["POOL_WALLETS"]["POOL_REWARD_ADDRESS"]
-
-        new_amount = round_up_decimal_new(current_amount + amount)
-        current_time_utc = datetime.utcnow().isoformat()
-
-        entityOwners.update_one(
-            {"_id": "entityOwners"},
+        failed = credit_accounts(
+            [ledger_entry(OWNER_ACCOUNT, amount, f"pool_{block_range}", "pool_reward")],
             {
-                "$set": {
-                    "amount": float(new_amount),
-                    "last_processed": current_time_utc,
-                    "wallet_address": wallet_address,
-                }
+                "$set": {"last_processed": datetime.utcnow().isoformat()},
+                "$setOnInsert": {
+                    "wallet_address": base["POOL_WALLETS"]["POOL_REWARD_ADDRESS"]
+                },
             },
-            upsert=True,
         )
+        if failed:
+            logging.error(f"Pool reward for blocks {block_range} was not credited.")
 
     except Exception as e:
         logging.error(f"update_pool_reward An unexpected error occurred: {e}")
@@ -1,12 +1,49 @@
 import json
 import json
+from datetime import datetime
 from bson import json_util
+from pymongo.errors import BulkWriteError
 import logging
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
-from database.mongodb import rewardLog
+from database.archive import find_archived
+from database.mongodb import rewardLog, rewardHistory
+
+# Besides the rewardLog document of each block range, every wallet's update is
+# written as its own rewardHistory row, indexed by (wallet_address,
+# block_range), so one wallet's earnings are read without opening every
+# rewardLog document.
+HISTORY_BATCH = 1000
+DUPLICATE_KEY = 11000
+
+
+def write_reward_history(block_height, updates, timestamp=None):
+    # Rows already written for the block range are skipped, so writing the
+    # same block range again is harmless.
+    timestamp = timestamp or datetime.utcnow()
+    rows = [
+        {
+            "wallet_address": wallet_address,
+            "block_range": block_height,
+            "timestamp": timestamp,
+            **update,
+        }
+        for wallet_address, update in updates.items()
+        if isinstance(update, dict)
+    ]
+    for offset in range(0, len(rows), HISTORY_BATCH):
+        try:
+            rewardHistory.insert_many(
+                rows[offset : offset + HISTORY_BATCH], ordered=False
+            )
+        except BulkWriteError as e:
+            if any(
+                error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]
+            ):
+                raise
+    return len(rows)
 
 
 def store_in_db(block_height, updates):
@@ -23,14 +60,18 @@ def store_in_db(block_height, updates):
         return
 
     try:
-        existing_document = rewardLog.find_one({"block_height": block_height})
+        write_reward_history(block_height, updates)
+
+        existing_document = rewardLog.find_one(
+            {"block_height": block_height}
+        ) or find_archived("rewardLog", "block_height", block_height)
         if existing_document:
             logging.info(
                 f"Block height {block_height} already exists. Consider updating it instead of inserting a new one."
             )
             return
 
-        document = {"block_height": block_height, "updates": updates}
+        document = {"block_height": block_height, "updates": updates, "history": True}
         rewardLog.insert_one(document)
         logging.info(f"Successfully stored updates for block height {block_height}.")
     except Exception as e:
@@ -44,7 +85,10 @@ def retrieve_from_db(block_height):
         logging.info("Database collection not initialized.")
         return None
     try:
-        document = rewardLog.find_one({"block_height": block_height})
+        # Block ranges past the archive horizon are read from their segment.
+        document = rewardLog.find_one({"block_height": block_height}) or find_archived(
+            "rewardLog", "block_height", block_height
+        )
 
         if document:
             json_str = json.dumps(document, default=json_util.default, indent=4)
@@ -0,0 +1,215 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from bson.int64 import Int64
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from database.mongodb import userStats, scoreEpochs, epochTotals, rewardState
+from utils.layout import base
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Miner scores are recorded per reward epoch, a window of EPOCH_LENGTH seconds
+# numbered from the Unix epoch. Accepted results only $inc the open epoch's
+# (epoch, wallet_address) document and its epochTotals entry, so the total is
+# known before the epoch closes. Payouts read epochs that ended at least
+# EPOCH_GRACE seconds ago, which no flush writes to any more, so nothing is
+# reset after a payout and no increment can land in an epoch being paid.
+EPOCH_LENGTH = base["EPOCHS"]["LENGTH"]
+EPOCH_GRACE = base["EPOCHS"]["GRACE"]
+
+# Paid epochs are kept this long, then removed by their TTL index.
+EPOCH_RETENTION = timedelta(days=7)
+
+# Scores recorded on userStats before epochs existed, paid by the first payout.
+LEGACY_EPOCH = -1
+
+
+def epoch_of(timestamp):
+    return int(timestamp // EPOCH_LENGTH)
+
+
+def epoch_expiry(epoch):
+    return datetime.utcfromtimestamp((epoch + 1) * EPOCH_LENGTH) + EPOCH_RETENTION
+
+
+def last_closed_epoch():
+    return epoch_of(time.time() - EPOCH_GRACE) - 1
+
+
+def claim_epochs(amount_units, block_range):
+    # Move last_paid_epoch up to the newest closed epoch and record the
+    # claimed epochs, with amount_units plus the amount carried over from
+    # payouts that had nothing to pay, as the pending claim on rewardState.
+    # Returns the claim {first, last, amount_units, block_range}, or None when
+    # no epoch closed since the last payout or an earlier claim is still
+    # pending. The claim is one atomic update, so two payouts never share an
+    # epoch, and it stays pending until finish_claim, so a payout interrupted
+    # before its credits were written is resumed by pending_claim.
+    last = last_closed_epoch()
+    try:
+        state = rewardState.find_one_and_update(
+            {
+                "_id": "miners",
+                "last_paid_epoch": {"$not": {"$gte": last}},
+                "claim": {"$exists": False},
+            },
+            [
+                {
+                    "$set": {
+                        "claim": {
+                            "first": {
+                                "$add": [
+                                    {"$ifNull": ["$last_paid_epoch", LEGACY_EPOCH - 1]},
+                                    1,
+                                ]
+                            },
+                            "last": last,
+                            "amount_units": {
+                                "$add": [
+                                    {"$ifNull": ["$carried_units", Int64(0)]},
+                                    Int64(amount_units),
+                                ]
+                            },
+                            "block_range": block_range,
+                        },
+                        "last_paid_epoch": last,
+                        "carried_units": Int64(0),
+                    }
+                }
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return None
+    return state["claim"]
+
+
+def pending_claim():
+    # The claim of a payout that did not finish, or None.
+    state = rewardState.find_one({"_id": "miners", "claim": {"$exists": True}})
+    return state["claim"] if state else None
+
+
+def exclude_from_claim(claim, wallets):
+    # Record wallets whose credit could not be booked on the pending claim.
+    # Their scores go back into the open epoch, so a resumed payout of the
+    # claim must not credit them again.
+    rewardState.update_one(
+        {"_id": "miners", "claim.first": claim["first"], "claim.last": claim["last"]},
+        {"$addToSet": {"claim.excluded": {"$each": wallets}}},
+    )
+
+
+def finish_claim(claim, carry_units=0):
+    # Clear the pending claim once its credits are written, carrying
+    # carry_units to the next payout in the same update.
+    rewardState.update_one(
+        {"_id": "miners", "claim.first": claim["first"], "claim.last": claim["last"]},
+        {"$unset": {"claim": ""}, "$inc": {"carried_units": Int64(carry_units)}},
+    )
+
+
+def carry_amount(amount_units):
+    # Keep a reward that could not be distributed for the next payout.
+    rewardState.update_one(
+        {"_id": "miners"},
+        {"$inc": {"carried_units": Int64(amount_units)}},
+        upsert=True,
+    )
+
+
+def epoch_total(first, last):
+    result = list(
+        epochTotals.aggregate(
+            [
+                {"$match": {"_id": {"$gte": first, "$lte": last}}},
+                {"$group": {"_id": None, "total": {"$sum": "$total"}}},
+            ]
+        )
+    )
+    return Decimal(result[0]["total"]) if result else Decimal(0)
+
+
+def epoch_scores(first, last):
+    # Yields {"_id": wallet_address, "score": summed score} per miner.
+    return scoreEpochs.aggregate(
+        [
+            {"$match": {"epoch": {"$gte": first, "$lte": last}}},
+            {"$group": {"_id": "$wallet_address", "score": {"$sum": "$score"}}},
+        ],
+        allowDiskUse=True,
+    )
+
+
+def migrate_legacy_scores(batch_size=1000):
+    # Copy scores left on userStats into LEGACY_EPOCH, then recompute its total
+    # and drop the old fields. Copies $set rather than $inc, so an interrupted
+    # migration can simply run again.
+    try:
+        operations = []
+        migrated = 0
+        legacy = userStats.find(
+            {"$or": [{"score": {"$gt": 0}}, {"payout_score": {"$gt": 0}}]},
+            {"wallet_address": 1, "score": 1, "payout_score": 1},
+        )
+        for user in legacy:
+            operations.append(
+                UpdateOne(
+                    {"epoch": LEGACY_EPOCH, "wallet_address": user["wallet_address"]},
+                    {
+                        "$set": {
+                            "score": user.get("score", 0) + user.get("payout_score", 0)
+                        },
+                        "$setOnInsert": {
+                            "expireAt": epoch_expiry(epoch_of(time.time()))
+                        },
+                    },
+                    upsert=True,
+                )
+            )
+            if len(operations) == batch_size:
+                scoreEpochs.bulk_write(operations, ordered=False)
+                migrated += len(operations)
+                operations = []
+        if operations:
+            scoreEpochs.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+        if not migrated:
+            return True, 0
+
+        total = list(
+            scoreEpochs.aggregate(
+                [
+                    {"$match": {"epoch": LEGACY_EPOCH}},
+                    {"$group": {"_id": None, "total": {"$sum": "$score"}}},
+                ]
+            )
+        )
+        epochTotals.update_one(
+            {"_id": LEGACY_EPOCH},
+            {
+                "$set": {"total": total[0]["total"] if total else 0},
+                "$setOnInsert": {"expireAt": epoch_expiry(epoch_of(time.time()))},
+            },
+            upsert=True,
+        )
+        userStats.update_many(
+            {
+                "$or": [
+                    {"score": {"$exists": True}},
+                    {"payout_score": {"$exists": True}},
+                ]
+            },
+            {"$unset": {"score": "", "payout_score": ""}},
+        )
+        return True, migrated
+    except PyMongoError as e:
+        logging.error(f"An error occurred in migrate_legacy_scores: {e}")
+        return False, 0
@@ -0,0 +1,50 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from database.mongodb import get_async_db
+
+# A miner is active when it had a result accepted within ACTIVE_WINDOW. The
+# tracker keeps one bucket of wallets per minute and the minute each wallet was
+# last seen, so counting is len() and expiring a minute only touches the
+# wallets that went quiet in it. Until the pool has been up for a whole window
+# the buckets are incomplete and the count comes from the indexed
+# last_active_time range query instead.
+ACTIVE_WINDOW = timedelta(minutes=15)
+WINDOW_MINUTES = int(ACTIVE_WINDOW.total_seconds() // 60)
+
+buckets = {}
+last_seen = {}
+tracker_lock = threading.Lock()
+started_minute = int(time.time() // 60)
+
+
+def expire_buckets(current_minute):
+    for minute in [m for m in buckets if m <= current_minute - WINDOW_MINUTES]:
+        for wallet_address in buckets.pop(minute):
+            if last_seen.get(wallet_address) == minute:
+                del last_seen[wallet_address]
+
+
+def observe_active_miner(wallet_address):
+    minute = int(time.time() // 60)
+    with tracker_lock:
+        previous = last_seen.get(wallet_address)
+        if previous == minute:
+            return
+        if previous is not None and previous in buckets:
+            buckets[previous].discard(wallet_address)
+        buckets.setdefault(minute, set()).add(wallet_address)
+        last_seen[wallet_address] = minute
+
+
+async def active_miner_count():
+    minute = int(time.time() // 60)
+    with tracker_lock:
+        expire_buckets(minute)
+        if minute - started_minute >= WINDOW_MINUTES:
+            return len(last_seen)
+
+    return await get_async_db().userStats.count_documents(
+        {"last_active_time": {"$gte": datetime.utcnow() - ACTIVE_WINDOW}}
+    )
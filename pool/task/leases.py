@@ -0,0 +1,107 @@
+import logging
+import math
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+from database.mongodb import AiTask, get_async_db
+from utils.layout import base
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# A claimed task is leased to its miner until lease_expires_at, and the reaper
+# puts tasks whose lease ran out back in the queue. The lease follows each
+# miner's completion times: the moving mean plus SPREAD standard deviations,
+# clamped to [MIN, MAX], and DEFAULT until MIN_SAMPLES completions were seen.
+DEFAULT_LEASE = base["LEASE"]["DEFAULT"]
+MIN_LEASE = base["LEASE"]["MIN"]
+MAX_LEASE = base["LEASE"]["MAX"]
+SPREAD = base["LEASE"]["SPREAD"]
+MIN_SAMPLES = 3
+
+# Weight of the newest completion time in the moving mean and variance.
+LEASE_SMOOTHING = 0.2
+
+# wallet -> {"mean": seconds, "variance": seconds squared, "samples": n}
+completion_stats = {}
+
+
+def observe_completion(wallet_address, seconds):
+    stats = completion_stats.get(wallet_address)
+    if stats is None:
+        completion_stats[wallet_address] = {
+            "mean": seconds,
+            "variance": 0.0,
+            "samples": 1,
+        }
+        return
+
+    delta = seconds - stats["mean"]
+    stats["mean"] += LEASE_SMOOTHING * delta
+    stats["variance"] = (1 - LEASE_SMOOTHING) * (
+        stats["variance"] + LEASE_SMOOTHING * delta * delta
+    )
+    stats["samples"] += 1
+
+
+def lease_duration(wallet_address):
+    stats = completion_stats.get(wallet_address)
+    if stats is None or stats["samples"] < MIN_SAMPLES:
+        return timedelta(seconds=DEFAULT_LEASE)
+    seconds = stats["mean"] + SPREAD * math.sqrt(stats["variance"])
+    return timedelta(seconds=max(MIN_LEASE, min(MAX_LEASE, seconds)))
+
+
+async def extend_lease(task_id, wallet_address, until, receipt_id):
+    # Keep a task leased while its upload waits to be accepted, and record the
+    # receipt so find_task does not hand the same task to its miner again.
+    # Only the first upload records its receipt; returns whether this one did.
+    result = await get_async_db().AiTask.update_one(
+        {
+            "id": task_id,
+            "wallet": wallet_address,
+            "status": "sent",
+            "receipt_id": {"$exists": False},
+        },
+        {"$max": {"lease_expires_at": until}, "$set": {"receipt_id": receipt_id}},
+    )
+    return result.modified_count
+
+
+async def reap_expired_leases():
+    try:
+        result = await get_async_db().AiTask.update_many(
+            {"status": "sent", "lease_expires_at": {"$lt": datetime.utcnow()}},
+            {
+                "$set": {"status": "pending", "wallet": ""},
+                "$unset": {
+                    "lease_expires_at": "",
+                    "receipt_id": "",
+                    "claim_token": "",
+                },
+            },
+        )
+        return True, result.modified_count
+    except Exception as e:
+        logging.error(f"An error occurred in reap_expired_leases: {e}")
+        return False, 0
+
+
+def backfill_leases():
+    # Tasks claimed before leases existed get the default lease from now on.
+    try:
+        result = AiTask.update_many(
+            {"status": "sent", "lease_expires_at": {"$exists": False}},
+            {
+                "$set": {
+                    "lease_expires_at": datetime.utcnow()
+                    + timedelta(seconds=DEFAULT_LEASE)
+                }
+            },
+        )
+        return True, result.modified_count
+    except PyMongoError as e:
+        logging.error(f"An error occurred in backfill_leases: {e}")
+        return False, 0
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+# Clients waiting on a result register an event under its retrieve_id and are
+# woken by notify_completion once the response is stored. Miner responses are
+# accepted on the pool's main loop while FastAPI serves from its own thread
+# and loop, so each waiter keeps its loop and is woken through it.
+waiters = {}
+waiters_lock = threading.Lock()
+
+
+@contextmanager
+def completion_waiter(retrieve_id):
+    entry = (asyncio.get_running_loop(), asyncio.Event())
+    with waiters_lock:
+        waiters.setdefault(retrieve_id, set()).add(entry)
+    try:
+        yield entry[1]
+    finally:
+        with waiters_lock:
+            entries = waiters.get(retrieve_id)
+            if entries is not None:
+                entries.discard(entry)
+                if not entries:
+                    del waiters[retrieve_id]
+
+
+def notify_completion(retrieve_id):
+    with waiters_lock:
+        entries = list(waiters.get(retrieve_id, ()))
+    for loop, event in entries:
+        loop.call_soon_threadsafe(event.set)
+    return len(entries)
+
+
+async def wait_for_event(event, timeout):
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
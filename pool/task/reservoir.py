@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import math
+
+from database.mongodb import get_async_db
+from task.scheduler import assign_sched_tags
+from task.task import TASK_PRIORITY, build_automatic_task
+from utils.layout import base
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+MIN_SIZE = base["RESERVOIR"]["MIN_SIZE"]
+MAX_SIZE = base["RESERVOIR"]["MAX_SIZE"]
+HORIZON = base["RESERVOIR"]["HORIZON"]
+BATCH_SIZE = base["RESERVOIR"]["BATCH_SIZE"]
+REFILL_INTERVAL = base["TIME"]["RESERVOIR_REFILL"]
+
+# Weight of the newest sample in the claim rate moving average.
+RATE_SMOOTHING = 0.3
+
+reservoir_state = {"level": None, "claim_rate": 0.0}
+
+
+async def reservoir_level(async_db):
+    # Every pending low-priority task is interchangeable for an idle miner.
+    return await async_db.AiTask.count_documents(
+        {"status": "pending", "priority": TASK_PRIORITY["low"]}
+    )
+
+
+def reservoir_target(claim_rate):
+    # Hold enough tasks to cover HORIZON seconds of claims at the observed rate.
+    return max(MIN_SIZE, min(MAX_SIZE, math.ceil(claim_rate * HORIZON)))
+
+
+def observe_claim_rate(level):
+    # Tasks only leave the reservoir by being claimed, so the drop in level
+    # since the previous refill is the number of claims in that interval.
+    previous_level = reservoir_state["level"]
+    if previous_level is not None:
+        claimed = max(0, previous_level - level)
+        sample = claimed / REFILL_INTERVAL
+        reservoir_state["claim_rate"] = (
+            RATE_SMOOTHING * sample
+            + (1 - RATE_SMOOTHING) * reservoir_state["claim_rate"]
+        )
+    return reservoir_state["claim_rate"]
+
+
+def build_reservoir_batch(count):
+    return [build_automatic_task() for _ in range(count)]
+
+
+async def replenish_reservoir():
+    try:
+        async_db = get_async_db()
+        level = await reservoir_level(async_db)
+        claim_rate = observe_claim_rate(level)
+        missing = reservoir_target(claim_rate) - level
+
+        inserted = 0
+        if missing > 0:
+            count = min(missing, BATCH_SIZE)
+            # Prompt generation is CPU bound, keep it off the event loop.
+            documents = await asyncio.to_thread(build_reservoir_batch, count)
+            await assign_sched_tags(documents)
+            insert_result = await async_db.AiTask.insert_many(documents, ordered=False)
+            inserted = len(insert_result.inserted_ids)
+
+        reservoir_state["level"] = level + inserted
+        return True, inserted
+    except Exception as e:
+        logging.error(f"An error occurred in replenish_reservoir: {e}")
+        return False, 0
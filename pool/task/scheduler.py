@@ -0,0 +1,106 @@
+import logging
+import time
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from database.mongodb import AiTask, get_async_db
+from utils.layout import base
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Weighted fair queuing across task types. Every queued AiTask carries a
+# sched_tag, its virtual finish time in epoch seconds, and miners are served in
+# sched_tag order, then arrival order, from the (status, sched_tag, time, _id)
+# index. Each task of a type moves that type's finish time forward by
+# QUANTUM / weight, so under contention the types share miners in proportion
+# to their weights. A tag is never more than
+# MAX_WAIT[type] seconds past the moment the task was queued, which bounds how
+# long a flooded or low-weight type can be held back.
+QUANTUM = base["SCHEDULER"]["QUANTUM"]
+WEIGHTS = base["SCHEDULER"]["WEIGHTS"]
+MAX_WAIT = base["SCHEDULER"]["MAX_WAIT"]
+
+
+def next_tags(last_finish, now, task_type, count):
+    # Returns the new finish time of the type and the tags of count tasks.
+    step = QUANTUM / WEIGHTS[task_type]
+    deadline = now + MAX_WAIT[task_type]
+    start = max(now, last_finish)
+    tags = [min(start + step * i, deadline) for i in range(1, count + 1)]
+    return min(start + step * count, deadline), tags
+
+
+async def reserve_tags(task_type, count):
+    # The finish time of each type lives in schedulerState so every pool
+    # process draws from the same sequence. The update applies next_tags on
+    # the server, and the previous value lets the tags be derived locally.
+    now = time.time()
+    step = QUANTUM / WEIGHTS[task_type]
+    previous = await get_async_db().schedulerState.find_one_and_update(
+        {"_id": task_type},
+        [
+            {
+                "$set": {
+                    "last_finish": {
+                        "$min": [
+                            {
+                                "$add": [
+                                    {"$max": [now, {"$ifNull": ["$last_finish", 0]}]},
+                                    step * count,
+                                ]
+                            },
+                            now + MAX_WAIT[task_type],
+                        ]
+                    }
+                }
+            }
+        ],
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    last_finish = previous["last_finish"] if previous else 0
+    return next_tags(last_finish, now, task_type, count)[1]
+
+
+async def assign_sched_tags(documents):
+    # Tag a batch of task documents, one reservation per type.
+    by_type = {}
+    for document in documents:
+        by_type.setdefault(document["type"], []).append(document)
+    for task_type, typed in by_type.items():
+        tags = await reserve_tags(task_type, len(typed))
+        for document, tag in zip(typed, tags):
+            document["sched_tag"] = tag
+    return documents
+
+
+def backfill_sched_tags():
+    # Tasks queued before the scheduler are served in the order they arrived,
+    # ahead of anything tagged since.
+    try:
+        result = AiTask.update_many(
+            {"sched_tag": {"$exists": False}},
+            [
+                {
+                    "$set": {
+                        "sched_tag": {
+                            "$divide": [
+                                {
+                                    "$toLong": {
+                                        "$dateFromString": {"dateString": "$time"}
+                                    }
+                                },
+                                1000,
+                            ]
+                        }
+                    }
+                }
+            ],
+        )
+        return True, result.modified_count
+    except PyMongoError as e:
+        logging.error(f"An error occurred in backfill_sched_tags: {e}")
+        return False, 0
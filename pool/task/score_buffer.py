@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+
+from bson.int64 import Int64
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database.mongodb import get_async_db
+from reward_logic.score_epochs import epoch_of, epoch_expiry
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Accepted results add to the miner's score in the open reward epoch and
+# refresh its last_active_time. Instead of writing once per result, increments
+# are summed per wallet here and flushed every TIME.SCORE_FLUSH seconds as
+# unordered bulk_writes of upserts, so a crash loses at most one flush
+# interval. Scores go to the epoch that is open when they are flushed.
+# Defaults for miners seen for the first time.
+NEW_USER_FIELDS = {"tp": 50, "np": 0, "balance_units": Int64(0)}
+
+pending_scores = {}
+# epoch -> score written to scoreEpochs but not yet added to epochTotals
+pending_totals = {}
+pending_lock = threading.Lock()
+
+
+def record_activity(wallet_address, score, active_time=None):
+    # active_time is None for scores carried over from a failed payout.
+    with pending_lock:
+        entry = pending_scores.setdefault(
+            wallet_address, {"score": 0, "last_active_time": None}
+        )
+        entry["score"] += score
+        if active_time is not None and (
+            entry["last_active_time"] is None or active_time > entry["last_active_time"]
+        ):
+            entry["last_active_time"] = active_time
+
+
+def restore_pending(entries):
+    # Put back entries whose write failed so the next flush retries them.
+    for wallet_address, entry in entries.items():
+        record_activity(wallet_address, entry["score"], entry["last_active_time"])
+
+
+def failed_indexes(operations, error):
+    # Indexes of the operations of an unordered bulk_write that were not
+    # applied: those reported by a BulkWriteError, or all of them otherwise.
+    if isinstance(error, BulkWriteError):
+        return [write_error["index"] for write_error in error.details["writeErrors"]]
+    return list(range(len(operations)))
+
+
+async def write_epoch_scores(db, epoch, entries):
+    # Returns the summed score written and whether every write succeeded.
+    scored = [wallet for wallet, entry in entries.items() if entry["score"]]
+    if not scored:
+        return 0, True
+    operations = [
+        UpdateOne(
+            {"epoch": epoch, "wallet_address": wallet_address},
+            {
+                "$inc": {"score": entries[wallet_address]["score"]},
+                "$setOnInsert": {"expireAt": epoch_expiry(epoch)},
+            },
+            upsert=True,
+        )
+        for wallet_address in scored
+    ]
+    failed = set()
+    try:
+        await db.scoreEpochs.bulk_write(operations, ordered=False)
+    except Exception as e:
+        failed = {scored[index] for index in failed_indexes(operations, e)}
+        logging.error(f"{len(failed)} epoch score updates failed in flush_scores: {e}")
+        restore_pending(
+            {wallet: {**entries[wallet], "last_active_time": None} for wallet in failed}
+        )
+    written = sum(entries[wallet]["score"] for wallet in scored if wallet not in failed)
+    return written, not failed
+
+
+async def write_epoch_totals(db):
+    global pending_totals
+    with pending_lock:
+        totals, pending_totals = pending_totals, {}
+    if not totals:
+        return True
+    epochs = list(totals)
+    operations = [
+        UpdateOne(
+            {"_id": epoch},
+            {
+                "$inc": {"total": totals[epoch]},
+                "$setOnInsert": {"expireAt": epoch_expiry(epoch)},
+            },
+            upsert=True,
+        )
+        for epoch in epochs
+    ]
+    try:
+        await db.epochTotals.bulk_write(operations, ordered=False)
+        return True
+    except Exception as e:
+        logging.error(f"Epoch total updates failed in flush_scores: {e}")
+        with pending_lock:
+            for index in failed_indexes(operations, e):
+                epoch = epochs[index]
+                pending_totals[epoch] = pending_totals.get(epoch, 0) + totals[epoch]
+        return False
+
+
+async def write_last_active(db, entries):
+    # Returns the number of wallets written and whether every write succeeded.
+    active = [wallet for wallet, entry in entries.items() if entry["last_active_time"]]
+    if not active:
+        return 0, True
+    operations = [
+        UpdateOne(
+            {"wallet_address": wallet_address},
+            {
+                "$max": {
+                    "last_active_time": entries[wallet_address]["last_active_time"]
+                },
+                "$setOnInsert": NEW_USER_FIELDS,
+            },
+            upsert=True,
+        )
+        for wallet_address in active
+    ]
+    try:
+        await db.userStats.bulk_write(operations, ordered=False)
+        return len(operations), True
+    except Exception as e:
+        failed = [active[index] for index in failed_indexes(operations, e)]
+        logging.error(f"{len(failed)} activity updates failed in flush_scores: {e}")
+        restore_pending({wallet: {**entries[wallet], "score": 0} for wallet in failed})
+        return len(operations) - len(failed), False
+
+
+async def flush_scores():
+    # Scores, epoch totals and activity are separate writes and each one only
+    # retries its own failures, so a score is never counted twice. An epoch's
+    # total is added once its scores are written.
+    global pending_scores
+    with pending_lock:
+        entries, pending_scores = pending_scores, {}
+
+    db = get_async_db()
+    epoch = epoch_of(time.time())
+    written, scores_ok = await write_epoch_scores(db, epoch, entries)
+    if written:
+        with pending_lock:
+            pending_totals[epoch] = pending_totals.get(epoch, 0) + written
+    totals_ok = await write_epoch_totals(db)
+    active, active_ok = await write_last_active(db, entries)
+    return scores_ok and totals_ok and active_ok, active
@@ -6,6 +6,7 @@ import hashlib
 from fastecdsa import keys, curve, ecdsa
 from datetime import datetime, timedelta
 from database.mongodb import ValidationTask
+from database.blob_store import read_blob
 from utils.layout import base
 import utils.config as config
 import logging
@@ -37,11 +38,11 @@ def sign_data(hash_str, private_key):
         raise
 
 
-def upload_images_to_endpoint(endpoint_url):
+def upload_images_to_endpoint(endpoint_url, val_id):
     try:
 
-        # Retrieve the document
-        document = ValidationTask.find_one()
+        # Retrieve the round being dispatched
+        document = ValidationTask.find_one({"task1.val_id": val_id})
         if not document:
             return False, json.dumps({"status": False, "message": "No tasks found"})
 
@@ -55,16 +56,9 @@ def upload_images_to_endpoint(endpoint_url):
         timer = base["TIME"]["VALIDATION_DELETE_TIMER"]
         if time_difference > timedelta(minutes=timer):
             logging.info(f"Time difference is greater than {timer} minutes")
-            if (
-                document["task1"]["condition"] == "pending"
-                or document["task1"]["condition"] == "dispatch"
-            ):
-                ValidationTask.delete_one({"_id": document["_id"]})
-                return False, json.dumps(
-                    {
-                        "error": f"Task is pending/dispatch for more than {timer} minutes, hence deleted"
-                    }
-                )
+            return False, json.dumps(
+                {"error": f"Task is older than {timer} minutes, hence expired"}
+            )
 
         # Check the condition
         if document["task1"]["condition"] != "dispatch":
@@ -98,7 +92,7 @@ def upload_images_to_endpoint(endpoint_url):
         # Loop through each task and add to the data dictionary
         for task in tasks:
             task_id = task.get("id")
-            task_output = task.get("output")  # This should be the binary image data
+            task_output = read_blob(task.get("output_hash"))
 
             if not task_output:
                 print(f"No output for task {task_id}")
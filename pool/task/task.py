@@ -1,72 +1,81 @@
 from faker import Faker
 import random
-from database.mongodb import (
-    AiTask,
-    ResponseTask,
-    ValidationTask,
-    ValidationTaskHistory,
-    userStats,
-    fs,
-)
+from database.mongodb import AiTask, COMPLETED_TASK_TTL, get_async_db
+from database.blob_store import acquire_blob, release_blob
 from utils.layout import base
 from datetime import datetime, timedelta
 import uuid_utils as uuid
 import json
-from pymongo.errors import PyMongoError
-from bson.binary import Binary
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, PyMongoError
 import math
 import logging
 
 from task.prompt import generate_random_image_prompt
+from task.notify import notify_completion
+from task.scheduler import assign_sched_tags
+from task.leases import lease_duration, observe_completion
+from utils.cache import MISSING, eligibility_cache
+from task.score_buffer import record_activity
+from task.active_miners import active_miner_count, observe_active_miner
 
 
 faker = Faker()
 
+# Numeric rank stored on every AiTask as "priority". Claim order comes from the
+# scheduler's sched_tag, the rank is kept to count queued tasks per type.
+TASK_PRIORITY = {"high": 1, "medium": 2, "low": 3}
+
+# Most tasks one wallet may hold without having uploaded them.
+MAX_TASKS_PER_WALLET = base["CREDITS"]["MAX_TASKS"]
+
+# How long a miner's output stays retrievable through ResponseTask.
+RESPONSE_TTL = timedelta(minutes=15)
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
 )
 
 
+def build_requested_task(prompt, task_type="medium"):
+    negative_prompt = base["PROMPT"]["NEGATIVE"]
+    width = base["PROMPT"]["WIDTH"]
+    height = base["PROMPT"]["HEIGHT"]
+    current_time = datetime.utcnow().isoformat()
+    seed = random.randint(1, 9223372036854775807)
+
+    return {
+        "id": str(uuid.uuid4()),
+        "task": prompt,
+        "negative_prompt": negative_prompt,
+        "width": width,
+        "height": height,
+        "seed": f"{seed}",
+        "time": current_time,
+        "retrieve_id": str(uuid.uuid7()),
+        "wallet": "",
+        "status": "pending",
+        "type": task_type,
+        "priority": TASK_PRIORITY[task_type],
+        "message_type": "requestedTask",
+    }
+
+
 async def generate_task(prompt=None):
     if prompt is None:
         logging.error("No prompt provided.")
         return {"success": False, "error": "No prompt provided."}
 
     try:
-        # Generate random text for the task
-        negative_prompt = base["PROMPT"]["NEGATIVE"]
-        width = base["PROMPT"]["WIDTH"]
-        height = base["PROMPT"]["HEIGHT"]
-        current_time = datetime.utcnow().isoformat()
-        wallet_address = ""
-        status = "pending"
-        unique_id = str(uuid.uuid4())
-        retrieve_id = str(uuid.uuid7())
-        seed = random.randint(1, 9223372036854775807)
-        seed_str = f"{seed}"
-        message_type = "requestedTask"
-
         # Create the task document
-        task_document = {
-            "id": unique_id,
-            "task": prompt,
-            "negative_prompt": negative_prompt,
-            "width": width,
-            "height": height,
-            "seed": seed_str,
-            "time": current_time,
-            "retrieve_id": retrieve_id,
-            "wallet": wallet_address,
-            "status": status,
-            "type": "medium",
-            "message_type": message_type,
-        }
+        task_document = build_requested_task(prompt)
+        await assign_sched_tags([task_document])
 
         # Insert the task document into the AiTask collection
-        insert_result = AiTask.insert_one(task_document)
+        insert_result = await get_async_db().AiTask.insert_one(task_document)
         # Check if the insertion was acknowledged by MongoDB
         if insert_result.acknowledged:
-            return {"success": True, "retrieve_id": retrieve_id}
+            return {"success": True, "retrieve_id": task_document["retrieve_id"]}
         else:
             return {"success": False, "error": "Insertion not acknowledged."}
     except Exception as e:
@@ -74,161 +83,233 @@ async def generate_task(prompt=None):
         return {"success": False, "error": str(e)}
 
 
-async def generate_automatic_task(walletAddress):
+async def generate_tasks(requests):
+    # requests is a list of (prompt, task_type) pairs that were already
+    # validated. Every document is written in one unordered insert_many, so a
+    # failed document does not stop the ones after it.
+    task_documents = [
+        build_requested_task(prompt, task_type) for prompt, task_type in requests
+    ]
+    retrieve_ids = [task["retrieve_id"] for task in task_documents]
     try:
-        prompt = generate_random_image_prompt()
-        negative_prompt = base["PROMPT"]["NEGATIVE"]
-        width = base["PROMPT"]["WIDTH"]
-        height = base["PROMPT"]["HEIGHT"]
-        current_time = datetime.utcnow().isoformat()
-        wallet_address = walletAddress
-        status = "sent"
-        type = "low"
-        unique_id = str(uuid.uuid4())
-        retrieve_id = str(uuid.uuid7())
-        seed = random.randint(1, 9223372036854775807)
-        seed_str = f"{seed}"
-        message_type = "requestedTask"
-
-        task_document = {
-            "id": unique_id,
-            "negative_prompt": negative_prompt,
-            "task": prompt,
-            "width": width,
-            "height": height,
-            "seed": seed_str,
-            "time": current_time,
-            "retrieve_id": retrieve_id,
-            "wallet": wallet_address,
-            "status": status,
-            "type": type,
-            "message_type": message_type,
+        await assign_sched_tags(task_documents)
+        await get_async_db().AiTask.insert_many(task_documents, ordered=False)
+        return {"success": True, "retrieve_ids": retrieve_ids}
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        logging.error(f"{len(failed)} tasks failed in generate_tasks: {e}")
+        return {
+            "success": False,
+            "retrieve_ids": [
+                None if index in failed else retrieve_id
+                for index, retrieve_id in enumerate(retrieve_ids)
+            ],
+            "error": f"{len(failed)} of {len(retrieve_ids)} tasks were not stored.",
         }
-
-        insert_result = AiTask.insert_one(task_document)
-        if insert_result.acknowledged:
-            return {
-                "id": unique_id,
-                "task": prompt,
-                "negative_prompt": negative_prompt,
-                "width": width,
-                "height": height,
-                "seed": seed_str,
-                "message_type": message_type,
-            }
-        else:
-            return None
     except Exception as e:
-        logging.error(f"An error occurred in generate_automatic_task: {e}")
-        return None
+        logging.error(f"An error occurred in generate_tasks: {e}")
+        return {"success": False, "retrieve_ids": [], "error": str(e)}
 
 
-async def update_task(document_id, wallet_address):
+def build_automatic_task(wallet_address="", status="pending"):
+    prompt = generate_random_image_prompt()
+    negative_prompt = base["PROMPT"]["NEGATIVE"]
+    width = base["PROMPT"]["WIDTH"]
+    height = base["PROMPT"]["HEIGHT"]
     current_time = datetime.utcnow().isoformat()
-    update_result = AiTask.update_one(
-        {"id": document_id},
-        {"$set": {"wallet": wallet_address, "time": current_time, "status": "sent"}},
-    )
-    return update_result.acknowledged
+    type = "low"
+    unique_id = str(uuid.uuid4())
+    retrieve_id = str(uuid.uuid7())
+    seed = random.randint(1, 9223372036854775807)
+    seed_str = f"{seed}"
+    message_type = "requestedTask"
+
+    return {
+        "id": unique_id,
+        "negative_prompt": negative_prompt,
+        "task": prompt,
+        "width": width,
+        "height": height,
+        "seed": seed_str,
+        "time": current_time,
+        "retrieve_id": retrieve_id,
+        "wallet": wallet_address,
+        "status": status,
+        "type": type,
+        "priority": TASK_PRIORITY[type],
+        "message_type": message_type,
+    }
 
 
-async def find_task(wallet_address):
+async def generate_automatic_task(walletAddress):
+    tasks = await generate_automatic_tasks(walletAddress, 1)
+    return tasks[0] if tasks else None
+
+
+async def generate_automatic_tasks(walletAddress, count):
     try:
-        two_minutes_ago = datetime.utcnow() - timedelta(minutes=2)
+        lease_expires_at = datetime.utcnow() + lease_duration(walletAddress)
+        task_documents = [
+            build_automatic_task(walletAddress, "sent") for _ in range(count)
+        ]
+        for task_document in task_documents:
+            task_document["lease_expires_at"] = lease_expires_at
+        await assign_sched_tags(task_documents)
+
+        insert_result = await get_async_db().AiTask.insert_many(
+            task_documents, ordered=False
+        )
+        if insert_result.acknowledged:
+            return task_documents
+        else:
+            return []
+    except Exception as e:
+        logging.error(f"An error occurred in generate_automatic_tasks: {e}")
+        return []
+
+
+def task_fields(task):
+    return {
+        "id": task["id"],
+        "task": task["task"],
+        "negative_prompt": task["negative_prompt"],
+        "width": task["width"],
+        "height": task["height"],
+        "seed": task.get("seed"),
+        "message_type": task.get("message_type"),
+    }
+
+
+def task_details(task):
+    return json.dumps(task_fields(task))
+
+
+# Queue order: sched_tag, then arrival, so equal tags stay first in first out.
+SCHED_ORDER = [("sched_tag", 1), ("time", 1), ("_id", 1)]
+
+
+async def claim_task(wallet_address):
+    # Atomically move the next pending task to "sent" for this wallet, in
+    # sched_tag order from the (status, sched_tag, time, _id) index, see
+    # task/scheduler.py. Tasks with the same tag are served in arrival order.
+    # The task is leased to the wallet and the reaper in task/leases.py puts it
+    # back in the queue if the lease runs out before an upload arrives.
+    current_time = datetime.utcnow()
+
+    return await get_async_db().AiTask.find_one_and_update(
+        {"status": "pending"},
+        {
+            "$set": {
+                "wallet": wallet_address,
+                "time": current_time.isoformat(),
+                "status": "sent",
+                "lease_expires_at": current_time + lease_duration(wallet_address),
+            }
+        },
+        sort=SCHED_ORDER,
+        return_document=ReturnDocument.AFTER,
+    )
 
-        # First, check if the wallet_address has any 'sent' task that is not completed
-        pending_task = AiTask.find_one({"wallet": wallet_address, "status": "sent"})
 
-        if pending_task:
+async def claim_tasks(wallet_address, count, attempts=3):
+    # Claim up to count pending tasks for this wallet in one batch. The next
+    # candidates are read in sched_tag order, then moved to "sent" with a
+    # single update_many guarded on status, so tasks taken by a concurrent
+    # claim in between are skipped. claim_token identifies the ones this call
+    # won, and a short fall is retried a few times.
+    async_db = get_async_db()
+    claimed = []
+    for _ in range(attempts):
+        missing = count - len(claimed)
+        if missing <= 0:
+            break
+        candidate_ids = [
+            document["_id"]
+            async for document in async_db.AiTask.find(
+                {"status": "pending"}, {"_id": 1}
+            )
+            .sort(SCHED_ORDER)
+            .limit(missing)
+        ]
+        if not candidate_ids:
+            break
 
-            return pending_task["id"], json.dumps(
+        current_time = datetime.utcnow()
+        claim_token = str(uuid.uuid4())
+        await async_db.AiTask.update_many(
+            {"_id": {"$in": candidate_ids}, "status": "pending"},
+            {
+                "$set": {
+                    "wallet": wallet_address,
+                    "time": current_time.isoformat(),
+                    "status": "sent",
+                    "lease_expires_at": current_time + lease_duration(wallet_address),
+                    "claim_token": claim_token,
+                }
+            },
+        )
+        claimed += [
+            task
+            async for task in async_db.AiTask.find(
+                {"_id": {"$in": candidate_ids}, "claim_token": claim_token}
+            ).sort(SCHED_ORDER)
+        ]
+    return claimed
+
+
+async def find_tasks(wallet_address, count):
+    # Multi-GPU miners ask for several tasks at once. Tasks the wallet already
+    # holds and has not uploaded count against MAX_TASKS and are sent again,
+    # the rest are claimed in one batch and topped up with automatic tasks.
+    try:
+        count = max(1, min(count, MAX_TASKS_PER_WALLET))
+        held = [
+            task
+            async for task in get_async_db()
+            .AiTask.find(
                 {
-                    "id": pending_task["id"],
-                    "task": pending_task["task"],
-                    "negative_prompt": pending_task["negative_prompt"],
-                    "width": pending_task["width"],
-                    "height": pending_task["height"],
-                    "seed": pending_task.get("seed"),
-                    "message_type": pending_task.get("message_type"),
+                    "wallet": wallet_address,
+                    "status": "sent",
+                    "receipt_id": {"$exists": False},
                 }
             )
+            .limit(count)
+        ]
+
+        tasks = held
+        if len(tasks) < count:
+            tasks += await claim_tasks(wallet_address, count - len(tasks))
+        if len(tasks) < count:
+            tasks += await generate_automatic_tasks(wallet_address, count - len(tasks))
+        return tasks
+    except Exception as e:
+        logging.error(f"An error occurred in find_tasks: {e}")
+        return []
 
-        # Define a priority dictionary
-        priority_map = {"high": 1, "medium": 2, "low": 3}
-
-        # Find tasks sorted by time
-        tasks = AiTask.find().sort("time", 1)
-
-        # Convert cursor to a list
-        tasks_list = list(tasks)
-
-        # If no tasks found in db, generate a new automatic task
-        if not tasks_list:
-
-            new_task = await generate_automatic_task(wallet_address)
-            if new_task:
-                return new_task["id"], json.dumps(
-                    {
-                        "id": new_task["id"],
-                        "task": new_task["task"],
-                        "negative_prompt": new_task["negative_prompt"],
-                        "width": new_task["width"],
-                        "height": new_task["height"],
-                        "seed": new_task.get("seed"),
-                        "message_type": new_task.get("message_type"),
-                    }
-                )
-            else:
-                return None, None
-
-        # Sort tasks by priority if there are tasks
-        tasks_list.sort(key=lambda task: priority_map.get(task.get("type", "low"), 3))
-
-        for task in tasks_list:
-            if (
-                task["status"] == "sent"
-                and datetime.fromisoformat(task["time"]) < two_minutes_ago
-            ):
-                if await update_task(task["id"], wallet_address):
-                    return task["id"], json.dumps(
-                        {
-                            "id": task["id"],
-                            "task": task["task"],
-                            "negative_prompt": task["negative_prompt"],
-                            "width": task["width"],
-                            "height": task["height"],
-                            "seed": task.get("seed"),
-                            "message_type": task.get("message_type"),
-                        }
-                    )
-            elif task["status"] == "pending":
-                if await update_task(task["id"], wallet_address):
-                    return task["id"], json.dumps(
-                        {
-                            "id": task["id"],
-                            "task": task["task"],
-                            "negative_prompt": task["negative_prompt"],
-                            "width": task["width"],
-                            "height": task["height"],
-                            "seed": task.get("seed"),
-                            "message_type": task.get("message_type"),
-                        }
-                    )
 
-        # If no suitable task is found, generate a new automatic task
+async def find_task(wallet_address):
+    try:
+        # First, check if the wallet_address has any 'sent' task that is not completed
+        pending_task = await get_async_db().AiTask.find_one(
+            {
+                "wallet": wallet_address,
+                "status": "sent",
+                "receipt_id": {"$exists": False},
+            }
+        )
+
+        if pending_task:
+            return pending_task["id"], task_details(pending_task)
+
+        task = await claim_task(wallet_address)
+        if task:
+            return task["id"], task_details(task)
+
+        # The reservoir keeps low-priority tasks queued, so this only runs when
+        # it has been drained faster than it could be refilled.
         new_task = await generate_automatic_task(wallet_address)
         if new_task:
-            return new_task["id"], json.dumps(
-                {
-                    "id": new_task["id"],
-                    "task": new_task["task"],
-                    "negative_prompt": new_task["negative_prompt"],
-                    "width": new_task["width"],
-                    "height": new_task["height"],
-                    "seed": new_task.get("seed"),
-                    "message_type": new_task.get("message_type"),
-                }
-            )
+            return new_task["id"], task_details(new_task)
         else:
             return None, None
     except Exception as e:
@@ -236,22 +317,33 @@ async def find_task(wallet_address):
         return None, None
 
 
-async def store_response(task_id, wallet_address, output, retrieve_id):
+def backfill_task_priority():
+    # Tasks queued before "priority" existed would sort ahead of everything else.
     try:
-        # Calculate the expiration time
-        expire_at = datetime.utcnow() + timedelta(minutes=15)
+        for task_type, priority in TASK_PRIORITY.items():
+            AiTask.update_many(
+                {"type": task_type, "priority": {"$exists": False}},
+                {"$set": {"priority": priority}},
+            )
+        return True
+    except PyMongoError as e:
+        logging.error(f"An error occurred in backfill_task_priority: {e}")
+        return False
 
-        # Create the response document
+
+async def store_response(task_id, wallet_address, output_hash, retrieve_id, expire_at):
+    try:
+        # Create the response document, the image itself lives in the blob store
         response_document = {
             "retrieve_id": retrieve_id,
             "wallet_address": wallet_address,
-            "output": Binary(output),
+            "output_hash": output_hash,
             "task_id": task_id,
             "expireAt": expire_at,
         }
 
         # Insert the response document into the ResponseTask collection
-        insert_result = ResponseTask.insert_one(response_document)
+        insert_result = await get_async_db().ResponseTask.insert_one(response_document)
 
         if insert_result.acknowledged:
             return True, "Response stored successfully"
@@ -263,10 +355,14 @@ async def store_response(task_id, wallet_address, output, retrieve_id):
         return False, str(e)
 
 
-async def handle_miner_response(task_id: str, wallet_address: str, output: bytes):
+async def handle_miner_response(
+    task_id: str, wallet_address: str, output_hash: str, received_at=None
+):
     try:
+        async_db = get_async_db()
+
         # Find the task by ID
-        task = AiTask.find_one({"id": task_id})
+        task = await async_db.AiTask.find_one({"id": task_id})
 
         if not task:
             return False, "Task not found"
@@ -285,32 +381,51 @@ async def handle_miner_response(task_id: str, wallet_address: str, output: bytes
         time = task["time"]
         type = task["type"]
 
-        # If all checks pass, update the task status to "completed" and add the output
-        update_result = AiTask.update_one(
-            {"id": task_id}, {"$set": {"status": "completed"}}
+        # Feed the miner's completion time into its lease length
+        if received_at is not None:
+            observe_completion(
+                wallet_address,
+                (received_at - datetime.fromisoformat(time)).total_seconds(),
+            )
+
+        # If all checks pass, update the task status to "completed". The
+        # update is guarded on the checks above, so of two responses racing
+        # for the same task only one completes it.
+        update_result = await async_db.AiTask.update_one(
+            {"id": task_id, "wallet": wallet_address, "status": "sent"},
+            {"$set": {"status": "completed", "completedAt": datetime.utcnow()}},
         )
 
         if update_result.modified_count > 0:
             try:
+                # The upload is already staged, the stored response takes its
+                # own reference to it
+                expire_at = datetime.utcnow() + RESPONSE_TTL
+                await acquire_blob(output_hash, expire_at)
+
                 # Call update_validation_task if the task type is "high"
                 if type == "high":
-                    validation_update, validation_message = update_validation_task(
-                        task_id, output, wallet_address
+                    validation_update, validation_message = (
+                        await update_validation_task(
+                            task_id, output_hash, wallet_address
+                        )
                     )
                     if not validation_update:
                         logging.info(f"{validation_message}")
 
                 # Call the store_response function after successfully updating the task status
                 store_success, store_message = await store_response(
-                    task_id, wallet_address, output, retrieve_id
+                    task_id, wallet_address, output_hash, retrieve_id, expire_at
                 )
+                if store_success:
+                    # Wake clients long-polling or subscribed to this result
+                    notify_completion(retrieve_id)
 
-                # Calculate the score and update user info
-                score = calculate_speed_score(time)
-                success, message = upsert_user_info(wallet_address, score)
-
-                if not success:
-                    return False, message
+                # Score the upload by when it was received, not by when the
+                # acceptance delay let it through
+                score = calculate_speed_score(time, received_at)
+                record_activity(wallet_address, score, datetime.utcnow())
+                observe_active_miner(wallet_address)
 
                 if store_success:
                     return True, "Task Accepted and Response Stored"
@@ -334,33 +449,57 @@ async def handle_miner_response(task_id: str, wallet_address: str, output: bytes
         return False, str(e)
 
 
-async def delete_old_completed_tasks():
+def backfill_completed_at():
+    # Completed tasks from before completedAt existed get their last claim time,
+    # so the TTL index removes them like every other completed task.
     try:
-        # Define the time limit (15 minutes ago from now)
-        time_limit = datetime.utcnow() - timedelta(minutes=15)
-
-        # Batch processing of documents with status 'completed'
-        batch_size = 1000
-        query = {"status": "completed"}
-        projection = {"_id": 1, "time": 1}
-
-        cursor = AiTask.find(query, projection).batch_size(batch_size)
-
-        to_delete_ids = []
-        for document in cursor:
-            completed_time = document.get("time")
-            if completed_time and datetime.fromisoformat(completed_time) < time_limit:
-                to_delete_ids.append(document["_id"])
-
-        if to_delete_ids:
-            # Delete documents in batches
-            delete_result = AiTask.delete_many({"_id": {"$in": to_delete_ids}})
-            return (
-                True,
-                f"Deleted {delete_result.deleted_count} completed tasks older than 15 minutes.",
-            )
-        else:
-            return True, "No completed tasks older than 15 minutes found to delete."
+        result = AiTask.update_many(
+            {"status": "completed", "completedAt": {"$exists": False}},
+            [{"$set": {"completedAt": {"$dateFromString": {"dateString": "$time"}}}}],
+        )
+        return True, result.modified_count
+    except PyMongoError as e:
+        logging.error(f"An error occurred in backfill_completed_at: {e}")
+        return False, 0
+
+
+# Running totals of the safety net below, logged with every run.
+completed_cleanup_stats = {"runs": 0, "deleted": 0}
+
+
+async def delete_old_completed_tasks(batch_size=1000, max_batches=10):
+    # Completed tasks are removed by the TTL index on completedAt. This only
+    # catches up when the TTL monitor lags behind, a bounded number of batches
+    # of _ids at a time, oldest first.
+    try:
+        async_db = get_async_db()
+        time_limit = datetime.utcnow() - timedelta(seconds=COMPLETED_TASK_TTL)
+
+        deleted = 0
+        for _ in range(max_batches):
+            ids = [
+                document["_id"]
+                async for document in async_db.AiTask.find(
+                    {"completedAt": {"$lt": time_limit}}, {"_id": 1}
+                )
+                .sort("completedAt", 1)
+                .limit(batch_size)
+            ]
+            if not ids:
+                break
+            delete_result = await async_db.AiTask.delete_many({"_id": {"$in": ids}})
+            deleted += delete_result.deleted_count
+            if len(ids) < batch_size:
+                break
+
+        completed_cleanup_stats["runs"] += 1
+        completed_cleanup_stats["deleted"] += deleted
+        return (
+            True,
+            f"Deleted {deleted} completed tasks missed by the TTL index "
+            f"({completed_cleanup_stats['deleted']} over "
+            f"{completed_cleanup_stats['runs']} runs).",
+        )
 
     except PyMongoError as e:
         return False, f"An error occurred while accessing the database: {e}"
@@ -371,15 +510,15 @@ async def delete_old_completed_tasks():
 # ###########---------------------------------###################################
 
 
-def calculate_speed_score(task_completion_time_utc):
+def calculate_speed_score(task_completion_time_utc, received_at=None):
     try:
         # Convert the input time string to a datetime object using the specified format
         task_completion_time = datetime.strptime(
             task_completion_time_utc, "%Y-%m-%dT%H:%M:%S.%f"
         )
 
-        # Get the current UTC time
-        current_time = datetime.utcnow()
+        # Measure up to when the output arrived, defaulting to now
+        current_time = received_at or datetime.utcnow()
 
         # Calculate the time difference between now and the task completion time in seconds
         time_diff = (current_time - task_completion_time).total_seconds()
@@ -398,48 +537,13 @@ def calculate_speed_score(task_completion_time_utc):
         return 0
 
 
-def upsert_user_info(wallet_address, score=None):
-    # Define default values
-    default_tp = 50
-    default_np = 0
-    default_score = 0
-    default_balance = 0
-
+async def add_processed_validator(val_id, validator_address):
     try:
-        # Try to find the user
-        user = userStats.find_one({"wallet_address": wallet_address})
-
-        if user:
-            # Update existing user
-            update_doc = {"$set": {"last_active_time": datetime.utcnow()}}
-            if score is not None:
-                update_doc["$inc"] = {"score": score}
-
-            userStats.update_one({"wallet_address": wallet_address}, update_doc)
-            return True, f"User updated with wallet_address: {wallet_address}"
-
-        else:
-            # Create new user
-            new_user = {
-                "wallet_address": wallet_address,
-                "last_active_time": datetime.utcnow(),
-                "tp": default_tp,
-                "np": default_np,
-                "score": score if score is not None else default_score,
-                "balance": default_balance,
-            }
-            userStats.insert_one(new_user)
-            return True, f"New user created with wallet_address: {wallet_address}"
+        async_db = get_async_db()
 
-    except PyMongoError as e:
-        return False, f"An error occurred while updating upsert_user_info: {e}"
-
-
-def add_processed_validator(val_id, validator_address):
-    try:
         # Find the document with the given val_id
         query = {"task1.val_id": val_id}
-        task = ValidationTask.find_one(query)
+        task = await async_db.ValidationTask.find_one(query)
 
         if task:
             # Check if the validator_address is already in the list
@@ -450,7 +554,7 @@ def add_processed_validator(val_id, validator_address):
                 ]
 
                 # Update the document
-                update_result = ValidationTask.update_one(
+                update_result = await async_db.ValidationTask.update_one(
                     query, {"$set": {"task1.validators": updated_validators}}
                 )
 
@@ -466,11 +570,11 @@ def add_processed_validator(val_id, validator_address):
         return False
 
 
-def is_task_valid(val_id: str) -> bool:
+async def is_task_valid(val_id: str) -> bool:
     try:
         # Find the document with the given val_id
         query = {"val_id": val_id}
-        task = ValidationTaskHistory.find_one(query)
+        task = await get_async_db().ValidationTaskHistory.find_one(query)
 
         if not task:
             # If no document is found, return False
@@ -498,21 +602,19 @@ def is_task_valid(val_id: str) -> bool:
         return False
 
 
-def miner_eligibility(wallet_address: str) -> bool:
+async def miner_eligibility(wallet_address: str) -> bool:
+    eligible = eligibility_cache.get(wallet_address)
+    if eligible is not MISSING:
+        return eligible
     try:
         # Find the document with the given wallet_address
         query = {"wallet_address": wallet_address}
-        user_stat = userStats.find_one(query)
-
-        if not user_stat:
-            # If no document is found, return True
-            return True
+        user_stat = await get_async_db().userStats.find_one(query)
 
-        # Check the np field
-        if user_stat.get("np", 0) > 45:
-            return False
-
-        return True
+        # Miners without stats yet are eligible, otherwise check the np field
+        eligible = not user_stat or user_stat.get("np", 0) <= 45
+        eligibility_cache.set(wallet_address, eligible)
+        return eligible
 
     except Exception as e:
         logging.error(f"An error occurred in miner_eligibility: {e}")
@@ -552,15 +654,17 @@ def miner_eligibility(wallet_address: str) -> bool:
 #         return False, f"An error occurred in task_validation_output: {e}"
 
 
-def task_validation_output(wallet_address, tp=None, np=None):
+async def task_validation_output(wallet_address, tp=None, np=None):
     print("*" * 45)
     print("wallet_address", wallet_address)
     print("TP", tp)
     print("NP", np)
     print("*" * 45)
     try:
+        async_db = get_async_db()
+
         # Find the user by wallet address
-        user = userStats.find_one({"wallet_address": wallet_address})
+        user = await async_db.userStats.find_one({"wallet_address": wallet_address})
         if not user:
             return False, "Miner not found"
 
@@ -593,43 +697,52 @@ def task_validation_output(wallet_address, tp=None, np=None):
             return False, "No changes to update"
 
         # Update the user stats
-        userStats.update_one({"wallet_address": wallet_address}, update_doc)
+        await async_db.userStats.update_one(
+            {"wallet_address": wallet_address}, update_doc
+        )
+        eligibility_cache.invalidate(wallet_address)
         return True, f"User validated with wallet_address: {wallet_address}"
     except Exception as e:
         return False, f"An error occurred in task_validation_output: {e}"
 
 
-def update_validation_task(task_id, output, wallet_address):
+async def update_validation_task(task_id, output_hash, wallet_address):
     try:
-        # Find the task in the ValidationTask collection
-        task = ValidationTask.find_one({"task1.array.id": task_id})
+        async_db = get_async_db()
 
-        if not task:
-            return False, "ValidationTask  does not exist"
-
-        # Update the specific task within the array
-        ValidationTask.update_one(
+        # Update the specific task within the array of the round it belongs to
+        task = await async_db.ValidationTask.find_one_and_update(
             {"task1.array.id": task_id},
             {
                 "$set": {
                     "task1.array.$.wallet": wallet_address,
                     "task1.array.$.status": "completed",
-                    "task1.array.$.output": Binary(output),
+                    "task1.array.$.output_hash": output_hash,
                 }
             },
+            return_document=ReturnDocument.AFTER,
         )
 
+        if not task:
+            return False, "ValidationTask  does not exist"
+
+        # The round holds its own reference until it expires
+        timer = base["TIME"]["VALIDATION_DELETE_TIMER"]
+        await acquire_blob(output_hash, datetime.utcnow() + timedelta(minutes=timer))
+
         # Check if all tasks in the array are completed
-        task = ValidationTask.find_one({"task1.array.id": task_id})
         all_completed = all(
             item["status"] == "completed" for item in task["task1"]["array"]
         )
 
         if all_completed:
-            ValidationTask.update_one(
-                {"task1.array.id": task_id}, {"$set": {"task1.condition": "dispatch"}}
+            await async_db.ValidationTask.update_one(
+                {"_id": task["_id"], "task1.condition": "pending"},
+                {"$set": {"task1.condition": "dispatch"}},
+            )
+            logging.info(
+                f"Task {task['task1']['val_id']} has been dispatched for validation"
             )
-            logging.info(f"Task is has been dispatched for validation ")
 
         return True, "Task updated successfully"
 
@@ -637,135 +750,186 @@ def update_validation_task(task_id, output, wallet_address):
         return False, f"An error occurred in update_validation_task: {e}"
 
 
+def validation_round_expiry():
+    timer = base["TIME"]["VALIDATION_DELETE_TIMER"]
+    return (datetime.utcnow() - timedelta(minutes=timer)).isoformat()
+
+
+async def expire_validation_rounds():
+    # Rounds live for VALIDATION_DELETE_TIMER minutes whatever their condition;
+    # createdAt is an ISO string, which orders the same way as the datetime.
+    try:
+        async_db = get_async_db()
+        expired = async_db.ValidationTask.find(
+            {"task1.createdAt": {"$lt": validation_round_expiry()}}, {"_id": 1}
+        )
+        expired_ids = [validation_round["_id"] async for validation_round in expired]
+
+        # Both the pool and the validation service expire rounds, so each round
+        # is deleted on its own and only the caller that removed it releases
+        # its outputs; otherwise their refs would be dropped twice.
+        deleted = 0
+        for round_id in expired_ids:
+            validation_round = await async_db.ValidationTask.find_one_and_delete(
+                {"_id": round_id}, {"task1.array.output_hash": 1}
+            )
+            if validation_round is None:
+                continue
+            deleted += 1
+            # Let go of the round's outputs so they can be collected early
+            for task in validation_round["task1"]["array"]:
+                if task.get("output_hash"):
+                    await release_blob(task["output_hash"])
+
+        if deleted:
+            logging.info(f"Expired {deleted} validation rounds")
+        return deleted
+    except Exception as e:
+        logging.error(f"An error occurred in expire_validation_rounds: {e}")
+        return 0
+
+
+async def validation_rounds_target():
+    # One round per MINERS_PER_ROUND active miners, at least one, at most MAX_ROUNDS.
+    active_miners = await active_miner_count()
+    rounds = math.ceil(active_miners / base["VALIDATION"]["MINERS_PER_ROUND"])
+    return max(1, min(base["VALIDATION"]["MAX_ROUNDS"], rounds))
+
+
+def build_validation_round():
+    # Generate random text for the task
+    prompt = generate_random_image_prompt()
+    negative_prompt = base["PROMPT"]["NEGATIVE"]
+    width = base["PROMPT"]["WIDTH"]
+    height = base["PROMPT"]["HEIGHT"]
+    seed = random.randint(1, 9223372036854775807)
+    seed_str = f"{seed}"
+    message_type = "requestedTask"
+    val_id = str(uuid.uuid7())
+    current_time = datetime.utcnow().isoformat()
+
+    # Create the array of tasks
+    tasks_array = []
+    for _ in range(3):
+        unique_id = str(uuid.uuid4())
+        retrieve_id = str(uuid.uuid4())
+
+        task_document = {
+            "id": unique_id,
+            "task": prompt,
+            "negative_prompt": negative_prompt,
+            "width": width,
+            "height": height,
+            "seed": seed_str,
+            "time": current_time,
+            "retrieve_id": retrieve_id,
+            "wallet": "",
+            "status": "pending",
+            "type": "high",
+            "priority": TASK_PRIORITY["high"],
+            "message_type": message_type,
+        }
+        tasks_array.append(task_document)
+
+    # Create the validation task document
+    return {
+        "task1": {
+            "val_id": val_id,
+            "condition": "pending",
+            "createdAt": current_time,
+            "validators": [],
+            "array": tasks_array,
+        }
+    }
+
+
 async def generate_validation_task():
     try:
-        # Check if the validationTask collection is empty
-        if ValidationTask.count_documents({}) == 0:
-            # Generate random text for the task
-            prompt = generate_random_image_prompt()
-            negative_prompt = base["PROMPT"]["NEGATIVE"]
-            width = base["PROMPT"]["WIDTH"]
-            height = base["PROMPT"]["HEIGHT"]
-            seed = random.randint(1, 9223372036854775807)
-            seed_str = f"{seed}"
-            message_type = "requestedTask"
-
-            # Create the array of tasks
-            tasks_array = []
-            for _ in range(3):
-                unique_id = str(uuid.uuid4())
-                val_id = str(uuid.uuid7())
-                retrieve_id = str(uuid.uuid4())
-                current_time = datetime.utcnow().isoformat()
-
-                task_document = {
-                    "id": unique_id,
-                    "task": prompt,
-                    "negative_prompt": negative_prompt,
-                    "width": width,
-                    "height": height,
-                    "seed": seed_str,
-                    "time": current_time,
-                    "retrieve_id": retrieve_id,
-                    "wallet": "",
-                    "status": "pending",
-                    "type": "high",
-                    "message_type": message_type,
-                }
-                tasks_array.append(task_document)
-
-                validators = []
-
-            # Create the validation task document
-            validation_task_document = {
-                "task1": {
-                    "val_id": val_id,
-                    "condition": "pending",
-                    "createdAt": current_time,
-                    "validators": validators,
-                    "array": tasks_array,
-                }
-            }
+        async_db = get_async_db()
+        await expire_validation_rounds()
 
-            validation_task_History = {
-                "val_id": val_id,
-                "createdAt": current_time,
-            }
+        in_flight = await async_db.ValidationTask.count_documents(
+            {"task1.condition": {"$in": ["pending", "dispatch"]}}
+        )
+        missing = await validation_rounds_target() - in_flight
+        if missing <= 0:
+            logging.info(
+                f"{in_flight} validation rounds in flight. Skipping insertion."
+            )
+            return False
 
-            # Insert the validation task document into the validationTask collection
-            insert_result = ValidationTask.insert_one(validation_task_document)
-            insert_history = ValidationTaskHistory.insert_one(validation_task_History)
-            # Check if the insertion was acknowledged by MongoDB
-            if insert_result.acknowledged:
-                # Insert each task_document into the AiTask collection
-                for task in tasks_array:
-                    ai_task_document = {
-                        "id": task["id"],
-                        "task": task["task"],
-                        "negative_prompt": task["negative_prompt"],
-                        "width": task["width"],
-                        "height": task["height"],
-                        "seed": task["seed"],
-                        "time": task["time"],
-                        "retrieve_id": task["retrieve_id"],
-                        "wallet": task["wallet"],
-                        "status": task["status"],
-                        "type": "high",
-                        "message_type": task["message_type"],
-                    }
-                    AiTask.insert_one(ai_task_document)
-                return True
-            else:
-                return False
+        rounds = [build_validation_round() for _ in range(missing)]
+
+        # Insert the rounds into the validationTask collection
+        insert_result = await async_db.ValidationTask.insert_many(rounds, ordered=False)
+        await async_db.ValidationTaskHistory.insert_many(
+            [
+                {
+                    "val_id": validation_round["task1"]["val_id"],
+                    "createdAt": validation_round["task1"]["createdAt"],
+                }
+                for validation_round in rounds
+            ],
+            ordered=False,
+        )
+        # Check if the insertion was acknowledged by MongoDB
+        if insert_result.acknowledged:
+            # Queue each round's tasks in the AiTask collection
+            queued = await assign_sched_tags(
+                [
+                    dict(task)
+                    for validation_round in rounds
+                    for task in validation_round["task1"]["array"]
+                ]
+            )
+            await async_db.AiTask.insert_many(queued, ordered=False)
+            logging.info(f"Generated {len(rounds)} validation rounds")
+            return True
         else:
-            logging.error("ValidationTask collection is not empty. Skipping insertion.")
             return False
     except Exception as e:
         logging.error(f"An error occurred in generate_validation_task: {e}")
         return False
 
 
-async def select_task_for_validation():
+async def select_tasks_for_validation():
     try:
-        # Find the first task
-        task = ValidationTask.find_one({})
+        await expire_validation_rounds()
+
+        # Every round whose outputs are complete can be dispatched on its own
+        rounds = (
+            get_async_db()
+            .ValidationTask.find(
+                {"task1.condition": "dispatch"},
+                {"task1.val_id": 1, "task1.validators": 1},
+            )
+            .sort("task1.createdAt", 1)
+        )
 
-        if not task:
-            print("in here")
-            return False, json.dumps({"error": "No tasks found"})
+        tasks = [
+            {
+                "id": validation_round["task1"]["val_id"],
+                "validators": validation_round["task1"]["validators"],
+            }
+            async for validation_round in rounds
+        ]
 
-        current_time = datetime.utcnow()
-        task_created_at = datetime.strptime(
-            task["task1"]["createdAt"], "%Y-%m-%dT%H:%M:%S.%f"
-        )
-        time_difference = current_time - task_created_at
+        if not tasks:
+            return False, json.dumps({"error": "No dispatched tasks found"})
 
-        timer = base["TIME"]["VALIDATION_DELETE_TIMER"]
-        if time_difference > timedelta(minutes=timer):
-            print(f"Time difference is greater than {timer} minute")
-            if (
-                task["task1"]["condition"] == "pending"
-                or task["task1"]["condition"] == "dispatch"
-            ):
-                ValidationTask.delete_one({"_id": task["_id"]})
-                return False, json.dumps(
-                    {
-                        "error": f"Task is pending/dispatch for more than {timer}, hence deleted"
-                    }
-                )
+        return True, json.dumps(tasks)
 
-        # Check the condition
-        if task["task1"]["condition"] != "dispatch":
-            return False, json.dumps({"error": "Task condition is not dispatch"})
+    except Exception as e:
+        return False, json.dumps({"error": str(e)})
 
-        # If all checks pass, return the details as JSON
 
-        return True, json.dumps(
-            {
-                "id": task["task1"]["val_id"],
-                "validators": task["task1"]["validators"],
-            }
+async def mark_validation_round_validated(val_id):
+    try:
+        update_result = await get_async_db().ValidationTask.update_one(
+            {"task1.val_id": val_id, "task1.condition": "dispatch"},
+            {"$set": {"task1.condition": "validated"}},
         )
-
+        return update_result.modified_count == 1
     except Exception as e:
-        return False, json.dumps({"error": str(e)})
+        logging.error(f"An error occurred in mark_validation_round_validated: {e}")
+        return False
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+import uuid_utils as uuid
+from pymongo import ReturnDocument
+
+from database.blob_store import put_blob_stream, release_blob
+from database.mongodb import get_async_db
+from task.leases import extend_lease
+from task.task import RESPONSE_TTL, handle_miner_response
+from utils.layout import base
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Uploads are acknowledged straight away and only accepted once ACCEPT_DELAY
+# has passed, the same minimum delay the upload endpoint used to sleep for.
+# The bytes wait in the blob store, pendingUploads holds one document per
+# upload ordered by not_before, and the pool drains the due ones.
+ACCEPT_DELAY = timedelta(seconds=base["TIME"]["UPLOAD_ACCEPT_DELAY"])
+
+# An upload left in "processing" this long belongs to a worker that died.
+CLAIM_TIMEOUT = timedelta(minutes=1)
+# How long a finished receipt can still be looked up.
+RECEIPT_TTL = timedelta(hours=1)
+UPLOAD_WORKERS = 8
+
+MAX_UPLOAD_SIZE = 3 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def hash_upload(upload_file, max_size=MAX_UPLOAD_SIZE):
+    # Hash the spooled upload a chunk at a time, stopping as soon as it grows
+    # past max_size, then rewind it so it can be streamed into the blob store.
+    digest = hashlib.sha256()
+    length = 0
+    while True:
+        chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        length += len(chunk)
+        if length > max_size:
+            return None, length
+        digest.update(chunk)
+    await upload_file.seek(0)
+    return digest.hexdigest(), length
+
+
+async def stage_upload(task_id, wallet_address, source, output_hash, length):
+    try:
+        async_db = get_async_db()
+
+        # Turn away uploads that could never be accepted before storing them.
+        task = await async_db.AiTask.find_one(
+            {"id": task_id}, {"wallet": 1, "status": 1, "receipt_id": 1}
+        )
+        if not task:
+            return False, "Task not found"
+        if task["wallet"] != wallet_address:
+            return False, "Task not found or expired"
+        if task["status"] != "sent":
+            return False, "Task already completed or invalid status"
+        if task.get("receipt_id"):
+            return False, "Task already uploaded"
+
+        now = datetime.utcnow()
+        not_before = now + ACCEPT_DELAY
+        await put_blob_stream(source, output_hash, length, not_before + RESPONSE_TTL)
+
+        receipt_id = str(uuid.uuid4())
+        # The task must not be handed to any miner again while the upload
+        # waits. The check above is only a precheck: of two uploads racing
+        # for the task, the one that records its receipt here wins.
+        if not await extend_lease(
+            task_id, wallet_address, not_before + CLAIM_TIMEOUT, receipt_id
+        ):
+            await release_blob(output_hash)
+            return False, "Task already uploaded"
+        await async_db.pendingUploads.insert_one(
+            {
+                "receipt_id": receipt_id,
+                "task_id": task_id,
+                "wallet": wallet_address,
+                "output_hash": output_hash,
+                "received_at": now,
+                "not_before": not_before,
+                "status": "queued",
+            }
+        )
+        return True, receipt_id
+    except Exception as e:
+        logging.error(f"An error occurred in stage_upload: {e}")
+        return False, str(e)
+
+
+async def claim_due_upload(async_db):
+    now = datetime.utcnow()
+    return await async_db.pendingUploads.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued", "not_before": {"$lte": now}},
+                {"status": "processing", "claimed_at": {"$lt": now - CLAIM_TIMEOUT}},
+            ]
+        },
+        {"$set": {"status": "processing", "claimed_at": now}},
+        sort=[("not_before", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def accept_upload(async_db, upload):
+    try:
+        success, message = await handle_miner_response(
+            upload["task_id"],
+            upload["wallet"],
+            upload["output_hash"],
+            upload["received_at"],
+        )
+    except Exception as e:
+        success, message = False, str(e)
+
+    # The staged copy is no longer needed, an accepted response holds its own
+    # reference to the blob.
+    await release_blob(upload["output_hash"])
+    await async_db.pendingUploads.update_one(
+        {"_id": upload["_id"]},
+        {
+            "$set": {
+                "status": "accepted" if success else "rejected",
+                "message": message,
+                "expireAt": datetime.utcnow() + RECEIPT_TTL,
+            }
+        },
+    )
+    return success
+
+
+async def drain_uploads(async_db):
+    processed = 0
+    while True:
+        upload = await claim_due_upload(async_db)
+        if upload is None:
+            return processed
+        await accept_upload(async_db, upload)
+        processed += 1
+
+
+async def accept_due_uploads():
+    try:
+        async_db = get_async_db()
+        processed = await asyncio.gather(
+            *(drain_uploads(async_db) for _ in range(UPLOAD_WORKERS))
+        )
+        return True, sum(processed)
+    except Exception as e:
+        logging.error(f"An error occurred in accept_due_uploads: {e}")
+        return False, 0
+
+
+async def upload_receipt(receipt_id):
+    upload = await get_async_db().pendingUploads.find_one(
+        {"receipt_id": receipt_id},
+        {"_id": 0, "output_hash": 0, "claimed_at": 0, "expireAt": 0},
+    )
+    if upload is None:
+        return False, {"success": False, "error": "Receipt not found or expired."}
+    for field in ("received_at", "not_before"):
+        upload[field] = upload[field].isoformat()
+    return True, upload
@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+from utils.layout import base
+
+MISSING = object()
+
+
+class TTLCache:
+    # A bounded LRU cache whose entries also expire ttl seconds after they were
+    # stored. The pool serves miners and FastAPI from different threads, so
+    # every operation takes the lock.
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Caches only see changes made in this process. register_miner runs here and
+# invalidates explicitly, while validator verdicts are written by validation.py,
+# so eligibility also relies on its shorter TTL.
+address_cache = TTLCache(
+    "address", base["CACHE"]["MAX_SIZE"], base["CACHE"]["ADDRESS_TTL"]
+)
+whitelist_cache = TTLCache(
+    "whitelist", base["CACHE"]["MAX_SIZE"], base["CACHE"]["WHITELIST_TTL"]
+)
+eligibility_cache = TTLCache(
+    "eligibility", base["CACHE"]["MAX_SIZE"], base["CACHE"]["ELIGIBILITY_TTL"]
+)
+
+
+def cache_stats():
+    return {
+        cache.name: cache.stats()
+        for cache in (address_cache, whitelist_cache, eligibility_cache)
+    }
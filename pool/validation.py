@@ -12,7 +12,11 @@ from api.api_client import test_api_connection
 from protocol.protocol import validation_protocol
 from database.mongodb import test_db_connection
 from utils.layout import base
-from task.task import select_task_for_validation, add_processed_validator
+from task.task import (
+    select_tasks_for_validation,
+    add_processed_validator,
+    mark_validation_round_validated,
+)
 from task.send_task import upload_images_to_endpoint
 
 
@@ -171,6 +175,69 @@ async def send_response_to_validator(validator_info, message):
     return None
 
 
+async def dispatch_round(task, peers):
+    val_id = task["id"]
+    temp_peers = [
+        (validator_id, validator_info, validator_endpoint)
+        for validator_id, validator_info, validator_endpoint in peers
+        if validator_id not in task.get("validators", [])
+    ]
+    processed_validators = set()
+
+    logging.info(f"Round {val_id} temp_peers: {temp_peers}")
+
+    for validator_info in temp_peers:
+        validator_id, validator_uri, validator_endpoint = validator_info
+        logging.info(
+            f"Processing validator {validator_id} with URI {validator_uri} and endpoint and {validator_endpoint} for round {val_id}"
+        )
+
+        try:
+
+            # Use HTTP request to upload images to the validator's endpoint
+            status, response = await asyncio.to_thread(
+                upload_images_to_endpoint, validator_endpoint, val_id
+            )
+            logging.info(f"Response from validator {validator_id}: {response}")
+            response_json = response if isinstance(response, dict) else {}
+
+            if not status or response_json.get("status") == False:
+                logging.error(
+                    f"Validator {validator_id} responded with error: {response_json.get('message', response)}"
+                )
+                continue
+
+            if response_json.get("status") == True:
+                validator_wallet = response_json.get("validator_wallet")
+
+                update = await add_processed_validator(
+                    response_json.get("val_id"), validator_wallet
+                )
+                if update:
+                    logging.info(
+                        f"Task updated successfully for validator {validator_wallet}."
+                    )
+                else:
+                    logging.info(
+                        f"Failed to update task for validator {validator_wallet}."
+                    )
+            processed_validators.add(validator_id)
+
+        except json.JSONDecodeError:
+            logging.error(
+                f"Failed to parse JSON response from validator {validator_id}."
+            )
+        except Exception as e:
+            logging.error(
+                f"An error occurred while processing validator {validator_id}: {str(e)}"
+            )
+
+    # Once every known peer has seen the round it has nothing left to dispatch
+    if len(processed_validators) == len(temp_peers):
+        if await mark_validation_round_validated(val_id):
+            logging.info(f"Round {val_id} has been validated by all peers.")
+
+
 async def connect():
     while True:
         try:
@@ -179,13 +246,13 @@ async def connect():
                 await asyncio.sleep(30)
                 continue
 
-            success, task_data = await select_task_for_validation()
+            success, task_data = await select_tasks_for_validation()
             if not success:
                 logging.info("No Task found for Validation. Retrying...")
                 await asyncio.sleep(60)
                 continue
 
-            task = json.loads(task_data)
+            tasks = json.loads(task_data)
 
             peers = read_peers("peers.json")
             if not peers:
@@ -193,69 +260,8 @@ async def connect():
                 await asyncio.sleep(60)
                 continue
 
-            temp_peers = [
-                (validator_id, validator_info, validator_endpoint)
-                for validator_id, validator_info, validator_endpoint in peers
-                if validator_id not in task.get("validators", [])
-            ]
-            processed_validators = set()
-
-            logging.info(f"temp_peers: {temp_peers}")
-
-            for validator_info in temp_peers[:]:
-                validator_id, validator_uri, validator_endpoint = validator_info
-                logging.info(
-                    f"Processing validator {validator_id} with URI {validator_uri} and endpoint and {validator_endpoint}"
-                )
-                if validator_id in processed_validators:
-                    continue
-
-                try:
-
-                    # Use HTTP request to upload images to the validator's endpoint
-                    status, response = upload_images_to_endpoint(validator_endpoint)
-                    logging.info(f"Response from validator {validator_id}: {response}")
-                    response_json = response
-
-                    if not status or response_json.get("status") == False:
-                        logging.error(
-                            f"Validator {validator_id} responded with error: {response_json.get('message')}"
-                        )
-                        continue
-
-                    if response_json.get("status") == True:
-                        val_id = response_json.get("val_id")
-                        validator_wallet = response_json.get("validator_wallet")
-
-                        update = add_processed_validator(val_id, validator_wallet)
-                        if update:
-                            logging.info(
-                                f"Task updated successfully for validator {validator_wallet}."
-                            )
-                        else:
-                            logging.info(
-                                f"Failed to update task for validator {validator_wallet}."
-                            )
-                    processed_validators.add(validator_id)
-                    temp_peers.remove(validator_info)
-
-                    temp_peers = [
-                        peer
-                        for peer in temp_peers
-                        if peer[0] not in processed_validators
-                    ]
-
-                except json.JSONDecodeError:
-                    logging.error(
-                        f"Failed to parse JSON response from validator {validator_id}."
-                    )
-                except Exception as e:
-                    logging.error(
-                        f"An error occurred while processing validator {validator_id}: {str(e)}"
-                    )
-
-                if not temp_peers:
-                    break
+            # Rounds are independent, dispatch them concurrently
+            await asyncio.gather(*(dispatch_round(task, peers) for task in tasks))
 
             await asyncio.sleep(120)
 
@@ -1,10 +1,13 @@
 from fastapi import FastAPI, HTTPException, Query, Request, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+import csv
+import io
+import json
 
 from pydantic import BaseModel
 from typing import List, Optional
@@ -21,6 +24,9 @@ from database.db_requests import (
     deduct_balance_from_wallet,
     deduct_balance_from_entityOwners,
     get_latest_transactions,
+    get_balance_history,
+    get_reward_history,
+    iter_reward_history,
 )
 from task.task import handle_pool_response
 from utils.layout import base
@@ -169,9 +175,15 @@ async def valowner_deduct_balance(
 
 @app.get("/latestwithdraws/")
 @limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
-async def latest_withdraws(
-    request: Request, wallet_address: str, page: str, page_size: str
+def latest_withdraws(
+    request: Request,
+    wallet_address: str,
+    page: str = "1",
+    page_size: str = "10",
+    cursor: str = None,
 ):
+    # A plain def runs in FastAPI's threadpool, so the blocking reads stay off
+    # the event loop.
     if not wallet_address:
         raise HTTPException(status_code=400, detail="Wallet address must be provided")
 
@@ -183,16 +195,142 @@ async def latest_withdraws(
             status_code=400, detail="Page and page size must be integers"
         )
 
-    result = get_latest_transactions(wallet_address, page, page_size)
+    result = get_latest_transactions(wallet_address, page, page_size, cursor)
+
+    if "error" in result:
+        message = result["error"]
+        if message.startswith("Invalid"):
+            raise HTTPException(status_code=400, detail=message)
+        status_code = 404 if "not found" in message.lower() else 500
+        raise HTTPException(status_code=status_code, detail=message)
+
+    return result
+
+
+@app.get("/balance_history/")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+def balance_history(
+    request: Request,
+    wallet_address: str,
+    page_size: str = "10",
+    cursor: str = None,
+):
+    # A plain def runs in FastAPI's threadpool, so the blocking ledger reads
+    # stay off the event loop.
+    if not wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address must be provided")
+
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Page size must be an integer")
+
+    result = get_balance_history(wallet_address, page_size, cursor)
 
     if "error" in result:
         message = result["error"]
+        if message.startswith("Invalid"):
+            raise HTTPException(status_code=400, detail=message)
         status_code = 404 if "not found" in message.lower() else 500
         raise HTTPException(status_code=status_code, detail=message)
 
     return result
 
 
+def parse_since(since):
+    if since is None:
+        return None
+    try:
+        return datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="since must be an ISO 8601 date or datetime"
+        )
+
+
+@app.get("/reward_history/")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+def reward_history(
+    request: Request,
+    wallet_address: str,
+    page_size: str = "10",
+    cursor: str = None,
+    since: str = None,
+):
+    # A plain def runs in FastAPI's threadpool, so the blocking reads stay off
+    # the event loop.
+    if not wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address must be provided")
+
+    try:
+        page_size = int(page_size)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Page size must be an integer")
+
+    result = get_reward_history(wallet_address, page_size, cursor, parse_since(since))
+
+    if "error" in result:
+        message = result["error"]
+        if message.startswith("Invalid"):
+            raise HTTPException(status_code=400, detail=message)
+        status_code = 404 if "not found" in message.lower() else 500
+        raise HTTPException(status_code=status_code, detail=message)
+
+    return result
+
+
+def reward_history_ndjson(rows):
+    for row in rows:
+        row["timestamp"] = row["timestamp"].isoformat()
+        yield json.dumps(row) + "\n"
+
+
+def reward_history_csv(rows):
+    # Columns are taken from the first row; every row of a service has the
+    # same fields.
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        row["timestamp"] = row["timestamp"].isoformat()
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+@app.get("/reward_history/export")
+@limiter.limit(base["RATE_LIMIT"]["RATE_LIMIT1"])
+def export_reward_history(
+    request: Request,
+    wallet_address: str,
+    format: str = "ndjson",
+    since: str = None,
+):
+    # Streams every row instead of building the export in memory. The rows
+    # are plain generators over a blocking cursor, which StreamingResponse
+    # iterates in the threadpool, so the cursor never runs on the event loop.
+    if not wallet_address:
+        raise HTTPException(status_code=400, detail="Wallet address must be provided")
+
+    rows = iter_reward_history(wallet_address, parse_since(since))
+    if format == "ndjson":
+        return StreamingResponse(
+            reward_history_ndjson(rows), media_type="application/x-ndjson"
+        )
+    if format == "csv":
+        return StreamingResponse(
+            reward_history_csv(rows),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="rewards-{wallet_address}.csv"'
+            },
+        )
+    raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+
 @app.post("/upload_tasks/")
 async def upload_tasks(validation_task: ValidationTask):
     try:
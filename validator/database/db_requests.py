@@ -1,6 +1,13 @@
 from datetime import datetime, timedelta
-from database.mongodb import userStats, entityOwners, userTxReference
-from reward_logic.percentage import round_up_decimal_new
+
+from bson import ObjectId
+from bson.errors import InvalidId
+import uuid_utils as uuid
+
+from database.mongodb import userStats, entityOwners, userTxReference, rewardHistory
+from database.migrations import LEGACY_TIMESTAMP
+from reward_logic.fixed_point import to_units, from_units, format_units
+from reward_logic.ledger import OWNER_ACCOUNT, debit_account, account_history
 from transaction.payment import add_transaction_to_batch
 
 from decimal import Decimal, InvalidOperation
@@ -8,13 +15,13 @@ from decimal import Decimal, InvalidOperation
 
 def get_balance_from_wallet(delegate):
     try:
-        user = userStats.find_one({"delegate": delegate}, {"balance": 1})
+        user = userStats.find_one({"delegate": delegate}, {"balance_units": 1})
         if user is None:
             return "Error: Wallet address not found."
 
-        balance = user.get("balance")
+        balance = user.get("balance_units")
         if balance is not None:
-            return balance
+            return from_units(balance)
         else:
             return "Error: Balance not found for the given wallet address."
     except Exception as e:
@@ -24,12 +31,12 @@ def get_balance_from_wallet(delegate):
 def get_balance_entityOwners():
     try:
         # Find the document with the _id "entityOwners"
-        entrydata = entityOwners.find_one({"_id": "entityOwners"}, {"amount": 1})
+        entrydata = entityOwners.find_one({"_id": "entityOwners"}, {"amount_units": 1})
 
         if entrydata:
-            balance = entrydata.get("amount")
+            balance = entrydata.get("amount_units")
             if balance is not None:
-                return balance
+                return from_units(balance)
             else:
                 return "Error: Balance not found for the validator."
         else:
@@ -54,41 +61,30 @@ def deduct_balance_from_wallet(delegate, amount_to_deduct):
         except InvalidOperation:
             return None, "Error: Invalid deduction amount format."
 
-        # Find the document with the given wallet address
-        user = userStats.find_one({"delegate": delegate}, {"balance": 1})
-
-        if user is None:
-            return None, "Error: Delegate Wallet address not found."
+        amount_to_deduct = to_units(amount_to_deduct)
 
-        balance = Decimal(user.get("balance", 0))
-        balance = round_up_decimal_new(balance)
-        if balance is None or balance < Decimal("0.001"):
-            return None, "Error: Insufficient balance for deduction."
+        # Book the debit and take it off the balance only if it covers it, so
+        # concurrent requests cannot overdraw the delegate. The ledger entry
+        # and the queued withdrawal share the same id.
+        withdrawal_id = str(uuid.uuid4())
+        user = debit_account(
+            delegate, amount_to_deduct, withdrawal_id, "deduct_user_balance"
+        )
 
-        # Calculate the new balance
-        new_balance = balance - amount_to_deduct
-        if new_balance < 0:
+        if user is None:
+            user = userStats.find_one({"delegate": delegate}, {"balance_units": 1})
+            if user is None:
+                return None, "Error: Delegate Wallet address not found."
+            if user.get("balance_units", 0) < to_units("0.001"):
+                return None, "Error: Insufficient balance for deduction."
             return None, "Error: Deduction amount exceeds current balance."
 
-        new_balance = round_up_decimal_new(new_balance)
-
-        # Update the balance in the database
-        result = userStats.update_one(
-            {"delegate": delegate},
-            {"$set": {"balance": float(new_balance)}},
+        add_transaction_to_batch(
+            delegate, amount_to_deduct, "deduct_user_balance", withdrawal_id
         )
-
-        amount_to_deduct = round_up_decimal_new(amount_to_deduct)
-
-        if result.modified_count == 1:
-            add_transaction_to_batch(
-                delegate, float(amount_to_deduct), "deduct_user_balance"
-            )
-            return True, {
-                "message": f"Amount deducted successfully: {amount_to_deduct}"
-            }
-        else:
-            return None, "Error: Failed to update the balance."
+        return True, {
+            "message": f"Amount deducted successfully: {format_units(amount_to_deduct)}"
+        }
 
     except Exception as e:
         return (
@@ -113,50 +109,35 @@ def deduct_balance_from_entityOwners(amount_to_deduct):
         except InvalidOperation:
             return None, "Error: Invalid deduction amount format."
 
-        # Find the pool document
-        entry = entityOwners.find_one(
-            {"_id": "entityOwners"}, {"amount": 1, "wallet_address": 1}
+        amount_to_deduct = to_units(amount_to_deduct)
+
+        # Conditional debit of the validator owner's balance, as for delegates.
+        withdrawal_id = str(uuid.uuid4())
+        entry = debit_account(
+            OWNER_ACCOUNT,
+            amount_to_deduct,
+            withdrawal_id,
+            "deduct_pool_balance",
+            {"$set": {"last_processed": datetime.utcnow()}},
         )
 
         if entry is None:
-            return None, "Error: validator reward not found."
-
-        balance = Decimal(entry.get("amount", 0))
-        balance = round_up_decimal_new(balance)
-        if balance is None or balance < Decimal("0.001"):
-            return None, "Error: Insufficient balance for deduction."
-
-        # Calculate the new balance
-        new_balance = balance - amount_to_deduct
-        if new_balance < 0:
+            entry = entityOwners.find_one({"_id": OWNER_ACCOUNT}, {"amount_units": 1})
+            if entry is None:
+                return None, "Error: validator reward not found."
+            if entry.get("amount_units", 0) < to_units("0.001"):
+                return None, "Error: Insufficient balance for deduction."
             return None, "Error: Deduction amount exceeds current balance."
 
-        new_balance = round_up_decimal_new(new_balance)
-
-        # Update the balance in the database
-        result = entityOwners.update_one(
-            {"_id": "entityOwners"},
-            {
-                "$set": {
-                    "amount": float(new_balance),
-                    "last_processed": datetime.utcnow(),
-                }
-            },
+        add_transaction_to_batch(
+            entry.get("wallet_address"),
+            amount_to_deduct,
+            "deduct_pool_balance",
+            withdrawal_id,
         )
-
-        amount_to_deduct = round_up_decimal_new(amount_to_deduct)
-
-        if result.modified_count == 1:
-            add_transaction_to_batch(
-                entry.get("wallet_address"),
-                float(amount_to_deduct),
-                "deduct_pool_balance",
-            )
-            return True, {
-                "message": f"Amount deducted successfully: {amount_to_deduct}"
-            }
-        else:
-            return None, "Error: Failed to update the pool balance."
+        return True, {
+            "message": f"Amount deducted successfully: {format_units(amount_to_deduct)}"
+        }
 
     except Exception as e:
         return (
@@ -165,44 +146,197 @@ def deduct_balance_from_entityOwners(amount_to_deduct):
         )
 
 
-def get_latest_transactions(wallet_address, page=1, page_size=10):
+# Largest page the history endpoints serve.
+MAX_PAGE_SIZE = 100
+
+
+def page_size_error(page_size):
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        return f"Invalid page size, must be between 1 and {MAX_PAGE_SIZE}"
+    return None
+
+
+def encode_tx_cursor(transaction):
+    # The position after a transaction in (timestamp, _id) descending order.
+    milliseconds = (transaction["timestamp"] - LEGACY_TIMESTAMP) // timedelta(
+        milliseconds=1
+    )
+    return f"{milliseconds}_{transaction['_id']}"
+
+
+def decode_tx_cursor(cursor):
+    try:
+        milliseconds, last_id = cursor.split("_", 1)
+        return LEGACY_TIMESTAMP + timedelta(milliseconds=int(milliseconds)), ObjectId(
+            last_id
+        )
+    except (ValueError, InvalidId):
+        return None
+
+
+def get_latest_transactions(wallet_address, page=1, page_size=10, cursor=None):
+    # One document per transaction, read newest first from the
+    # (wallet_address, timestamp, _id) index. With a cursor the page starts
+    # right after the previous one whatever the wallet's history size; page
+    # numbers still work for older clients but skip over the earlier pages.
     try:
-        # Find the document with the given wallet address
-        user_doc = userTxReference.find_one({"wallet_address": wallet_address})
+        error = page_size_error(page_size)
+        if error:
+            return {"error": error}
+        if page < 1:
+            return {"error": "Invalid page, must be at least 1"}
+
+        query = {"wallet_address": wallet_address}
+        if cursor:
+            position = decode_tx_cursor(cursor)
+            if position is None:
+                return {"error": "Invalid cursor"}
+            timestamp, last_id = position
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": last_id}},
+            ]
+
+        results = userTxReference.find(query, {"hash": 1, "timestamp": 1}).sort(
+            [("timestamp", -1), ("_id", -1)]
+        )
+        if not cursor:
+            results = results.skip((page - 1) * page_size)
+        transactions = list(results.limit(page_size + 1))
 
-        if not user_doc:
+        if not transactions and not cursor and page == 1:
             return {"error": "Wallet address not found"}
 
-        transactions = user_doc.get("transactions", [])
+        next_cursor = None
+        if len(transactions) > page_size:
+            transactions = transactions[:page_size]
+            next_cursor = encode_tx_cursor(transactions[-1])
 
-        # Separate transactions with and without timestamps
-        transactions_with_time = []
-        transactions_without_time = []
+        result = {
+            "page_size": page_size,
+            "transactions": [
+                {
+                    "hash": transaction["hash"],
+                    "timestamp": (
+                        None
+                        if transaction["timestamp"] == LEGACY_TIMESTAMP
+                        else transaction["timestamp"]
+                    ),
+                }
+                for transaction in transactions
+            ],
+            "next_cursor": next_cursor,
+        }
+        if not cursor:
+            result["page"] = page
+            result["total_transactions"] = userTxReference.count_documents(
+                {"wallet_address": wallet_address}
+            )
+        return result
 
-        for tx in transactions:
-            if isinstance(tx, dict) and "timestamp" in tx:
-                transactions_with_time.append(tx)
-            else:
-                transactions_without_time.append({"hash": tx, "timestamp": None})
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def get_balance_history(wallet_address, page_size=10, cursor=None):
+    # Ledger entries of the delegate, newest first, each with the balance after
+    # it. The cursor is the _id of the last entry of the previous page.
+    try:
+        error = page_size_error(page_size)
+        if error:
+            return {"error": error}
+
+        before = None
+        if cursor:
+            try:
+                before = ObjectId(cursor)
+            except InvalidId:
+                return {"error": "Invalid cursor"}
+
+        entries = account_history(wallet_address, page_size + 1, before)
+        if not entries and not cursor:
+            return {"error": "Wallet address not found"}
+
+        next_cursor = None
+        if len(entries) > page_size:
+            entries = entries[:page_size]
+            next_cursor = str(entries[-1]["_id"])
+
+        return {
+            "page_size": page_size,
+            "entries": [
+                {
+                    "type": entry["type"],
+                    "ref": entry["ref"],
+                    "amount": from_units(entry["amount_units"]),
+                    "balance": from_units(entry["balance_units"]),
+                    "timestamp": entry["timestamp"],
+                }
+                for entry in entries
+            ],
+            "next_cursor": next_cursor,
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
 
-        # Sort transactions with time by timestamp in descending order
-        transactions_with_time.sort(key=lambda x: x["timestamp"], reverse=True)
 
-        # Combine both lists (transactions without time come last)
-        sorted_transactions = transactions_with_time + transactions_without_time
+def reward_history_row(row):
+    # The row as returned by the API, without its internal fields.
+    return {
+        key: value for key, value in row.items() if key not in ("_id", "wallet_address")
+    }
 
-        # Paginate the results
-        total_transactions = len(sorted_transactions)
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_transactions = sorted_transactions[start_index:end_index]
+
+def get_reward_history(wallet_address, page_size=10, cursor=None, since=None):
+    # One row per block range the wallet was rewarded in, newest first, read
+    # from the (wallet_address, timestamp, _id) index and paged with the same
+    # cursors as get_latest_transactions.
+    try:
+        error = page_size_error(page_size)
+        if error:
+            return {"error": error}
+
+        query = {"wallet_address": wallet_address}
+        if since is not None:
+            query["timestamp"] = {"$gte": since}
+        if cursor:
+            position = decode_tx_cursor(cursor)
+            if position is None:
+                return {"error": "Invalid cursor"}
+            timestamp, last_id = position
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": last_id}},
+            ]
+
+        rows = list(
+            rewardHistory.find(query)
+            .sort([("timestamp", -1), ("_id", -1)])
+            .limit(page_size + 1)
+        )
+        if not rows and not cursor and since is None:
+            return {"error": "Wallet address not found"}
+
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_tx_cursor(rows[-1])
 
         return {
-            "page": page,
             "page_size": page_size,
-            "total_transactions": total_transactions,
-            "transactions": paginated_transactions,
+            "rewards": [reward_history_row(row) for row in rows],
+            "next_cursor": next_cursor,
         }
 
     except Exception as e:
         return {"error": str(e)}
+
+
+def iter_reward_history(wallet_address, since=None):
+    # Every row of the wallet, newest first, streamed from the cursor.
+    query = {"wallet_address": wallet_address}
+    if since is not None:
+        query["timestamp"] = {"$gte": since}
+    for row in rewardHistory.find(query).sort([("timestamp", -1), ("_id", -1)]):
+        yield reward_history_row(row)
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+from database.mongodb import (
+    userTxReference,
+    submittedTransactions,
+    errorTransactions,
+    catchTransactions,
+    userStats,
+    entityOwners,
+    tempWithdrawals,
+    rewardLog,
+)
+from reward_logic.fixed_point import UNITS_PER_COIN
+from reward_logic.reward_log import write_reward_history
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Transaction history used to be one document per wallet with every transaction
+# $push-ed into its "transactions" array, and is now one document per
+# transaction. Hashes recorded without a time get LEGACY_TIMESTAMP so they sort
+# after every dated transaction, as they did before.
+LEGACY_TIMESTAMP = datetime(1970, 1, 1)
+MIGRATION_BATCH = 1000
+
+
+def legacy_object_id(legacy_id, index, timestamp):
+    # The same array entry always gets the same _id, so a migration interrupted
+    # between copying a wallet and deleting its array replaces the copies when
+    # it runs again instead of duplicating them.
+    seconds = int((timestamp - LEGACY_TIMESTAMP).total_seconds())
+    digest = hashlib.sha1(f"{legacy_id}:{index}".encode()).digest()
+    return ObjectId(seconds.to_bytes(4, "big") + digest[:8])
+
+
+def unwind_transactions(collection):
+    migrated = 0
+    for legacy in collection.find({"transactions": {"$exists": True}}):
+        operations = []
+        for index, entry in enumerate(legacy["transactions"]):
+            document = dict(entry) if isinstance(entry, dict) else {"hash": entry}
+            if not isinstance(document.get("timestamp"), datetime):
+                document["timestamp"] = LEGACY_TIMESTAMP
+            document["wallet_address"] = legacy.get("wallet_address")
+            document["_id"] = legacy_object_id(
+                legacy["_id"], index, document["timestamp"]
+            )
+            operations.append(
+                ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+            )
+            if len(operations) == MIGRATION_BATCH:
+                collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        collection.delete_one({"_id": legacy["_id"]})
+        migrated += len(legacy["transactions"])
+    return migrated
+
+
+def migrate_transaction_history():
+    try:
+        migrated = sum(
+            unwind_transactions(collection)
+            for collection in (
+                userTxReference,
+                submittedTransactions,
+                errorTransactions,
+                catchTransactions,
+            )
+        )
+        return True, migrated
+    except PyMongoError as e:
+        logging.error(f"An error occurred in migrate_transaction_history: {e}")
+        return False, 0
+
+
+def float_to_units(collection, field, units_field):
+    # One pipeline update per collection: the float goes through decimal so
+    # 0.1 becomes 10000000 units, and the old field is removed in the same
+    # write. Documents that already have units_field are skipped, so it can
+    # run again safely.
+    result = collection.update_many(
+        {field: {"$exists": True}, units_field: {"$exists": False}},
+        [
+            {
+                "$set": {
+                    units_field: {
+                        "$toLong": {
+                            "$round": [
+                                {
+                                    "$multiply": [
+                                        {"$toDecimal": f"${field}"},
+                                        UNITS_PER_COIN,
+                                    ]
+                                },
+                                0,
+                            ]
+                        }
+                    }
+                }
+            },
+            {"$unset": field},
+        ],
+    )
+    return result.modified_count
+
+
+def migrate_float_amounts():
+    # Balances and queued payouts stored as float coins move to int64 base
+    # units.
+    try:
+        migrated = (
+            float_to_units(userStats, "balance", "balance_units")
+            + float_to_units(entityOwners, "amount", "amount_units")
+            + float_to_units(tempWithdrawals, "new_balance", "amount_units")
+        )
+        return True, migrated
+    except PyMongoError as e:
+        logging.error(f"An error occurred in migrate_float_amounts: {e}")
+        return False, 0
+
+
+def migrate_reward_history():
+    # rewardHistory rows for rewardLog documents written before it existed,
+    # dated by the document's ObjectId. Each document is flagged once its rows
+    # are written; an interrupted run rewrites the rows of at most one
+    # document, and those are skipped as duplicates.
+    try:
+        migrated = 0
+        for document in rewardLog.find({"history": {"$exists": False}}):
+            migrated += write_reward_history(
+                document["block_height"],
+                document.get("updates") or {},
+                document["_id"].generation_time.replace(tzinfo=None),
+            )
+            rewardLog.update_one({"_id": document["_id"]}, {"$set": {"history": True}})
+        return True, migrated
+    except PyMongoError as e:
+        logging.error(f"An error occurred in migrate_reward_history: {e}")
+        return False, 0
+
+
+if __name__ == "__main__":
+    print(migrate_transaction_history())
+    print(migrate_float_amounts())
+    print(migrate_reward_history())
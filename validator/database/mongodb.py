@@ -37,13 +37,42 @@ submittedTransactions = db.submittedTransactions
 userTxReference = db.userTxReference
 verifiedTransactions = db.verifiedTransactions
 rewardLog = db.rewardLog
+rewardHistory = db.rewardHistory
 entityOwners = db.entityOwners
 blockHeight = db.blockHeight
 blockTransactions = db.blockTransactions
 errorTransactions = db.errorTransactions
 catchTransactions = db.catchTransactions
+ledger = db.ledger
 
 # tasks
 storeTasks = db.storeTasks
 poolTasks = db.poolTasks
 iNodeTask = db.iNodeTask
+
+
+try:
+    userTxReference.create_index(
+        [("wallet_address", 1), ("timestamp", -1), ("_id", -1)]
+    )
+    submittedTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    errorTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    catchTransactions.create_index([("wallet_address", 1), ("timestamp", -1)])
+    print("Transaction history indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating transaction history indexes: {e}")
+
+try:
+    ledger.create_index([("account", 1), ("ref", 1)], unique=True)
+    ledger.create_index([("account", 1), ("_id", -1)])
+    ledger.create_index([("applied", 1)], partialFilterExpression={"applied": False})
+    print("Ledger indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating ledger indexes: {e}")
+
+try:
+    rewardHistory.create_index([("wallet_address", 1), ("block_range", 1)], unique=True)
+    rewardHistory.create_index([("wallet_address", 1), ("timestamp", -1), ("_id", -1)])
+    print("Reward history indexes created successfully.")
+except Exception as e:
+    print(f"An error occurred while creating reward history indexes: {e}")
@@ -10,6 +10,13 @@ import json
 from api.fastapi import app
 from api.api_client import test_api_connection
 from database.mongodb import test_db_connection
+from database.migrations import (
+    migrate_transaction_history,
+    migrate_float_amounts,
+    migrate_reward_history,
+)
+from reward_logic.ledger import open_ledger, audit_ledger
+from database.archive import archive_collections
 from utils.layout import base
 from protocol.protocol import (
     validator_protocol,
@@ -65,6 +72,17 @@ def update_balance_periodically():
         print(f"Error in update_balance_periodically: {e}")
 
 
+def archive_periodically():
+    try:
+        while True:
+            success, archived = archive_collections()
+            if success and any(archived.values()):
+                logging.info(f"Archived {sum(archived.values())} documents: {archived}")
+            time.sleep(base["ARCHIVE"]["INTERVAL"])
+    except Exception as e:
+        print(f"Error in archive_periodically: {e}")
+
+
 async def periodic_send_ping():
     while True:
         ip = base["VALIDATOR_SOCKET"]["SERVER_IP"]
@@ -145,6 +163,11 @@ async def periodic_send_task_to_pool():
 
 
 async def main():
+    migrate_transaction_history()
+    migrate_float_amounts()
+    open_ledger()
+    audit_ledger()
+    migrate_reward_history()
     start_server = websockets.serve(
         validator_protocol,
         base["VALIDATOR_SOCKET"]["IP"],
@@ -153,8 +176,10 @@ async def main():
     await start_server
     fastapi_thread = threading.Thread(daemon=True, target=run_fastapi)
     balance_thread = threading.Thread(target=update_balance_periodically, daemon=True)
+    archive_thread = threading.Thread(target=archive_periodically, daemon=True)
     fastapi_thread.start()
     balance_thread.start()
+    archive_thread.start()
 
     periodic_task = asyncio.create_task(periodic_process_transactions())
     periodic_ping_task = asyncio.create_task(periodic_send_ping())
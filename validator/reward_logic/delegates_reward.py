@@ -1,13 +1,16 @@
 from decimal import Decimal
 from reward_logic.reward_log import store_in_db, retrieve_from_db
-from reward_logic.percentage import round_up_decimal_new
+from reward_logic.fixed_point import apportion, from_units
+from reward_logic.ledger import ledger_entry, credit_accounts
 from database.mongodb import userStats
 
 
 def update_delegate_balances(amount, sorted_delegates, block_range_str):
-    amount = Decimal(amount)
+    # amount is in base units.
     delegate_updates = {}
     try:
+        delegates = []
+        percentages = []
         for delegate_info in sorted_delegates[1]:
             # Debug: Print each delegate_info
             # print("Processing delegate_info:", delegate_info)
@@ -23,38 +26,53 @@ def update_delegate_balances(amount, sorted_delegates, block_range_str):
                 print(f"Percentage for delegate {delegate} is too small or missing.")
                 continue
 
-            percentage = Decimal(percentage)
-            amount_to_add = round_up_decimal_new((amount * percentage) / 100)
+            delegates.append(delegate)
+            percentages.append(Decimal(str(percentage)))
 
+        # Split in base units by largest remainder. The part of the 100% that
+        # no delegate holds is apportioned too and left undistributed, so no
+        # delegate gets more than its percentage.
+        unallocated = max(Decimal(0), Decimal(100) - sum(percentages))
+        shares = apportion(amount, percentages + [unallocated])[:-1]
+
+        entries = []
+        for delegate, amount_to_add in zip(delegates, shares):
             if amount_to_add == 0:
                 print(
                     f"Calculated amount for delegate {delegate} is too small to process."
                 )
                 continue
+            entries.append(
+                ledger_entry(
+                    delegate,
+                    amount_to_add,
+                    f"delegate_{block_range_str}",
+                    "delegate_reward",
+                )
+            )
 
-            # Fetch the current balance from MongoDB
-            delegate_record = userStats.find_one({"delegate": delegate})
-            if delegate_record:
-                current_balance = Decimal(delegate_record["balance"])
-                previous_balance = current_balance
-                new_balance = current_balance + amount_to_add
-            else:
-                previous_balance = Decimal("0.0")
-                new_balance = amount_to_add
-                new_balance = round_up_decimal_new(new_balance)
+        # Book the credits in the ledger and move the balance snapshots in bulk
+        failed = {entry["account"] for entry in credit_accounts(entries)}
+        if failed:
+            print(f"Balance updates failed for delegates: {sorted(failed)}")
 
-            # Update or insert the delegate balance in MongoDB
-            userStats.update_one(
-                {"delegate": delegate},
-                {"$set": {"balance": float(new_balance)}},
-                upsert=True,
-            )
+        credited = {
+            entry["account"]: entry["amount_units"]
+            for entry in entries
+            if entry["account"] not in failed
+        }
+        for delegate_record in userStats.find(
+            {"delegate": {"$in": list(credited)}}, {"delegate": 1, "balance_units": 1}
+        ):
+            delegate = delegate_record["delegate"]
+            new_balance = delegate_record["balance_units"]
+            amount_to_add = credited[delegate]
 
             # Update delegate_updates with the necessary information
             delegate_updates[delegate] = {
-                "previous_balance": float(previous_balance),
-                "added_amount": float(amount_to_add),
-                "current_balance": float(new_balance),
+                "previous_balance": float(from_units(new_balance - amount_to_add)),
+                "added_amount": float(from_units(amount_to_add)),
+                "current_balance": float(from_units(new_balance)),
             }
 
         # Store the updates in DB
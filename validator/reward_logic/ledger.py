@@ -0,0 +1,380 @@
+import logging
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.int64 import Int64
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database.mongodb import ledger, userStats, entityOwners
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s:%(levelname)s - %(message)s"
+)
+
+# Every balance change is appended to the ledger as one entry, positive for a
+# credit and negative for a debit, unique per (account, ref) so a reward cycle
+# or withdrawal is never booked twice. The balance read by the API is a
+# snapshot kept next to it, userStats.balance_units for delegates and
+# entityOwners.amount_units for the validator owner, moved with $inc by the
+# same amount once the entry is written.
+#
+# Entries are written with applied: False and the flag is removed once the
+# snapshot has moved. The snapshot keeps the _ids of its last APPLIED_WINDOW
+# entries in applied_entries and only moves for an entry missing from it, so
+# applying an entry twice is a no-op. Entries a crash or a lost connection
+# left unapplied are finished by settle_entries, or by the next credit of the
+# same (account, ref), so the snapshot always equals the sum of the account's
+# applied entries; verify_balances reports accounts where it does not.
+OWNER_ACCOUNT = "entityOwners"
+
+DUPLICATE_KEY = 11000
+
+APPLIED_WINDOW = 16
+
+# Unapplied entries younger than this are left to the call writing them.
+SETTLE_AFTER = timedelta(minutes=5)
+
+APPLIED = {"applied": {"$ne": False}}
+
+
+def snapshot_of(account):
+    # (collection, filter, balance field) of the account's balance snapshot.
+    if account == OWNER_ACCOUNT:
+        return entityOwners, {"_id": OWNER_ACCOUNT}, "amount_units"
+    return userStats, {"delegate": account}, "balance_units"
+
+
+def ledger_entry(account, amount_units, ref, entry_type):
+    return {
+        "account": account,
+        "ref": ref,
+        "type": entry_type,
+        "amount_units": Int64(amount_units),
+        "timestamp": datetime.utcnow(),
+        "applied": False,
+    }
+
+
+def snapshot_move(entry, field, update=None):
+    # The snapshot update applying entry, recording it in applied_entries.
+    # update is merged in, except $setOnInsert, which only apply_entries uses.
+    update = {
+        operator: fields
+        for operator, fields in (update or {}).items()
+        if operator != "$setOnInsert"
+    }
+    return {
+        "$inc": {field: entry["amount_units"]},
+        "$push": {
+            "applied_entries": {"$each": [entry["_id"]], "$slice": -APPLIED_WINDOW}
+        },
+        **update,
+    }
+
+
+def post_entries(entries):
+    # Returns the entries appended now and those that failed. Entries already
+    # in the ledger under the same (account, ref) are in neither: they were
+    # booked by an earlier run.
+    if not entries:
+        return [], []
+    try:
+        ledger.insert_many(entries, ordered=False)
+        return entries, []
+    except BulkWriteError as e:
+        skipped = set()
+        failed = []
+        for error in e.details["writeErrors"]:
+            skipped.add(error["index"])
+            if error["code"] != DUPLICATE_KEY:
+                failed.append(entries[error["index"]])
+        posted = [entry for i, entry in enumerate(entries) if i not in skipped]
+        return posted, failed
+
+
+def unapplied_entries(entries):
+    # The stored entries, booked by an earlier run, that match entries by
+    # (account, ref) and were never applied to their snapshot.
+    if not entries:
+        return []
+    keys = {(entry["account"], entry["ref"]) for entry in entries}
+    stored = ledger.find(
+        {
+            "applied": False,
+            "account": {"$in": list({account for account, _ in keys})},
+            "ref": {"$in": list({ref for _, ref in keys})},
+        }
+    )
+    return [entry for entry in stored if (entry["account"], entry["ref"]) in keys]
+
+
+def apply_entries(entries, update=None):
+    # Move the snapshot of every entry's account, grouped per snapshot
+    # collection, then clear the applied flag of the entries that moved.
+    # Snapshots are created first so the guarded moves need no upsert.
+    # Returns the entries left unapplied.
+    by_collection = {}
+    for entry in entries:
+        collection, query, field = snapshot_of(entry["account"])
+        by_collection.setdefault(collection.name, (collection, [], [], []))
+        _, creates, moves, pending = by_collection[collection.name]
+        creates.append(
+            UpdateOne(
+                query,
+                {
+                    "$setOnInsert": {
+                        field: Int64(0),
+                        **(update or {}).get("$setOnInsert", {}),
+                    }
+                },
+                upsert=True,
+            )
+        )
+        moves.append(
+            UpdateOne(
+                {**query, "applied_entries": {"$ne": entry["_id"]}},
+                snapshot_move(entry, field, update),
+            )
+        )
+        pending.append(entry)
+
+    unapplied = []
+    for collection, creates, moves, pending in by_collection.values():
+        applied = move_snapshots(collection, creates, moves, pending)
+        if applied:
+            ledger.update_many(
+                {"_id": {"$in": [entry["_id"] for entry in applied]}},
+                {"$unset": {"applied": ""}},
+            )
+        applied_ids = {entry["_id"] for entry in applied}
+        unapplied += [entry for entry in pending if entry["_id"] not in applied_ids]
+    return unapplied
+
+
+def move_snapshots(collection, creates, moves, pending):
+    # Returns the entries of pending whose snapshot has moved, now or before.
+    try:
+        collection.bulk_write(creates, ordered=False)
+    except BulkWriteError as e:
+        # Their moves match nothing and are sorted out below.
+        logging.error(f"Creating balance snapshots failed: {e}")
+    except PyMongoError as e:
+        logging.error(f"{len(pending)} balance snapshot updates failed: {e}")
+        return []
+
+    try:
+        matched = collection.bulk_write(moves, ordered=False).matched_count
+        failed = set()
+    except BulkWriteError as e:
+        matched = e.details["nMatched"]
+        failed = {error["index"] for error in e.details["writeErrors"]}
+        logging.error(f"{len(failed)} balance snapshot updates failed: {e}")
+    except PyMongoError as e:
+        # Whether the moves happened is unknown; settle_entries finds out.
+        logging.error(f"{len(pending)} balance snapshot updates failed: {e}")
+        return []
+
+    moved = [entry for i, entry in enumerate(pending) if i not in failed]
+    if matched == len(moved):
+        return moved
+    # A move matches nothing when its entry was applied before, or when the
+    # snapshot is missing; only the first shows the entry in applied_entries.
+    applied = []
+    for entry in moved:
+        _, query, _ = snapshot_of(entry["account"])
+        if collection.find_one({**query, "applied_entries": entry["_id"]}, {"_id": 1}):
+            applied.append(entry)
+    return applied
+
+
+def credit_accounts(entries, update=None):
+    # Append credit entries in one bulk write and apply them to their
+    # snapshots. Entries of the same (account, ref) left unapplied by an
+    # earlier run are applied as well. update is merged into each snapshot
+    # write, e.g. $setOnInsert defaults for new accounts. Returns the entries
+    # that could not be booked; entries booked but not yet applied are left
+    # to settle_entries and are not returned.
+    posted, failed = post_entries(entries)
+    booked = {id(entry) for entry in posted + failed}
+    earlier = unapplied_entries([entry for entry in entries if id(entry) not in booked])
+    unapplied = apply_entries(posted + earlier, update)
+    if unapplied:
+        logging.error(
+            f"{len(unapplied)} credits were booked but not applied, "
+            "settle_entries will apply them."
+        )
+    return failed
+
+
+def debit_account(account, amount_units, ref, entry_type, update=None):
+    # Append the debit, then take it off the snapshot only if the balance
+    # covers it, in one conditional update, so concurrent debits can never
+    # overdraw an account. Returns the snapshot after the debit, or None when
+    # the account is missing or the balance is too low.
+    collection, query, field = snapshot_of(account)
+    entry = ledger_entry(account, -amount_units, ref, entry_type)
+    ledger.insert_one(entry)
+    # A failed write raises with the entry left unapplied, and settle_entries
+    # undoes it.
+    snapshot = collection.find_one_and_update(
+        {
+            **query,
+            field: {"$gte": Int64(amount_units)},
+            "applied_entries": {"$ne": entry["_id"]},
+        },
+        snapshot_move(entry, field, update),
+        return_document=ReturnDocument.AFTER,
+    )
+    if snapshot is None:
+        ledger.delete_one({"_id": entry["_id"]})
+    else:
+        ledger.update_one({"_id": entry["_id"]}, {"$unset": {"applied": ""}})
+    return snapshot
+
+
+def settle_entries(batch_size=1000):
+    # Finish entries left unapplied for longer than SETTLE_AFTER. Credits are
+    # applied, which is a no-op for those whose snapshot already moved. A
+    # debit left unapplied means debit_account raised and its caller reported
+    # a failure, so its move, if it happened, is undone and it is removed.
+    try:
+        cutoff = ObjectId.from_datetime(datetime.utcnow() - SETTLE_AFTER)
+        settled = 0
+        credits = []
+        for entry in ledger.find({"applied": False, "_id": {"$lt": cutoff}}):
+            if entry["amount_units"] >= 0:
+                credits.append(entry)
+                if len(credits) == batch_size:
+                    settled += len(credits) - len(apply_entries(credits))
+                    credits = []
+                continue
+
+            collection, query, field = snapshot_of(entry["account"])
+            collection.update_one(
+                {**query, "applied_entries": entry["_id"]},
+                {
+                    "$inc": {field: Int64(-entry["amount_units"])},
+                    "$pull": {"applied_entries": entry["_id"]},
+                },
+            )
+            ledger.delete_one({"_id": entry["_id"]})
+            settled += 1
+        if credits:
+            settled += len(credits) - len(apply_entries(credits))
+        return True, settled
+    except PyMongoError as e:
+        logging.error(f"An error occurred in settle_entries: {e}")
+        return False, 0
+
+
+def account_history(account, limit=10, before=None):
+    # The account's applied entries, newest first, each with the balance
+    # right after it. The balance comes from the snapshot minus the entries
+    # newer than the page, so no history before the page is read.
+    query = {"account": account, **APPLIED}
+    if before is not None:
+        query["_id"] = {"$lt": before}
+    entries = list(ledger.find(query).sort("_id", -1).limit(limit))
+    if not entries:
+        return entries
+
+    collection, snapshot_query, field = snapshot_of(account)
+    snapshot = collection.find_one(snapshot_query, {field: 1}) or {}
+    newer = list(
+        ledger.aggregate(
+            [
+                {
+                    "$match": {
+                        "account": account,
+                        "_id": {"$gt": entries[0]["_id"]},
+                        **APPLIED,
+                    }
+                },
+                {"$group": {"_id": None, "total": {"$sum": "$amount_units"}}},
+            ]
+        )
+    )
+    balance = snapshot.get(field, 0) - (newer[0]["total"] if newer else 0)
+    for entry in entries:
+        entry["balance_units"] = Int64(balance)
+        balance -= entry["amount_units"]
+    return entries
+
+
+def open_ledger(batch_size=1000):
+    # Book the balance of every account that has one but no ledger entries yet
+    # as an "opening" entry, so balances from before the ledger add up too.
+    # Accounts created since always get an entry before their snapshot moves,
+    # so running it again books nothing.
+    try:
+        opened = 0
+        balances = {}
+        for user in userStats.find(
+            {"balance_units": {"$ne": 0}, "delegate": {"$exists": True}},
+            {"delegate": 1, "balance_units": 1},
+        ):
+            balances[user["delegate"]] = user["balance_units"]
+            if len(balances) == batch_size:
+                opened += open_accounts(balances)
+                balances = {}
+        owner = entityOwners.find_one({"_id": OWNER_ACCOUNT}, {"amount_units": 1})
+        if owner and owner.get("amount_units"):
+            balances[OWNER_ACCOUNT] = owner["amount_units"]
+        if balances:
+            opened += open_accounts(balances)
+        return True, opened
+    except PyMongoError as e:
+        logging.error(f"An error occurred in open_ledger: {e}")
+        return False, 0
+
+
+def open_accounts(balances):
+    # Opening entries describe balances the snapshots already hold.
+    booked = set(ledger.distinct("account", {"account": {"$in": list(balances)}}))
+    entries = []
+    for account, balance in balances.items():
+        if account not in booked:
+            entry = ledger_entry(account, balance, "opening", "opening")
+            del entry["applied"]
+            entries.append(entry)
+    posted, _ = post_entries(entries)
+    return len(posted)
+
+
+def verify_balances():
+    # Accounts whose snapshot differs from the sum of their applied ledger
+    # entries, as {account: (snapshot, ledger sum)}.
+    mismatched = {}
+    for total in ledger.aggregate(
+        [
+            {"$match": APPLIED},
+            {"$group": {"_id": "$account", "total": {"$sum": "$amount_units"}}},
+        ],
+        allowDiskUse=True,
+    ):
+        collection, query, field = snapshot_of(total["_id"])
+        snapshot = collection.find_one(query, {field: 1}) or {}
+        if snapshot.get(field, 0) != total["total"]:
+            mismatched[total["_id"]] = (snapshot.get(field, 0), total["total"])
+    return mismatched
+
+
+def audit_ledger():
+    # Run at startup: settle what an earlier run left unapplied, then log
+    # every account whose snapshot still disagrees with its ledger.
+    settle_entries()
+    try:
+        mismatched = verify_balances()
+    except PyMongoError as e:
+        logging.error(f"An error occurred in audit_ledger: {e}")
+        return False, {}
+    for account, (snapshot, total) in mismatched.items():
+        logging.error(
+            f"Balance of {account} is {snapshot} units, its ledger sums to {total}."
+        )
+    return True, mismatched
+
+
+if __name__ == "__main__":
+    print(verify_balances())
@@ -2,9 +2,7 @@ import logging
 import json
 from datetime import datetime
 from reward_logic.reward_log import store_in_db, retrieve_from_db
-from reward_logic.percentage import round_up_decimal_new
-from database.mongodb import entityOwners
-from decimal import Decimal
+from reward_logic.ledger import OWNER_ACCOUNT, ledger_entry, credit_accounts
 from utils.layout import base
 
 logging.basicConfig(
@@ -12,34 +10,29 @@ logging.basicConfig(
 )
 
 
-def update_entityOwners_reward(amount):
-    amount = Decimal(amount)
+def update_entityOwners_reward(amount, block_range):
+    # amount is in base units, booked as a ledger credit to the validator owner.
     try:
-        entry = entityOwners.find_one({"_id": "entityOwners"})
-
-        if entry:
-            current_amount = Decimal(str(entry.get("amount", "0.0")))
-            wallet_address = entry.get(
-                "wallet_address", base["VALIDATOR_WALLETS"]["VAL_REWARD_ADDRESS"]
-            )
-        else:
-            current_amount = Decimal("0.0")
-            wallet_address = base["VALIDATOR_WALLETS"]["VAL_REWARD_ADDRESS"]
-
-        new_amount = round_up_decimal_new(current_amount + amount)
-        current_time_utc = datetime.utcnow().isoformat()
-
-        entityOwners.update_one(
-            {"_id": "entityOwners"},
+        failed = credit_accounts(
+            [
+                ledger_entry(
+                    OWNER_ACCOUNT,
+                    amount,
+                    f"validator_{block_range}",
+                    "validator_reward",
+                )
+            ],
             {
-                "$set": {
-                    "amount": float(new_amount),
-                    "last_processed": current_time_utc,
-                    "wallet_address": wallet_address,
-                }
+                "$set": {"last_processed": datetime.utcnow().isoformat()},
+                "$setOnInsert": {
+                    "wallet_address": base["VALIDATOR_WALLETS"]["VAL_REWARD_ADDRESS"]
+                },
             },
-            upsert=True,
         )
+        if failed:
+            logging.error(
+                f"Validator reward for blocks {block_range} was not credited."
+            )
 
     except Exception as e:
         logging.error(f"update_val_reward An unexpected error occurred: {e}")